@@ -1,14 +1,24 @@
 from typing import Optional
 
-from fastapi import FastAPI, APIRouter, HTTPException, Body, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
+from db import engine
 from db.models import BpmnProcess, BpmnProcessInstance
 from db.repos import RepoManager, get_repo_manager
-from bpmn import BpmnRunner, get_bpmn_runner
+from bpmn import (BpmnRunner, ConcurrentUpdateError, JobWorker, get_bpmn_runner, get_engine_executor,
+                  get_instance_archiver, get_job_worker, get_process_warmer, get_timer_scheduler)
+from config import settings
 from routers import bpmn_process_router
 from routers import bpmn_process_instance_router
-from schemas import BpmnProcessInstanceSchema
+from routers import job_router
+from routers import metrics_router
+from routers import transfer_router
+from routers.metrics_router import MetricsMiddleware
+from profiling import ProfilingMiddleware
+from schemas import BpmnProcessInstanceSchema, JobSchema
 
 app = FastAPI()
 
@@ -19,9 +29,69 @@ app.add_middleware(
     allow_headers=['*'],
     allow_credentials=True,
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 app.include_router(bpmn_process_router)
 app.include_router(bpmn_process_instance_router)
+app.include_router(job_router)
+app.include_router(metrics_router)
+app.include_router(transfer_router)
+
+
+@app.on_event('startup')
+async def start_process_warmup():
+    await get_process_warmer().start()
+
+
+@app.on_event('startup')
+async def start_job_worker():
+    await get_job_worker().start()
+
+
+@app.on_event('startup')
+async def start_timer_scheduler():
+    await get_timer_scheduler().start()
+
+
+@app.on_event('startup')
+async def start_instance_archiver():
+    await get_instance_archiver().start()
+
+
+@app.on_event('shutdown')
+async def stop_process_warmup():
+    await get_process_warmer().stop()
+
+
+@app.on_event('shutdown')
+async def stop_job_worker():
+    await get_job_worker().stop()
+
+
+@app.on_event('shutdown')
+async def stop_timer_scheduler():
+    await get_timer_scheduler().stop()
+
+
+@app.on_event('shutdown')
+async def stop_instance_archiver():
+    await get_instance_archiver().stop()
+
+
+@app.on_event('shutdown')
+def shutdown_engine_executor():
+    get_engine_executor().shutdown()
+
+
+@app.on_event('shutdown')
+async def dispose_database_engine():
+    await engine.dispose()
+
+
+@app.exception_handler(ConcurrentUpdateError)
+async def concurrent_update_handler(request: Request, exc: ConcurrentUpdateError):
+    return JSONResponse(status_code=409, content={'detail': str(exc)})
 
 
 @app.get('/', tags=['Root'])
@@ -29,32 +99,56 @@ async def root():
     return {'message': 'Welcome to FastAPI'}
 
 
+@app.get('/ready', tags=['Root'])
+async def ready():
+    """Readiness probe: 503 until the process definitions are warmed up after startup"""
+    status = get_process_warmer().status()
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
+
 test = APIRouter(prefix='/test', tags=['Test'])
 
 
-@test.post('/create_process_instance/{id}', response_model=BpmnProcessInstanceSchema)
+def accepted(job) -> JSONResponse:
+    """202 response for a job queued in the background, pointing at its status"""
+    return JSONResponse(status_code=202, content=jsonable_encoder(JobSchema.from_orm(job)),
+                        headers={'Location': f'/jobs/{job.id}'})
+
+
+@test.post('/create_process_instance/{id}', response_model=BpmnProcessInstanceSchema,
+           responses={202: {'model': JobSchema}})
 async def create_process_instance(
         id: int,
+        background: bool = settings.background_execution,
         bpmn_runner: BpmnRunner = Depends(get_bpmn_runner),
-        repo_manager: RepoManager = Depends(get_repo_manager)
+        repo_manager: RepoManager = Depends(get_repo_manager),
+        job_worker: JobWorker = Depends(get_job_worker)
 ):
-    process = await repo_manager.get_repo(BpmnProcess).get(id)
+    process = await repo_manager.get_repo(BpmnProcess).get(id, summary=background)
     if process is None:
         raise HTTPException(404, f'Process with id {id} not found')
+    if background:
+        return accepted(await job_worker.submit(repo_manager, 'create', process.id))
     return await bpmn_runner.create_process_instance(process)
 
 
-@test.post('/run_process_instance/{id}', response_model=BpmnProcessInstanceSchema)
+@test.post('/run_process_instance/{id}', response_model=BpmnProcessInstanceSchema,
+           responses={202: {'model': JobSchema}})
 async def run_process_instance(
         id: Optional[int] = None,
         data: Optional[dict] = Body(None),
+        background: bool = settings.background_execution,
         bpmn_runner: BpmnRunner = Depends(get_bpmn_runner),
-        repo_manager: RepoManager = Depends(get_repo_manager)
+        repo_manager: RepoManager = Depends(get_repo_manager),
+        job_worker: JobWorker = Depends(get_job_worker)
 ):
-    process_instance = await repo_manager.get_repo(BpmnProcessInstance).get(id)
+    process_instance = await repo_manager.get_repo(BpmnProcessInstance).get(id, summary=background)
     if process_instance is None:
         raise HTTPException(
             404, f'Process instance with id {id} not found')
+    if background:
+        return accepted(await job_worker.submit(
+            repo_manager, 'run', process_instance.bpmn_process_id, process_instance.id, data))
     return await bpmn_runner.run(process_instance, data)
 
 app.include_router(test)
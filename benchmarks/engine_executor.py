@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+引擎执行方式基准测试
+在进程内通过 ASGI 并发创建带 CPU 密集脚本任务的流程实例，
+同时探测一个轻量接口的延迟，比较 inline / thread / process 三种执行方式
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bpmn.executor import ENGINE_EXECUTOR_MODES
+
+SLOW_SCRIPT_PROCESS = '''<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:camunda="http://camunda.org/schema/1.0/bpmn">
+  <bpmn:process id="slow_script_process" name="慢脚本流程" isExecutable="true">
+    <bpmn:startEvent id="StartEvent_1">
+      <bpmn:outgoing>Flow_1</bpmn:outgoing>
+    </bpmn:startEvent>
+    <bpmn:scriptTask id="Task_Busy" name="计算">
+      <bpmn:incoming>Flow_1</bpmn:incoming>
+      <bpmn:outgoing>Flow_2</bpmn:outgoing>
+      <bpmn:script>total = sum(i * i for i in range({iterations}))</bpmn:script>
+    </bpmn:scriptTask>
+    <bpmn:userTask id="Task_Review" name="复核" camunda:formKey="review">
+      <bpmn:extensionElements>
+        <camunda:formData>
+          <camunda:formField id="ok" label="通过" type="boolean" />
+        </camunda:formData>
+      </bpmn:extensionElements>
+      <bpmn:incoming>Flow_2</bpmn:incoming>
+      <bpmn:outgoing>Flow_3</bpmn:outgoing>
+    </bpmn:userTask>
+    <bpmn:endEvent id="EndEvent_1">
+      <bpmn:incoming>Flow_3</bpmn:incoming>
+    </bpmn:endEvent>
+    <bpmn:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="Task_Busy" />
+    <bpmn:sequenceFlow id="Flow_2" sourceRef="Task_Busy" targetRef="Task_Review" />
+    <bpmn:sequenceFlow id="Flow_3" sourceRef="Task_Review" targetRef="EndEvent_1" />
+  </bpmn:process>
+</bpmn:definitions>'''
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def run_load(clients: int, requests: int, iterations: int) -> dict:
+    """在当前进程内压测，执行方式由 DUCKY_ENGINE_EXECUTOR 决定"""
+    import httpx
+    from loguru import logger
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    import db
+    from app import app
+    from db.models import Base
+
+    logger.remove()
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+    engine = create_async_engine(f'sqlite+aiosqlite:///{db_file}', future=True)
+    db.AsyncSessionLocal.configure(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    create_latencies, probe_latencies = [], []
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        r = await client.post('/bpmn_processes', json={
+            'id': 1, 'name': 'slow', 'xml_definition': SLOW_SCRIPT_PROCESS.replace('{iterations}', str(iterations))})
+        r.raise_for_status()
+        # 预热：解析 spec、启动执行器
+        (await client.post('/test/create_process_instance/1')).raise_for_status()
+
+        async def worker():
+            for _ in range(requests):
+                start = time.perf_counter()
+                (await client.post('/test/create_process_instance/1')).raise_for_status()
+                create_latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            # 从计划发送时间开始计时，这样事件循环被阻塞的时间也计入延迟
+            scheduled = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                await client.get('/')
+                now = time.perf_counter()
+                probe_latencies.append(now - scheduled)
+                scheduled = max(scheduled + 0.005, now)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    await engine.dispose()
+    os.unlink(db_file)
+    return {
+        'throughput': clients * requests / elapsed,
+        'create_p50_ms': percentile(create_latencies, 0.5) * 1000,
+        'create_p95_ms': percentile(create_latencies, 0.95) * 1000,
+        'probe_p50_ms': percentile(probe_latencies, 0.5) * 1000,
+        'probe_p99_ms': percentile(probe_latencies, 0.99) * 1000,
+    }
+
+
+def main(args):
+    if args.mode:
+        result = asyncio.run(run_load(args.clients, args.requests, args.iterations))
+        print(json.dumps(result))
+        return
+    # 每种执行方式在独立进程中运行，因为配置在导入时读取
+    print(f"{'executor':<10}{'req/s':>8}{'create p50':>12}{'create p95':>12}{'GET / p50':>11}{'GET / p99':>11}")
+    for mode in ENGINE_EXECUTOR_MODES:
+        env = dict(os.environ, DUCKY_ENGINE_EXECUTOR=mode, DUCKY_ENGINE_WORKERS=str(args.workers))
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--clients', str(args.clients),
+             '--requests', str(args.requests), '--iterations', str(args.iterations)],
+            env=env, check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{r['throughput']:>8.1f}{r['create_p50_ms']:>10.1f}ms{r['create_p95_ms']:>10.1f}ms"
+              f"{r['probe_p50_ms']:>9.1f}ms{r['probe_p99_ms']:>9.1f}ms")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--mode', choices=ENGINE_EXECUTOR_MODES, help='只在当前进程中运行指定方式')
+    arg_parser.add_argument('--clients', type=int, default=8, help='并发客户端数')
+    arg_parser.add_argument('--requests', type=int, default=10, help='每个客户端的请求数')
+    arg_parser.add_argument('--iterations', type=int, default=300000, help='脚本任务的循环次数')
+    arg_parser.add_argument('--workers', type=int, default=4, help='线程/进程池大小')
+    main(arg_parser.parse_args())
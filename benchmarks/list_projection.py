@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+列表投影基准测试
+在临时数据库中写入大量实例，比较列表查询加载完整行和只加载摘要列时的耗时、读取字节数和内存峰值
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from benchmarks.state_codec import sample_states
+from bpmn.state_codec import encode_state, get_state_codec
+from db.models import Base, BpmnProcess, BpmnProcessInstance
+from db.repos import RepoManager
+from scripts.init_sample_processes import SAMPLE_PROCESSES
+
+
+async def fill(session: AsyncSession, instances: int, codec_name: str, include_spec: bool) -> None:
+    states = [state for _, spec, state in sample_states() if spec == include_spec]
+    codec = get_state_codec(codec_name)
+    blobs = [encode_state(state, codec) for state in states]
+    for index, process in enumerate(SAMPLE_PROCESSES, start=1):
+        session.add(BpmnProcess(id=index, name=process['name'], xml_definition=process['xml']))
+    await session.flush()
+    for start in range(0, instances, 5000):
+        session.add_all(BpmnProcessInstance(
+            bpmn_process_id=i % len(SAMPLE_PROCESSES) + 1, state=blobs[i % len(blobs)], current_task='审批')
+            for i in range(start, min(instances, start + 5000)))
+        await session.flush()
+    await session.commit()
+
+
+def row_bytes(rows) -> int:
+    """已加载到 ORM 对象中的列数据量"""
+    total = 0
+    for row in rows:
+        for value in row.__dict__.values():
+            if isinstance(value, (bytes, str)):
+                total += len(value)
+    return total
+
+
+async def list_all(engine, limit: int, summary: bool, trace: bool = False):
+    """按页遍历全部实例，返回（页数，加载的字节数，内存峰值，耗时）"""
+    pages, loaded = 0, 0
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    cursor = None
+    while True:
+        # 每页使用新会话，和接口的请求级会话一致
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            repo = RepoManager(session=session).get_repo(BpmnProcessInstance)
+            rows, cursor = await repo.page(after=cursor, limit=limit, summary=summary)
+            pages += 1
+            loaded += row_bytes(rows)
+        if cursor is None:
+            break
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return pages, loaded, peak, elapsed
+
+
+async def main(args):
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+    engine = create_async_engine(f'sqlite+aiosqlite:///{db_file}', future=True)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            await fill(session, args.instances, args.codec, args.include_spec)
+        print(f'{args.instances} instances, codec={args.codec}, include_spec={args.include_spec}, '
+              f'db size {os.path.getsize(db_file) / 2 ** 20:.1f} MiB')
+        print(f"{'columns':<10}{'pages':>7}{'loaded MiB':>12}{'peak MiB':>10}{'total s':>9}{'ms/page':>9}")
+        for summary in (False, True):
+            # 先跑一遍预热 SQLite 页缓存，tracemalloc 会拖慢执行，内存和耗时分开测量
+            await list_all(engine, args.limit, summary)
+            peak = (await list_all(engine, args.limit, summary, trace=True))[2]
+            pages, loaded, _, elapsed = await list_all(engine, args.limit, summary)
+            print(f"{'summary' if summary else 'full':<10}{pages:>7}{loaded / 2 ** 20:>12.1f}{peak / 2 ** 20:>10.1f}"
+                  f"{elapsed:>9.2f}{elapsed / pages * 1000:>9.1f}")
+    finally:
+        await engine.dispose()
+        os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--instances', type=int, default=50000, help='实例数量')
+    arg_parser.add_argument('--limit', type=int, default=1000, help='每页条数')
+    arg_parser.add_argument('--codec', default='zlib', help='state 的编码方式')
+    arg_parser.add_argument('--include-spec', action='store_true', help='模拟内嵌 spec 的旧格式状态')
+    asyncio.run(main(arg_parser.parse_args()))
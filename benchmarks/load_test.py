@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+并发负载测试
+在进程内通过 ASGI 驱动应用，不需要启动服务：N 个虚拟用户并发地创建流程实例，
+按各用户任务的 camunda:formField 生成表单数据，逐步推进到结束，
+报告吞吐量、各接口的 p50/p95/p99 延迟以及 SQLite 锁错误，用于确定 worker 数量和验证并发相关的改动；
+--redefine 时定期修改一个流程的定义，随后并发创建该流程的实例，检查新版本定义第一次被并发使用时不出错
+
+默认使用临时数据库和示例流程；--database 指定已有数据库时使用其中保存的流程（会写入新的实例，请使用副本）
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NAMESPACES = {
+    'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
+    'camunda': 'http://camunda.org/schema/1.0/bpmn',
+}
+CREATE = 'POST /test/create_process_instance/{id}'
+RUN = 'POST /test/run_process_instance/{id}'
+REDEFINE = 'PUT /bpmn_processes/{id}'
+REVISION = re.compile(r'\s*<!-- load test revision \d+ -->$')
+# 单个实例最多推进的步数，防止带循环的流程一直走下去
+MAX_STEPS = 50
+
+
+def form_fields(xml_definition: str) -> Dict[str, List[dict]]:
+    """用户任务的表单字段，按任务名称和 id 索引（实例接口返回的 current_task 是任务名称，没有名称时是 id）"""
+    root = etree.fromstring(xml_definition.encode('utf-8'))
+    tasks = {}
+    for task in root.iterfind('.//bpmn:userTask', NAMESPACES):
+        fields = [{
+            'id': field.get('id'),
+            'type': field.get('type', 'string'),
+            'default': field.get('defaultValue'),
+            'values': [value.get('id') for value in field.iterfind('camunda:value', NAMESPACES)],
+        } for field in task.iterfind('.//camunda:formField', NAMESPACES)]
+        tasks[task.get('id')] = fields
+        if task.get('name'):
+            tasks.setdefault(task.get('name'), fields)
+    return tasks
+
+
+def form_data(fields: List[dict], rng: random.Random) -> dict:
+    data = {}
+    for field in fields:
+        if field['type'] == 'boolean':
+            value = rng.random() < 0.5
+        elif field['type'] == 'long':
+            value = rng.randint(1, 100000)
+        elif field['type'] == 'enum' and field['values']:
+            value = rng.choice(field['values'])
+        elif field['type'] == 'date':
+            value = date.today().isoformat()
+        elif field['default'] is not None:
+            value = field['default']
+        else:
+            # 示例流程的脚本常用 int()/float() 转换字符串字段，用数字字符串两种用法都能通过
+            value = str(rng.randint(1, 100000))
+        data[field['id']] = value
+    return data
+
+
+def is_lock_error(exc: BaseException) -> bool:
+    while exc is not None:
+        if 'database is locked' in str(exc) or 'database table is locked' in str(exc):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] if ordered else 0.0
+
+
+class LoadStats:
+    """Latencies and outcomes of the requests sent by all virtual users"""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.lock_errors: Counter = Counter()
+        self.exceptions: Counter = Counter()
+        self.instances_created = 0
+        self.instances_completed = 0
+        self.instance_errors = 0
+        self.steps = 0
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'throughput': round(len(samples) / elapsed, 2),
+                'p50': round(percentile(samples, .50) * 1000, 2),
+                'p95': round(percentile(samples, .95) * 1000, 2),
+                'p99': round(percentile(samples, .99) * 1000, 2),
+                'statuses': dict(self.statuses[endpoint]),
+            }
+        requests = sum(len(samples) for samples in self.latencies.values())
+        return {
+            'elapsed': round(elapsed, 2),
+            'requests': requests,
+            'requests_per_second': round(requests / elapsed, 2),
+            'instances_created': self.instances_created,
+            'instances_completed': self.instances_completed,
+            'instances_per_second': round(self.instances_completed / elapsed, 2),
+            'steps': self.steps,
+            'instance_errors': self.instance_errors,
+            'lock_errors': dict(self.lock_errors),
+            'exceptions': dict(self.exceptions),
+            'endpoints': endpoints,
+        }
+
+
+async def request(client, stats: LoadStats, endpoint: str, url: str, json_body=None,
+                  method: str = 'POST') -> Optional[dict]:
+    """发送一个请求并记录延迟，请求失败时返回 None"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, json=json_body)
+    except Exception as e:
+        # 应用中未处理的异常（例如 database is locked）会由 ASGI 传输层直接抛出
+        stats.latencies[endpoint].append(time.perf_counter() - start)
+        stats.statuses[endpoint][500] += 1
+        if is_lock_error(e):
+            stats.lock_errors[endpoint] += 1
+        else:
+            stats.exceptions[type(e).__name__] += 1
+        return None
+    stats.latencies[endpoint].append(time.perf_counter() - start)
+    stats.statuses[endpoint][response.status_code] += 1
+    if response.status_code != 200:
+        if is_lock_error(Exception(response.text)):
+            stats.lock_errors[endpoint] += 1
+        return None
+    return response.json()
+
+
+async def virtual_user(client, stats: LoadStats, processes: Dict[int, dict], deadline: float,
+                       iterations: Optional[int], think_time: float, rng: random.Random) -> None:
+    """反复挑选一个流程，创建实例并推进到结束"""
+    done = 0
+    while time.perf_counter() < deadline and (iterations is None or done < iterations):
+        done += 1
+        process_id = rng.choice(list(processes))
+        # 负载测试测量同步执行的延迟，不使用后台任务
+        instance = await request(client, stats, CREATE, f'/test/create_process_instance/{process_id}?background=false')
+        if instance is None:
+            continue
+        stats.instances_created += 1
+        for _ in range(MAX_STEPS):
+            if instance.get('error'):
+                stats.instance_errors += 1
+                break
+            if instance['current_task'] == 'END':
+                stats.instances_completed += 1
+                break
+            fields = processes[process_id].get(instance['current_task'])
+            if fields is None or time.perf_counter() >= deadline:
+                break
+            if think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * think_time))
+            instance = await request(client, stats, RUN, f"/test/run_process_instance/{instance['id']}?background=false",
+                                     form_data(fields, rng))
+            if instance is None:
+                break
+            stats.steps += 1
+
+
+async def redefiner(client, stats: LoadStats, processes: Dict[int, dict], deadline: float, interval: float,
+                    burst: int, rng: random.Random) -> None:
+    """定期修改一个流程的定义（只改动末尾的注释），然后并发创建该流程的实例，新版本的定义在这些请求中第一次被保存"""
+    revision = 0
+    while time.perf_counter() + interval < deadline:
+        await asyncio.sleep(interval)
+        revision += 1
+        process_id = rng.choice(list(processes))
+        r = await client.get(f'/bpmn_processes/{process_id}')
+        r.raise_for_status()
+        process = r.json()
+        xml_definition = REVISION.sub('', process['xml_definition']) + f'\n<!-- load test revision {revision} -->'
+        if await request(client, stats, REDEFINE, f'/bpmn_processes/{process_id}', {
+                'id': process_id, 'name': process['name'], 'xml_definition': xml_definition}, method='PUT') is None:
+            continue
+        await asyncio.gather(*[
+            request(client, stats, CREATE, f'/test/create_process_instance/{process_id}?background=false')
+            for _ in range(burst)])
+
+
+async def seed_samples(client) -> None:
+    from benchmarks.suite import with_form_keys
+    from scripts.init_sample_processes import SAMPLE_PROCESSES
+
+    for i, process in enumerate(SAMPLE_PROCESSES, start=1):
+        r = await client.post('/bpmn_processes', json={
+            'id': i, 'name': process['name'], 'xml_definition': with_form_keys(process['xml'])})
+        r.raise_for_status()
+
+
+async def load_processes(client, process_ids: Optional[List[int]]) -> Dict[int, dict]:
+    if not process_ids:
+        r = await client.get('/bpmn_processes', params={'limit': 1000})
+        r.raise_for_status()
+        process_ids = [process['id'] for process in r.json()]
+    processes = {}
+    for process_id in process_ids:
+        r = await client.get(f'/bpmn_processes/{process_id}')
+        r.raise_for_status()
+        processes[process_id] = form_fields(r.json()['xml_definition'])
+    return processes
+
+
+async def run_load(args) -> dict:
+    import httpx
+    from loguru import logger
+
+    import db
+    from app import app
+    from db.models import Base
+
+    logger.remove()
+    # SpiffWorkflow 通过 logging 输出脚本错误等信息
+    logging.disable(logging.CRITICAL)
+    db_file = None
+    if args.database:
+        engine = db.create_engine(args.database)
+    else:
+        db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+        engine = db.create_engine(f'sqlite+aiosqlite:///{db_file}')
+    db.AsyncSessionLocal.configure(bind=engine)
+    try:
+        if db_file:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+        # ASGI 传输不会触发 startup / shutdown 事件，手动执行，让后台任务和部署时一样运行
+        await app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://load', timeout=None) as client:
+                if db_file:
+                    await seed_samples(client)
+                processes = await load_processes(client, args.process)
+                if not processes:
+                    raise SystemExit('没有可用的流程')
+                # 预热：解析各流程的 spec，不计入结果
+                for process_id in processes:
+                    await client.post(f'/test/create_process_instance/{process_id}?background=false')
+
+                stats = LoadStats()
+                rng = random.Random(args.seed)
+                start = time.perf_counter()
+                deadline = start + args.duration
+                users = [
+                    virtual_user(client, stats, processes, deadline, args.iterations, args.think_time,
+                                 random.Random(rng.random()))
+                    for _ in range(args.users)]
+                if args.redefine:
+                    users.append(redefiner(client, stats, processes, deadline, args.redefine, args.users,
+                                           random.Random(rng.random())))
+                await asyncio.gather(*users)
+                elapsed = time.perf_counter() - start
+        finally:
+            await app.router.shutdown()
+    finally:
+        await engine.dispose()
+        if db_file:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_file + suffix):
+                    os.unlink(db_file + suffix)
+    return {'users': args.users, 'processes': sorted(processes), **stats.summary(elapsed)}
+
+
+def print_report(result: dict) -> None:
+    print(f"{result['users']} 个虚拟用户，{result['elapsed']}s，流程 {result['processes']}")
+    print(f"请求 {result['requests']}（{result['requests_per_second']}/s），"
+          f"创建实例 {result['instances_created']}，完成 {result['instances_completed']}"
+          f"（{result['instances_per_second']}/s），推进 {result['steps']} 步，实例出错 {result['instance_errors']}")
+    print(f"\n{'endpoint':<42}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for endpoint, row in result['endpoints'].items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(row['statuses'].items()))
+        print(f"{endpoint:<42}{row['requests']:>9}{row['throughput']:>9.1f}{row['p50']:>9.1f}"
+              f"{row['p95']:>9.1f}{row['p99']:>9.1f}  {statuses}")
+    lock_errors = sum(result['lock_errors'].values())
+    print(f'\nSQLite 锁错误：{lock_errors}' + (f"  {result['lock_errors']}" if lock_errors else ''))
+    if result['exceptions']:
+        print(f"其他异常：{result['exceptions']}")
+
+
+def main(args) -> int:
+    # 丢弃 SpiffWorkflow 和示例脚本中的 print
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(run_load(args))
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    # 锁错误和接口中未处理的异常都视为失败
+    return 1 if result['lock_errors'] or result['exceptions'] else 0
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--users', type=int, default=10, help='并发的虚拟用户数')
+    arg_parser.add_argument('--duration', type=float, default=30, help='运行秒数')
+    arg_parser.add_argument('--iterations', type=int, help='每个虚拟用户最多完成的实例数，达到后提前结束')
+    arg_parser.add_argument('--think-time', type=float, default=0,
+                            help='推进每一步前的平均等待秒数，模拟用户填写表单')
+    arg_parser.add_argument('--database', help='数据库地址，默认使用带示例流程的临时数据库')
+    arg_parser.add_argument('--process', type=int, action='append', help='只使用指定的流程，可以重复')
+    arg_parser.add_argument('--redefine', type=float, default=0,
+                            help='每隔多少秒修改一个流程的定义并并发创建实例（--users 个），为 0 时不修改')
+    arg_parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    arg_parser.add_argument('--output', help='把结果写入 JSON 文件')
+    sys.exit(main(arg_parser.parse_args()))
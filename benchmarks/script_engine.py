@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+脚本引擎基准测试
+生成一个由多级排他网关组成、每个分支都带条件表达式和脚本任务的流程，
+在不访问数据库的情况下反复创建并执行实例，比较 SpiffWorkflow 默认脚本引擎
+（每次执行都重新解析和编译）与预编译缓存的 CachedScriptEngine 的吞吐量
+"""
+import argparse
+import os
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def gateway_process(stages: int, branches: int) -> str:
+    """stages 级排他网关，每级 branches 个带条件的分支，分支中的脚本任务累加 total 后汇合"""
+    elements = ['<bpmn:startEvent id="StartEvent_1" />',
+                '<bpmn:scriptTask id="Init"><bpmn:script>total = 0\nseed = 7</bpmn:script></bpmn:scriptTask>',
+                '<bpmn:endEvent id="EndEvent_1" />']
+    flows = [('StartEvent_1', 'Init', None)]
+    previous = 'Init'
+    for stage in range(1, stages + 1):
+        split, join = f'Split_{stage}', f'Join_{stage}'
+        elements += [f'<bpmn:exclusiveGateway id="{split}" />', f'<bpmn:exclusiveGateway id="{join}" />']
+        flows.append((previous, split, None))
+        for branch in range(branches):
+            task = f'Task_{stage}_{branch}'
+            elements.append(
+                f'<bpmn:scriptTask id="{task}"><bpmn:script>'
+                f'total = total + {branch}\nseed = (seed * 31 + {stage}) % 1009'
+                f'</bpmn:script></bpmn:scriptTask>')
+            flows += [(split, task, f'(seed + {stage}) % {branches} == {branch} and total &gt;= 0'),
+                      (task, join, None)]
+        previous = join
+    flows.append((previous, 'EndEvent_1', None))
+    for i, (source, target, condition) in enumerate(flows, start=1):
+        if condition is None:
+            elements.append(f'<bpmn:sequenceFlow id="Flow_{i}" sourceRef="{source}" targetRef="{target}" />')
+        else:
+            elements.append(
+                f'<bpmn:sequenceFlow id="Flow_{i}" sourceRef="{source}" targetRef="{target}">'
+                f'<bpmn:conditionExpression xsi:type="bpmn:tFormalExpression">{condition}'
+                f'</bpmn:conditionExpression></bpmn:sequenceFlow>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+            '<bpmn:process id="gateway_process" name="条件网关流程" isExecutable="true">\n'
+            + '\n'.join(elements) + '\n</bpmn:process>\n</bpmn:definitions>')
+
+
+def run_instances(wf_spec, number: int, engine_factory) -> float:
+    """执行 number 个实例到结束，返回每秒完成的实例数"""
+    from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+
+    start = time.perf_counter()
+    for _ in range(number):
+        workflow = BpmnWorkflow(wf_spec, script_engine=engine_factory())
+        workflow.do_engine_steps()
+        assert workflow.is_completed()
+    return number / (time.perf_counter() - start)
+
+
+def main(args):
+    from SpiffWorkflow.bpmn.BpmnScriptEngine import BpmnScriptEngine
+
+    from bpmn.script_engine import CachedScriptEngine, ScriptCache
+    from bpmn.spec_cache import parse_spec
+
+    wf_spec = parse_spec(gateway_process(args.stages, args.branches))
+    expressions = args.stages * args.branches * 2
+    print(f'{args.stages} gateways x {args.branches} branches, {expressions} scripts and conditions per spec')
+
+    cache = ScriptCache(maxsize=args.cache_size)
+    engines = [('default', BpmnScriptEngine), ('cached', lambda: CachedScriptEngine(cache=cache))]
+    print(f"{'engine':<10}{'instances/s':>14}")
+    for name, factory in engines:
+        # 预热一次，缓存引擎的编译结果在各实例间复用
+        run_instances(wf_spec, 1, factory)
+        rate = run_instances(wf_spec, args.number, factory)
+        print(f'{name:<10}{rate:>14.1f}')
+    print(f'cache: {cache.stats()}')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--stages', type=int, default=10, help='排他网关的级数')
+    arg_parser.add_argument('--branches', type=int, default=10, help='每级网关的分支数')
+    arg_parser.add_argument('--number', type=int, default=100, help='每种引擎执行的实例数')
+    arg_parser.add_argument('--cache-size', type=int, default=1024, help='脚本缓存的条目数')
+    main(arg_parser.parse_args())
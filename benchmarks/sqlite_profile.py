@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+数据库连接配置基准测试
+在临时 SQLite 数据库上通过 ASGI 并发创建并推进流程实例，
+比较默认设置（回滚日志、每个会话新建连接）与 performance 配置（WAL 等 pragma）和连接池的吞吐量
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.init_sample_processes import SAMPLE_PROCESSES
+
+# （名称，sqlite_profile，连接池大小），第一行相当于原来的硬编码配置
+CONFIGS = [
+    ('default', 'default', 0),
+    ('performance', 'performance', 0),
+    ('performance+pool', 'performance', 5),
+]
+
+
+async def run_config(client, db, profile: str, pool_size: int, clients: int, requests: int) -> tuple:
+    """返回（创建/秒，推进/秒）"""
+    from db.models import Base
+
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+    engine = db.create_engine(f'sqlite+aiosqlite:///{db_file}', echo=False, pool_size=pool_size,
+                              sqlite_profile=profile)
+    db.AsyncSessionLocal.configure(bind=engine)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        # 用户任务流程：创建后停在用户任务，推进一次即结束
+        process = SAMPLE_PROCESSES[1]
+        r = await client.post('/bpmn_processes', json={'id': 1, 'name': process['name'], 'xml_definition': process['xml']})
+        r.raise_for_status()
+        # 预热：解析 spec 并写入定义版本
+        (await client.post('/test/create_process_instance/1')).raise_for_status()
+        created = []
+
+        async def create_worker():
+            for _ in range(requests):
+                r = await client.post('/test/create_process_instance/1')
+                r.raise_for_status()
+                created.append(r.json()['id'])
+
+        async def run_worker(ids):
+            for id in ids:
+                (await client.post(f'/test/run_process_instance/{id}', json={})).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[create_worker() for _ in range(clients)])
+        create_rate = len(created) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        await asyncio.gather(*[run_worker(created[i::clients]) for i in range(clients)])
+        run_rate = len(created) / (time.perf_counter() - start)
+        return create_rate, run_rate
+    finally:
+        await engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file + suffix):
+                os.unlink(db_file + suffix)
+
+
+async def main(args):
+    import httpx
+    from loguru import logger
+
+    import db
+    from app import app
+
+    logger.remove()
+    transport = httpx.ASGITransport(app=app)
+    print(f'{args.clients} clients x {args.requests} instances')
+    print(f"{'config':<18}{'create/s':>10}{'run/s':>10}")
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for name, profile, pool_size in CONFIGS:
+            create_rate, run_rate = await run_config(client, db, profile, pool_size, args.clients, args.requests)
+            print(f'{name:<18}{create_rate:>10.1f}{run_rate:>10.1f}')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--clients', type=int, default=8, help='并发客户端数')
+    arg_parser.add_argument('--requests', type=int, default=50, help='每个客户端创建的实例数')
+    asyncio.run(main(arg_parser.parse_args()))
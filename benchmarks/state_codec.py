@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+状态编码基准测试
+用示例流程生成真实的序列化状态，比较各 codec 的体积和编解码耗时
+"""
+import argparse
+import sys
+import os
+import timeit
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SpiffWorkflow.bpmn.serializer.BpmnSerializer import BpmnSerializer
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+
+from bpmn.spec_cache import parse_spec
+from bpmn.state_codec import CODECS, decode_state, encode_state, get_state_codec
+from scripts.init_sample_processes import SAMPLE_PROCESSES
+
+
+def sample_states():
+    """每个示例流程生成一个不含 spec 和一个内嵌 spec 的状态"""
+    serializer = BpmnSerializer()
+    for process in SAMPLE_PROCESSES:
+        workflow = BpmnWorkflow(parse_spec(process['xml']))
+        try:
+            workflow.do_engine_steps()
+        except Exception:
+            # 脚本任务缺少数据时停在当前状态即可
+            pass
+        yield process['name'], False, serializer.serialize_workflow(workflow, include_spec=False)
+        yield process['name'], True, serializer.serialize_workflow(workflow, include_spec=True)
+
+
+def main(number: int):
+    states = list(sample_states())
+    print(f"{'codec':<8}{'level':>6}{'spec':>6}{'raw B':>9}{'stored B':>10}{'ratio':>8}{'enc us':>9}{'dec us':>9}")
+    for name in sorted(CODECS):
+        for level in ([0] if name == 'raw' else [1, 6, 9]):
+            codec = get_state_codec(name)
+            codec.level = level
+            for include_spec in (False, True):
+                selected = [state for _, spec, state in states if spec == include_spec]
+                raw = sum(len(state.encode('utf-8')) for state in selected)
+                blobs = [encode_state(state, codec) for state in selected]
+                stored = sum(len(blob) for blob in blobs)
+                enc = timeit.timeit(lambda: [encode_state(state, codec) for state in selected], number=number)
+                dec = timeit.timeit(lambda: [decode_state(blob) for blob in blobs], number=number)
+                per = number * len(selected)
+                print(f"{name:<8}{level:>6}{'yes' if include_spec else 'no':>6}{raw / len(selected):>9.0f}"
+                      f"{stored / len(selected):>10.0f}{stored / raw:>8.1%}"
+                      f"{enc / per * 1e6:>9.1f}{dec / per * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--number', type=int, default=200, help='每组重复次数')
+    main(arg_parser.parse_args().number)
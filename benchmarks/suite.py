@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+基准测试套件
+使用 scripts/init_sample_processes.py 中的示例流程和生成的大流程，在临时 SQLite 数据库上通过 ASGI 测量
+解析耗时、创建和推进吞吐量、每步状态大小的增长、任务拓扑图和列表接口的延迟，
+结果输出为 JSON，并与保存的基线比较，超过阈值的退化使退出码为 1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+# 添加项目根目录到路径
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.script_engine import gateway_process
+from benchmarks.task_topology import parallel_process
+from scripts.init_sample_processes import SAMPLE_PROCESSES
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def with_form_keys(xml_definition: str) -> str:
+    """给没有 camunda:formKey 的用户任务加上 formKey
+
+    示例流程中的用户任务没有 formKey，SpiffWorkflow 不会把它们解析为带表单的 camunda 用户任务，
+    推进时无法提交表单；前端建模器保存的流程都带有 formKey
+    """
+    return re.sub(r'<bpmn:userTask id="([^"]+)"(?![^>]*camunda:formKey)',
+                  r'<bpmn:userTask id="\1" camunda:formKey="\1"', xml_definition)
+
+
+# 示例流程在结果中的名称，以及逐步推进时每一步提交的表单数据
+SAMPLES = {
+    'simple': (SAMPLE_PROCESSES[0], []),
+    'user_task': (SAMPLE_PROCESSES[1], [{'name': 'bench', 'email': 'bench@example.com', 'agree': True}]),
+    'conditional': (SAMPLE_PROCESSES[2], [{'number': '42'}]),
+    'approval': (SAMPLE_PROCESSES[3], [{'applicant': 'bench', 'amount': '20000', 'reason': 'bench'},
+                                       {'approved': True, 'comment': 'ok'}]),
+    'order': (SAMPLE_PROCESSES[4], [{'customer': 'bench', 'product': 'p', 'quantity': '2', 'price': '10'},
+                                    {'confirm': True}]),
+}
+
+
+def report(line: str) -> None:
+    # 运行期间标准输出被重定向，丢弃 SpiffWorkflow 和示例脚本中的 print
+    print(line, file=sys.__stdout__, flush=True)
+
+
+class Results:
+    """Named measurements, each with a unit and whether lower or higher is better"""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, dict] = {}
+
+    def record(self, name: str, value: float, unit: str, better: str = 'lower') -> None:
+        self.metrics[name] = {'value': round(value, 4), 'unit': unit, 'better': better}
+        report(f'  {name:<40}{value:>12.3f} {unit}')
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def latencies(call: Callable[[], Awaitable], number: int) -> List[float]:
+    """每次调用的毫秒数"""
+    samples = []
+    for _ in range(number):
+        start = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def ok(response):
+    response = await response
+    assert response.status_code in (200, 304), response.text
+    return response
+
+
+def bench_parse(results: Results, definitions: Dict[str, str], number: int) -> None:
+    from bpmn.spec_cache import parse_spec
+
+    report('parse')
+    for key, xml_definition in definitions.items():
+        samples = []
+        for _ in range(number):
+            start = time.perf_counter()
+            parse_spec(xml_definition)
+            samples.append((time.perf_counter() - start) * 1000)
+        results.record(f'parse.{key}.p50', statistics.median(samples), 'ms')
+
+
+async def bench_create(results: Results, client, process_ids: Dict[str, int], number: int) -> None:
+    report('create')
+    for key, process_id in process_ids.items():
+        # 预热：解析 spec 并写入定义版本
+        await ok(client.post(f'/test/create_process_instance/{process_id}'))
+        samples = await latencies(lambda: ok(client.post(f'/test/create_process_instance/{process_id}')), number)
+        results.record(f'create.{key}.throughput', 1000 * len(samples) / sum(samples), 'instances/s', 'higher')
+        results.record(f'create.{key}.p95', percentile(samples, .95), 'ms')
+
+
+async def bench_advance(results: Results, client, process_ids: Dict[str, int], number: int) -> None:
+    report('advance')
+    for key, (_, steps) in SAMPLES.items():
+        if not steps:
+            continue
+        instance_ids = [(await ok(client.post(f'/test/create_process_instance/{process_ids[key]}'))).json()['id']
+                        for _ in range(number)]
+        samples = []
+        for step in steps:
+            for instance_id in instance_ids:
+                start = time.perf_counter()
+                await ok(client.post(f'/test/run_process_instance/{instance_id}', json=step))
+                samples.append((time.perf_counter() - start) * 1000)
+        results.record(f'advance.{key}.throughput', 1000 * len(samples) / sum(samples), 'steps/s', 'higher')
+        results.record(f'advance.{key}.p95', percentile(samples, .95), 'ms')
+
+
+async def state_sizes(instance_id: int) -> tuple:
+    """实例当前状态序列化后和存储时的字节数"""
+    from bpmn.state_codec import decode_state
+    from db import AsyncSessionLocal
+    from db.models import BpmnProcessInstance
+
+    async with AsyncSessionLocal() as session:
+        instance = await session.get(BpmnProcessInstance, instance_id)
+        return len(decode_state(instance.state).encode('utf-8')), len(instance.state)
+
+
+async def bench_large_instance(results: Results, client, process_id: int, tasks: int, number: int) -> None:
+    """逐个完成大并行流程的用户任务，测量每步的延迟和状态增长，推进一半后测量拓扑图"""
+    report(f'parallel_{tasks}')
+    instance_id = (await ok(client.post(f'/test/create_process_instance/{process_id}'))).json()['id']
+    first = await state_sizes(instance_id)
+    steps = tasks // 2
+    samples = []
+    for i in range(1, steps + 1):
+        start = time.perf_counter()
+        await ok(client.post(f'/test/run_process_instance/{instance_id}', json={f'Task_{i}': True}))
+        samples.append((time.perf_counter() - start) * 1000)
+    last = await state_sizes(instance_id)
+    results.record(f'advance.parallel_{tasks}.p50', statistics.median(samples), 'ms')
+    results.record(f'state.parallel_{tasks}.bytes_per_step', (last[0] - first[0]) / steps, 'bytes')
+    results.record(f'state.parallel_{tasks}.stored_bytes_per_step', (last[1] - first[1]) / steps, 'bytes')
+
+    url = f'/bpmn_process_instances/{instance_id}/task_topology'
+    await ok(client.get(url))
+    samples = await latencies(lambda: ok(client.get(url)), number)
+    results.record(f'topology.parallel_{tasks}.p50', statistics.median(samples), 'ms')
+
+
+async def bench_topology(results: Results, client, process_ids: Dict[str, int], number: int) -> None:
+    report('topology')
+    for key in SAMPLES:
+        instance_id = (await ok(client.post(f'/test/create_process_instance/{process_ids[key]}'))).json()['id']
+        url = f'/bpmn_process_instances/{instance_id}/task_topology'
+        await ok(client.get(url))
+        samples = await latencies(lambda: ok(client.get(url)), number)
+        results.record(f'topology.{key}.p50', statistics.median(samples), 'ms')
+
+
+async def bench_list(results: Results, client, process_id: int, instances: int, number: int) -> None:
+    report(f'list ({instances} instances)')
+    for offset in range(0, instances, 1000):
+        payloads = [None] * min(1000, instances - offset)
+        await ok(client.post(f'/bpmn_processes/{process_id}/instances:batch', json=payloads))
+    queries = {
+        'first_page': '/bpmn_process_instances?limit=100',
+        'by_process': f'/bpmn_process_instances?process_id={process_id}&limit=100&order_by=created_at&desc=true',
+        'inbox': f'/bpmn_processes/{process_id}/inbox/Task_1?limit=100',
+    }
+    for key, url in queries.items():
+        await ok(client.get(url))
+        samples = await latencies(lambda: ok(client.get(url)), number)
+        results.record(f'list.{key}.p50', statistics.median(samples), 'ms')
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    from importlib.metadata import version
+    return {
+        'date': datetime.utcnow().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+        'spiffworkflow': version('SpiffWorkflow'),
+    }
+
+
+def compare(metrics: Dict[str, dict], baseline: dict, threshold: float) -> List[str]:
+    """与基线比较，返回超过阈值的退化；基线中的指标可以用 threshold 单独指定阈值"""
+    regressions = []
+    print(f"\n{'metric':<40}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, metric in metrics.items():
+        base = baseline.get('metrics', {}).get(name)
+        if base is None or not base['value']:
+            print(f'{name:<40}{"-":>12}{metric["value"]:>12.3f}{"new":>9}')
+            continue
+        change = (metric['value'] - base['value']) / base['value']
+        worse = change if metric['better'] == 'lower' else -change
+        limit = base.get('threshold', threshold)
+        flag = '  REGRESSION' if worse > limit else ''
+        print(f'{name:<40}{base["value"]:>12.3f}{metric["value"]:>12.3f}{change:>+9.1%}{flag}')
+        if flag:
+            regressions.append(f'{name}: {base["value"]} -> {metric["value"]} {metric["unit"]} '
+                               f'({worse:+.1%} worse, threshold {limit:.0%})')
+    return regressions
+
+
+async def run_suite(args) -> Results:
+    import httpx
+    from loguru import logger
+
+    import db
+    from app import app
+    from db.models import Base
+
+    logger.remove()
+    # SpiffWorkflow 通过 logging 输出脚本错误等信息
+    logging.disable(logging.CRITICAL)
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+    engine = db.create_engine(f'sqlite+aiosqlite:///{db_file}')
+    db.AsyncSessionLocal.configure(bind=engine)
+    results = Results()
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        large = parallel_process(args.tasks)
+        definitions = {key: with_form_keys(process['xml']) for key, (process, _) in SAMPLES.items()}
+        definitions[f'gateway_{args.stages}x{args.stages}'] = gateway_process(args.stages, args.stages)
+        definitions[f'parallel_{args.tasks}'] = large
+        bench_parse(results, definitions, args.number)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            process_ids = {}
+            for i, (key, xml_definition) in enumerate(definitions.items(), start=1):
+                r = await client.post('/bpmn_processes', json={'id': i, 'name': key, 'xml_definition': xml_definition})
+                r.raise_for_status()
+                process_ids[key] = i
+            await bench_create(results, client, {key: process_ids[key] for key in list(SAMPLES) + [
+                f'gateway_{args.stages}x{args.stages}']}, args.number)
+            await bench_advance(results, client, process_ids, args.number)
+            await bench_topology(results, client, process_ids, args.number)
+            await bench_large_instance(results, client, process_ids[f'parallel_{args.tasks}'], args.tasks, args.number)
+            # 用户任务流程的实例停在 Task_1 上，待办查询有结果
+            await bench_list(results, client, process_ids['user_task'], args.instances, args.number)
+    finally:
+        await engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file + suffix):
+                os.unlink(db_file + suffix)
+    return results
+
+
+def main(args) -> int:
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(run_suite(args))
+    report = {'meta': {**metadata(), 'args': vars(args)}, 'metrics': results.metrics}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        # 保留基线中手工设置的单项阈值
+        thresholds = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                thresholds = {name: metric['threshold'] for name, metric in json.load(f)['metrics'].items()
+                              if 'threshold' in metric}
+        for name, threshold in thresholds.items():
+            if name in report['metrics']:
+                report['metrics'][name]['threshold'] = threshold
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'\n基线已写入 {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'\n没有基线 {args.baseline}，使用 --update-baseline 生成')
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results.metrics, baseline, args.threshold)
+    if regressions:
+        print(f'\n{len(regressions)} 项退化超过阈值：')
+        for line in regressions:
+            print(f'  {line}')
+        return 1
+    print('\n没有超过阈值的退化')
+    return 0
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--number', type=int, default=30, help='每项测量的重复次数')
+    arg_parser.add_argument('--tasks', type=int, default=200, help='生成的大并行流程的用户任务数')
+    arg_parser.add_argument('--stages', type=int, default=10, help='生成的条件网关流程的级数和每级分支数')
+    arg_parser.add_argument('--instances', type=int, default=5000, help='测量列表接口前创建的实例数')
+    arg_parser.add_argument('--output', help='把结果写入 JSON 文件')
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件')
+    arg_parser.add_argument('--threshold', type=float, default=0.25,
+                            help='默认的退化阈值（相对基线变差的比例）')
+    arg_parser.add_argument('--update-baseline', action='store_true', help='用本次结果覆盖基线，不做比较')
+    sys.exit(main(arg_parser.parse_args()))
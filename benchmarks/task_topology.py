@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+任务拓扑图接口基准测试
+生成一个包含数百个用户任务的流程，推进约一半后反复请求 task_topology，
+比较静态图缓存未命中、命中以及带 If-None-Match 返回 304 时的延迟
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parallel_process(tasks: int) -> str:
+    """并行网关展开 tasks 个带表单的用户任务，再汇合到结束事件
+
+    SpiffWorkflow 会为每个分支预测一份后续任务：串行长链会让任务树过深，
+    多级并行会让任务数成倍增长，所以只用一级并行
+    """
+    elements = ['<bpmn:startEvent id="StartEvent_1" />',
+                '<bpmn:parallelGateway id="Split" />', '<bpmn:parallelGateway id="Join" />',
+                '<bpmn:endEvent id="EndEvent_1" />']
+    flows = [('StartEvent_1', 'Split'), ('Join', 'EndEvent_1')]
+    for i in range(1, tasks + 1):
+        elements.append(
+            f'<bpmn:userTask id="Task_{i}" name="任务 {i}" camunda:formKey="Task_{i}">'
+            f'<bpmn:extensionElements><camunda:formData>'
+            f'<camunda:formField id="Task_{i}" label="完成" type="boolean" />'
+            f'</camunda:formData></bpmn:extensionElements></bpmn:userTask>')
+        flows += [('Split', f'Task_{i}'), (f'Task_{i}', 'Join')]
+    elements += [f'<bpmn:sequenceFlow id="Flow_{i}" sourceRef="{source}" targetRef="{target}" />'
+                 for i, (source, target) in enumerate(flows, start=1)]
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" '
+            'xmlns:camunda="http://camunda.org/schema/1.0/bpmn">\n'
+            '<bpmn:process id="parallel_process" name="大并行流程" isExecutable="true">\n'
+            + '\n'.join(elements) + '\n</bpmn:process>\n</bpmn:definitions>')
+
+
+async def timed(client, url: str, number: int, headers=None, before=None) -> float:
+    """平均每次请求的毫秒数"""
+    total = 0.0
+    for _ in range(number):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        r = await client.get(url, headers=headers)
+        total += time.perf_counter() - start
+        assert r.status_code in (200, 304), r.text
+    return total / number * 1000
+
+
+async def main(args):
+    import httpx
+    from loguru import logger
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    import db
+    from app import app
+    from db.models import Base
+
+    logger.remove()
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+    engine = create_async_engine(f'sqlite+aiosqlite:///{db_file}', future=True)
+    db.AsyncSessionLocal.configure(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        from bpmn.topology import get_topology_cache
+        clear_cache = get_topology_cache().clear
+    except ImportError:
+        # 没有拓扑缓存的版本，每次请求都是冷路径
+        clear_cache = None
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        xml_definition = parallel_process(args.tasks)
+        r = await client.post('/bpmn_processes', json={'id': 1, 'name': 'parallel', 'xml_definition': xml_definition})
+        r.raise_for_status()
+        instance = (await client.post('/test/create_process_instance/1')).json()
+        # 一次提交前一半任务的表单数据，这些任务都会被完成
+        done = {f'Task_{i}': True for i in range(1, args.tasks // 2 + 1)}
+        (await client.post(f"/test/run_process_instance/{instance['id']}", json=done)).raise_for_status()
+        url = f"/bpmn_process_instances/{instance['id']}/task_topology"
+        r = await client.get(url)
+        r.raise_for_status()
+        etag = r.headers.get('etag')
+        print(f"{args.tasks} user tasks, {len(r.json()['nodes'])} nodes, {len(r.json()['edges'])} edges, "
+              f"{len(r.content) / 1024:.0f} KiB response")
+
+        rows = []
+        if clear_cache is not None:
+            rows.append(('cold graph', await timed(client, url, args.number, before=clear_cache)))
+        rows.append(('warm graph' if clear_cache else 'full', await timed(client, url, args.number)))
+        if etag:
+            rows.append(('304', await timed(client, url, args.number, headers={'If-None-Match': etag})))
+        for name, ms in rows:
+            print(f'{name:<12}{ms:>9.2f} ms')
+
+    await engine.dispose()
+    os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--tasks', type=int, default=400, help='并行用户任务数')
+    arg_parser.add_argument('--number', type=int, default=20, help='每种情况的请求次数')
+    asyncio.run(main(arg_parser.parse_args()))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+定时事件调度器基准测试
+在临时数据库中复制出大量等待定时器的实例（只有一小部分已到期），
+测量调度器查询最早到期定时器的耗时（有无 due_at 索引）以及触发到期实例的吞吐量
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TIMER_PROCESS = '''<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:camunda="http://camunda.org/schema/1.0/bpmn">
+  <bpmn:process id="timer_process" name="定时流程" isExecutable="true">
+    <bpmn:startEvent id="StartEvent_1" />
+    <bpmn:intermediateCatchEvent id="Timer_Wait" name="等待">
+      <bpmn:timerEventDefinition><bpmn:timeDuration>timedelta(seconds=1)</bpmn:timeDuration></bpmn:timerEventDefinition>
+    </bpmn:intermediateCatchEvent>
+    <bpmn:userTask id="Task_Handle" name="处理" camunda:formKey="handle">
+      <bpmn:extensionElements>
+        <camunda:formData>
+          <camunda:formField id="done" label="完成" type="boolean" />
+        </camunda:formData>
+      </bpmn:extensionElements>
+    </bpmn:userTask>
+    <bpmn:endEvent id="EndEvent_1" />
+    <bpmn:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="Timer_Wait" />
+    <bpmn:sequenceFlow id="Flow_2" sourceRef="Timer_Wait" targetRef="Task_Handle" />
+    <bpmn:sequenceFlow id="Flow_3" sourceRef="Task_Handle" targetRef="EndEvent_1" />
+  </bpmn:process>
+</bpmn:definitions>'''
+
+
+async def fill(session_factory, timers: int, due: int) -> None:
+    """创建一个真实实例，再按它的状态复制出 timers 个实例，其中 due 个的定时器已经到期"""
+    from sqlalchemy import insert
+
+    from bpmn import BpmnRunner
+    from db.models import BpmnProcess, BpmnProcessInstance, BpmnTimer
+    from db.repos import RepoManager
+
+    async with session_factory.begin() as session:
+        repo_manager = RepoManager(session=session)
+        process = await repo_manager.get_repo(BpmnProcess).create(
+            {'id': 1, 'name': 'timer', 'xml_definition': TIMER_PROCESS})
+        template = await BpmnRunner(repo_manager).create_process_instance(process)
+        row = {'bpmn_process_id': 1, 'state': template.state, 'spec_hash': template.spec_hash,
+               'current_task': template.current_task, 'current_task_spec_id': template.current_task_spec_id}
+        now = datetime.utcnow()
+        for start in range(0, timers, 10000):
+            count = min(timers, start + 10000) - start
+            ids = [template.id + 1 + i for i in range(start, start + count)]
+            await session.execute(insert(BpmnProcessInstance), [dict(row, id=id, created_at=now, updated_at=now)
+                                                                for id in ids])
+            await session.execute(insert(BpmnTimer), [{
+                'bpmn_process_instance_id': id,
+                'task_spec_id': 'Timer_Wait',
+                # 前 due 个已到期，其余分散在未来一天内
+                'due_at': now - timedelta(seconds=1) if id - template.id <= due
+                else now + timedelta(seconds=random.uniform(60, 86400)),
+                'created_at': now,
+                'updated_at': now
+            } for id in ids])
+
+
+async def time_queries(session_factory, number: int):
+    """平均每次查询下一个到期时间和一批到期实例的毫秒数"""
+    from db.models import BpmnTimer
+    from db.repos import RepoManager
+
+    async with session_factory() as session:
+        repo = RepoManager(session=session).get_repo(BpmnTimer)
+        start = time.perf_counter()
+        for _ in range(number):
+            await repo.next_due_at()
+        next_ms = (time.perf_counter() - start) / number * 1000
+        start = time.perf_counter()
+        for _ in range(number):
+            await repo.due(datetime.utcnow(), 100)
+        due_ms = (time.perf_counter() - start) / number * 1000
+    return next_ms, due_ms
+
+
+async def main(args):
+    from loguru import logger
+    from sqlalchemy import text
+
+    import db
+    from bpmn.timer_scheduler import TimerScheduler
+    from db.models import Base
+
+    logger.remove()
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False).name
+    engine = db.create_engine(f'sqlite+aiosqlite:///{db_file}', echo=False)
+    db.AsyncSessionLocal.configure(bind=engine)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        start = time.perf_counter()
+        await fill(db.AsyncSessionLocal, args.timers, args.due)
+        print(f'{args.timers} pending timers ({args.due} due), filled in {time.perf_counter() - start:.1f}s')
+
+        print(f"{'due_at index':<14}{'next due ms':>12}{'due batch ms':>14}")
+        next_ms, due_ms = await time_queries(db.AsyncSessionLocal, args.number)
+        print(f"{'yes':<14}{next_ms:>12.3f}{due_ms:>14.3f}")
+        async with engine.begin() as conn:
+            await conn.execute(text('DROP INDEX ix_bpmn_timer_due_at'))
+        next_ms, due_ms = await time_queries(db.AsyncSessionLocal, max(1, args.number // 10))
+        print(f"{'no':<14}{next_ms:>12.3f}{due_ms:>14.3f}")
+        async with engine.begin() as conn:
+            await conn.execute(text('CREATE INDEX ix_bpmn_timer_due_at ON bpmn_timer (due_at, id)'))
+
+        # 复制的状态里计时从创建模板实例时开始，等引擎也认为定时器到期
+        await asyncio.sleep(1.1)
+        scheduler = TimerScheduler(batch_size=args.batch_size)
+        start = time.perf_counter()
+        while await scheduler.fire_due():
+            pass
+        elapsed = time.perf_counter() - start
+        print(f'fired {scheduler.fired} instances ({scheduler.failed} failed) in {elapsed:.2f}s, '
+              f'{scheduler.fired / elapsed:.0f} instances/s with batches of {args.batch_size}')
+    finally:
+        await engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file + suffix):
+                os.unlink(db_file + suffix)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--timers', type=int, default=200000, help='等待中的定时器数量')
+    arg_parser.add_argument('--due', type=int, default=2000, help='其中已到期的数量')
+    arg_parser.add_argument('--batch-size', type=int, default=100, help='调度器每批处理的实例数')
+    arg_parser.add_argument('--number', type=int, default=200, help='每种查询的执行次数')
+    asyncio.run(main(arg_parser.parse_args()))
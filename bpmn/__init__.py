@@ -1,6 +1,13 @@
 from fastapi import Depends
 
-from bpmn.bpmn_runner import BpmnRunner
+from bpmn.archiver import InstanceArchiver, get_instance_archiver
+from bpmn.bpmn_runner import BpmnRunner, ConcurrentUpdateError
+from bpmn.executor import EngineExecutor, get_engine_executor
+from bpmn.job_worker import JobWorker, get_job_worker
+from bpmn.script_engine import CachedScriptEngine, ScriptCache, get_script_cache
+from bpmn.spec_cache import SpecCache, get_spec_cache
+from bpmn.timer_scheduler import TimerScheduler, get_timer_scheduler
+from bpmn.warmup import ProcessWarmer, get_process_warmer
 from db.repos import RepoManager, get_repo_manager
 
 
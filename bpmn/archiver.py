@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from loguru import logger
+
+from bpmn.executor import get_engine_executor
+from bpmn.state_codec import decode_state, encode_state, get_state_codec
+from config import settings
+from db import AsyncSessionLocal
+from db.models import BpmnProcessInstance, BpmnProcessInstanceArchive, BpmnProcessInstanceTask, BpmnTimer
+from db.repos import RepoManager
+
+# 归档时复制的实例列，state 单独重新编码
+ARCHIVED_COLUMNS = ('id', 'bpmn_process_id', 'spec_hash', 'version', 'current_task', 'current_task_spec_id',
+                    'error', 'created_at', 'updated_at')
+
+
+def recompress_states(states: List[bytes], codec_name: str, level: int) -> List[bytes]:
+    codec = get_state_codec(codec_name)
+    codec.level = level
+    return [encode_state(decode_state(state), codec) for state in states]
+
+
+class InstanceArchiver:
+    """Moves completed instances out of the hot ``bpmn_process_instance`` table
+
+    Instances that completed more than ``after_days`` ago are copied to
+    ``bpmn_process_instance_archive`` with their state recompressed, and deleted
+    together with their task projection and timers, one batch per transaction;
+    instances with a queued or running job wait for it. Job rows are kept and
+    still point at the archived id.
+    Archived rows keep their id, so the read endpoints fall back to the archive
+    when an id is not found in the hot table, and listings read it with
+    ``archived=true``.
+    """
+
+    def __init__(self, after_days: float = settings.archive_after_days,
+                 batch_size: int = settings.archive_batch_size,
+                 interval: float = settings.archive_interval,
+                 codec: str = settings.archive_codec,
+                 level: int = settings.archive_codec_level) -> None:
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.codec = codec
+        self.level = level
+        self.archived = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self.running or not settings.archive_enabled:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def archive_batch(self, now: Optional[datetime] = None) -> int:
+        """Archive one batch of completed instances, returns how many were moved"""
+
+        before = (now or datetime.utcnow()) - timedelta(days=self.after_days)
+        async with AsyncSessionLocal.begin() as session:
+            repo_manager = RepoManager(session=session)
+            instance_repo = repo_manager.get_repo(BpmnProcessInstance)
+            instances = await instance_repo.archivable(before, self.batch_size)
+            if not instances:
+                return 0
+            # 压缩是纯 CPU 的工作，和引擎阶段一样交给执行器
+            states = await get_engine_executor().run(
+                recompress_states, [instance.state for instance in instances], self.codec, self.level)
+            await repo_manager.get_repo(BpmnProcessInstanceArchive).bulk_create([
+                {**{name: getattr(instance, name) for name in ARCHIVED_COLUMNS}, 'state': state}
+                for instance, state in zip(instances, states)
+            ])
+            ids = [instance.id for instance in instances]
+            await repo_manager.get_repo(BpmnProcessInstanceTask).delete_for_instances(ids)
+            await repo_manager.get_repo(BpmnTimer).delete_for_instances(ids)
+            await instance_repo.delete_many(ids)
+        self.archived += len(ids)
+        return len(ids)
+
+    async def archive_all(self, now: Optional[datetime] = None) -> int:
+        """Archive batches until no instance is old enough, returns how many were moved"""
+
+        now = now or datetime.utcnow()
+        total = 0
+        while True:
+            moved = await self.archive_batch(now)
+            total += moved
+            if moved < self.batch_size:
+                return total
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                moved = await self.archive_all()
+                if moved:
+                    logger.info(f'Archived {moved} completed process instances')
+            except Exception:
+                logger.exception('Instance archiver failed')
+            await asyncio.sleep(self.interval)
+
+
+instance_archiver = InstanceArchiver()
+
+
+def get_instance_archiver() -> InstanceArchiver:
+    return instance_archiver
@@ -1,20 +1,63 @@
-from tempfile import NamedTemporaryFile
-from typing import Tuple, Optional
+import asyncio
+import time
+from typing import Callable, Dict, List, NamedTuple, Tuple, TypeVar, Optional, Union
 
 from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
-from SpiffWorkflow.camunda.parser.CamundaParser import CamundaParser
 from SpiffWorkflow.camunda.specs.UserTask import UserTask
 from SpiffWorkflow.bpmn.serializer.BpmnSerializer import BpmnSerializer
 from SpiffWorkflow.exceptions import WorkflowTaskExecException
+from SpiffWorkflow.task import Task
 from loguru import logger
+from sqlalchemy import inspect as sa_inspect
 
-from db.models import BpmnProcess, BpmnProcessInstance
+from bpmn.budget import BudgetExceeded, BudgetMeter, do_engine_steps, execution_budget
+from bpmn.executor import get_engine_executor
+from bpmn.instance_tasks import TaskRow, project_tasks
+from bpmn.script_engine import CachedScriptEngine
+from bpmn.spec_cache import BPMN_NS, get_spec_cache, xml_hash
+from bpmn.state_codec import decode_state, encode_state
+from bpmn.timers import TimerRow, waiting_timers
+from bpmn.workflow_cache import get_workflow_cache
+from config import settings
+from db import call_after_commit
+from db.models import BpmnProcess, BpmnProcessInstance, BpmnProcessInstanceTask, BpmnProcessSpec, BpmnTimer
+from metrics import (BUDGET_EXCEEDED, ENGINE_PHASE_SECONDS, INSTANCE_STATE_BYTES, INSTANCE_STORED_STATE_BYTES,
+                     INSTANCES_ADVANCED, INSTANCES_COMPLETED, INSTANCES_CREATED, PhaseTimings, observe_phases, phase)
+
+T = TypeVar('T')
 
 
 class StopWorkflow(Exception):
     """Signal to stop workflow execution"""
 
 
+class ConcurrentUpdateError(Exception):
+    """The process instance was advanced by someone else in the meantime"""
+
+
+class EngineError(Exception):
+    """An engine phase failed in a worker process"""
+
+
+class EngineResult(NamedTuple):
+    """Outcome of one engine phase; ``state`` is None if the workflow was already completed"""
+
+    workflow: Optional[BpmnWorkflow]
+    state: Optional[bytes]
+    next_task: Optional[str]
+    size: int
+    # 与 state 对应的任务投影，随 state 写入 bpmn_process_instance_task
+    tasks: Optional[List[TaskRow]] = None
+    # 当前等待的任务的 BPMN 元素 id，工作流结束或无法确定时为 None
+    next_task_spec_id: Optional[str] = None
+    # 等待中的定时事件，随 state 写入 bpmn_timer
+    timers: Optional[List[TimerRow]] = None
+    # 超出执行预算时的错误，其余字段是最后一个完整的状态
+    error: Optional[str] = None
+    # 引擎阶段各部分的耗时（秒），在执行引擎阶段的线程或进程中测量
+    timings: Optional[Dict[str, float]] = None
+
+
 class BpmnRunner(object):
     """Manager for the creation and execution of a bpmn workflow"""
 
@@ -25,27 +68,364 @@ class BpmnRunner(object):
     async def create_process_instance(self, process: BpmnProcess, data: Optional[dict] = None) -> BpmnProcessInstance:
         """Create a new process instance"""
 
-        parser = CamundaParser()
-        with NamedTemporaryFile(mode='w+t') as f:
-            f.write(process.xml_definition)
-            f.seek(0)
-            parser.add_bpmn_file(f.name)
-        
-        # 从 XML 中提取 process id（不是 name）
-        import xml.etree.ElementTree as ET
-        root = ET.fromstring(process.xml_definition)
-        # 查找 process 元素
-        process_elem = root.find('.//{http://www.omg.org/spec/BPMN/20100524/MODEL}process')
-        process_id = process_elem.get('id') if process_elem is not None else process.name
-        
-        wf_spec = parser.get_spec(process_id)
-        workflow = BpmnWorkflow(wf_spec)
-        
+        spec_hash = xml_hash(process.xml_definition)
+        await self._store_spec(process, spec_hash)
+        result = await self._start(process, spec_hash, data)
+
+        started = time.perf_counter()
+        repo = self.repo_manager.get_repo(BpmnProcessInstance)
+        process_instance = await repo.create(self._instance_params(process, spec_hash, result))
+        await self.repo_manager.get_repo(BpmnProcessInstanceTask).bulk_create(
+            self._task_params(process_instance.id, result))
+        await self._create_timers([(process_instance.id, result)])
+        ENGINE_PHASE_SECONDS.observe(time.perf_counter() - started, 'write', process.id)
+        self._count_written(process.id, [result], created=True)
+        if result.workflow is not None and not result.workflow.is_completed():
+            self._cache_workflow(process_instance, result.workflow, result.size)
+        return process_instance
+
+    async def create_process_instances(
+            self, process: BpmnProcess, payloads: List[Optional[dict]],
+            parallel: bool = False) -> List[Union[BpmnProcessInstance, Exception]]:
+        """Create many instances of one process, parsing its spec once and inserting them together
+
+        Returns one entry per payload, either the new instance or the error
+        that prevented it from starting.
+        """
+
+        spec_hash = xml_hash(process.xml_definition)
+        await self._store_spec(process, spec_hash)
+        executor = get_engine_executor()
+        if executor.in_process:
+            # 先解析一次 spec，避免并行时多个线程同时解析
+            await executor.run_local(
+                get_spec_cache().get, process.id, process.xml_definition, process.name, spec_hash)
+
+        async def start(data: Optional[dict]) -> Union[EngineResult, Exception]:
+            try:
+                return await self._start(process, spec_hash, data)
+            except Exception as e:
+                logger.warning(f'Failed to start an instance of process {process.id}: {e}')
+                return e
+
+        if parallel:
+            results = await asyncio.gather(*[start(data) for data in payloads])
+        else:
+            results = [await start(data) for data in payloads]
+
+        write_started = time.perf_counter()
+        repo = self.repo_manager.get_repo(BpmnProcessInstance)
+        started = [result for result in results if isinstance(result, EngineResult)]
+        created = await repo.bulk_create([self._instance_params(process, spec_hash, result) for result in started])
+        await self.repo_manager.get_repo(BpmnProcessInstanceTask).bulk_create([
+            params for process_instance, result in zip(created, started)
+            for params in self._task_params(process_instance.id, result)])
+        await self._create_timers([(process_instance.id, result) for process_instance, result in zip(created, started)])
+        ENGINE_PHASE_SECONDS.observe(time.perf_counter() - write_started, 'write', process.id)
+        self._count_written(process.id, started, created=True)
+        instances = iter(created)
+        outcome = []
+        for result in results:
+            if isinstance(result, Exception):
+                outcome.append(result)
+                continue
+            process_instance = next(instances)
+            if result.workflow is not None and not result.workflow.is_completed():
+                self._cache_workflow(process_instance, result.workflow, result.size)
+            outcome.append(process_instance)
+        return outcome
+
+    async def _start(self, process: BpmnProcess, spec_hash: str, data: Optional[dict]) -> EngineResult:
+        executor = get_engine_executor()
+        args = (process.id, process.name, process.xml_definition, spec_hash, data)
+        if executor.in_process:
+            result = await executor.run(self._start_workflow, *args)
+        else:
+            result = await executor.run(_start_detached, *args)
+        self._observe(process.id, result)
+        return result
+
+    def _observe(self, process_id: int, result: EngineResult) -> None:
+        """Record the timings and state size of an engine phase in this process's metrics"""
+
+        observe_phases(process_id, result.timings)
+        if result.error is not None:
+            BUDGET_EXCEEDED.inc(process_id)
+        elif result.state is not None:
+            INSTANCE_STATE_BYTES.observe(result.size, process_id)
+            INSTANCE_STORED_STATE_BYTES.observe(len(result.state), process_id)
+
+    def _count_written(self, process_id: int, results: List[EngineResult], created: bool = False) -> None:
+        (INSTANCES_CREATED if created else INSTANCES_ADVANCED).inc(process_id, amount=len(results))
+        completed = sum(result.next_task == 'END' for result in results)
+        if completed:
+            INSTANCES_COMPLETED.inc(process_id, amount=completed)
+
+    def _instance_params(self, process: BpmnProcess, spec_hash: str, result: EngineResult) -> dict:
+        return {
+            'bpmn_process_id': process.id,
+            'state': result.state,
+            'spec_hash': spec_hash,
+            'current_task': result.next_task,
+            'current_task_spec_id': result.next_task_spec_id,
+            'error': result.error
+        }
+
+    def _state_params(self, result: EngineResult) -> dict:
+        # 成功写入时清除上一次记录的错误
+        return {
+            'state': result.state,
+            'current_task': result.next_task,
+            'current_task_spec_id': result.next_task_spec_id,
+            'error': result.error
+        }
+
+    def _task_params(self, instance_id: int, result: EngineResult) -> List[dict]:
+        return [{'bpmn_process_instance_id': instance_id, **task._asdict()} for task in result.tasks or ()]
+
+    async def _store_tasks(self, instance_id: int, result: EngineResult) -> None:
+        """Rewrite the task projection and timers of an advanced instance, in the same transaction as its state"""
+
+        if result.tasks is not None:
+            await self.repo_manager.get_repo(BpmnProcessInstanceTask).replace(
+                instance_id, [task._asdict() for task in result.tasks])
+        if result.timers is not None:
+            await self.repo_manager.get_repo(BpmnTimer).replace(
+                instance_id, [timer._asdict() for timer in result.timers])
+            self._notify_timers(result.timers)
+
+    async def _create_timers(self, results: List[Tuple[int, EngineResult]]) -> None:
+        timers = [{'bpmn_process_instance_id': instance_id, **timer._asdict()}
+                  for instance_id, result in results for timer in result.timers or ()]
+        if timers:
+            await self.repo_manager.get_repo(BpmnTimer).bulk_create(timers)
+            self._notify_timers([timer for _, result in results for timer in result.timers or ()])
+
+    def _notify_timers(self, timers: List[TimerRow]) -> None:
+        """Wake the timer scheduler up early if a new timer is due before it would otherwise look"""
+
+        if timers:
+            from bpmn.timer_scheduler import get_timer_scheduler
+            due_at = min(timer.due_at for timer in timers)
+            call_after_commit(self.repo_manager.session, lambda: get_timer_scheduler().notify(due_at))
+
+    async def run(self, process_instance: BpmnProcessInstance, data: Optional[dict] = None) -> BpmnProcessInstance:
+        """Run workflow to the next ready state"""
+
+        return await self._run(process_instance, data)
+
+    async def fire_timers(self, process_instance: BpmnProcessInstance) -> BpmnProcessInstance:
+        """Let the due timer events of an instance fire and run its engine tasks, without completing user tasks"""
+
+        return await self._run(process_instance, None, fire_timers=True)
+
+    async def _run(self, process_instance: BpmnProcessInstance, data: Optional[dict],
+                   fire_timers: bool = False) -> BpmnProcessInstance:
+        repo = self.repo_manager.get_repo(BpmnProcessInstance)
+        for attempt in range(settings.instance_update_retries + 1):
+            if attempt > 0:
+                logger.info(f'Process instance {process_instance.id} changed concurrently, retrying ({attempt})')
+                process_instance = await repo.reload(process_instance.id)
+            result = await self._advance(process_instance, data, await self._get_spec_source(process_instance),
+                                         fire_timers=fire_timers)
+            if result.state is None:
+                return process_instance
+            started = time.perf_counter()
+            # 只有当实例仍是读取时的版本才写入，否则说明期间被其它请求推进过
+            updated = await repo.compare_and_swap(process_instance.id, process_instance.version,
+                                                  self._state_params(result))
+            if updated is not None:
+                await self._store_tasks(updated.id, result)
+                ENGINE_PHASE_SECONDS.observe(time.perf_counter() - started, 'write', updated.bpmn_process_id)
+                if result.error is None:
+                    self._count_written(updated.bpmn_process_id, [result])
+                if result.workflow is not None and not result.workflow.is_completed():
+                    self._cache_workflow(updated, result.workflow, result.size)
+                return updated
+        raise ConcurrentUpdateError(f'Process instance {process_instance.id} was modified concurrently')
+
+    async def run_process_instances(
+            self, steps: List[Tuple[int, Optional[dict]]],
+            parallel: bool = False) -> List[Union[BpmnProcessInstance, Exception]]:
+        """Advance many instances, loading them in one query and writing them back together
+
+        Steps on different instances run concurrently if ``parallel`` is set;
+        steps on the same instance run in order, each on the result of the
+        previous one, and the instance is written once. Returns one entry per
+        step, either the updated instance or the error of that step.
+        """
+
+        repo = self.repo_manager.get_repo(BpmnProcessInstance)
+        instances = {instance.id: instance for instance in await repo.get_many({id for id, _ in steps})}
+        outcome: List[Union[BpmnProcessInstance, Exception, None]] = [None] * len(steps)
+        steps_by_instance: Dict[int, List[int]] = {}
+        for index, (id, _) in enumerate(steps):
+            if id in instances:
+                steps_by_instance.setdefault(id, []).append(index)
+            else:
+                outcome[index] = LookupError(f'Process instance with id {id} not found')
+
+        # 先在事件循环上取好 spec，引擎阶段不再访问数据库
+        spec_sources = {id: await self._get_spec_source(instances[id]) for id in steps_by_instance}
+
+        async def advance(id: int) -> Tuple[Optional[EngineResult], List[int]]:
+            result, done = None, []
+            for index in steps_by_instance[id]:
+                try:
+                    result = await self._advance(instances[id], steps[index][1], spec_sources[id], result)
+                    done.append(index)
+                    if result.error is not None:
+                        # 超出预算的步骤记录到实例上，之后的步骤不再执行
+                        break
+                except Exception as e:
+                    logger.warning(f'Failed to advance process instance {id}: {e}')
+                    outcome[index] = e
+                    # 失败的步骤可能已经改动了工作流对象，只保留上一步序列化后的状态
+                    if result is not None:
+                        result = result._replace(workflow=None)
+                    break
+            # 出错之后的步骤不再执行
+            for index in steps_by_instance[id][len(done) + 1:]:
+                outcome[index] = RuntimeError('Skipped after a previous step of this instance failed')
+            return result, done
+
+        if parallel:
+            results = await asyncio.gather(*[advance(id) for id in steps_by_instance])
+        else:
+            results = [await advance(id) for id in steps_by_instance]
+
+        # 所有写入都在同一个事务里，单个实例的版本冲突只影响它自己的步骤
+        for id, (result, done) in zip(steps_by_instance, results):
+            process_instance = instances[id]
+            if result is not None and result.state is not None:
+                started = time.perf_counter()
+                updated = await repo.compare_and_swap(id, process_instance.version, self._state_params(result))
+                if updated is None:
+                    error = ConcurrentUpdateError(f'Process instance {id} was modified concurrently')
+                    for index in done:
+                        outcome[index] = error
+                    continue
+                await self._store_tasks(id, result)
+                ENGINE_PHASE_SECONDS.observe(time.perf_counter() - started, 'write', updated.bpmn_process_id)
+                if result.error is None:
+                    self._count_written(updated.bpmn_process_id, [result])
+                if result.workflow is not None and not result.workflow.is_completed():
+                    self._cache_workflow(updated, result.workflow, result.size)
+                process_instance = updated
+            for index in done:
+                outcome[index] = process_instance
+        return outcome
+
+    async def _advance(self, process_instance: BpmnProcessInstance, data: Optional[dict],
+                       spec_source=None, previous: Optional[EngineResult] = None,
+                       fire_timers: bool = False) -> EngineResult:
+        """Run the engine phase of a step
+
+        ``spec_source`` comes from ``_get_spec_source`` so no DB I/O happens here;
+        ``previous`` chains several steps of one instance without writing in between.
+        """
+
+        spec_hash = process_instance.spec_hash
+        state = process_instance.state if previous is None else previous.state
+        if state is None:
+            # 上一步已经完成了工作流
+            return previous
+        executor = get_engine_executor()
+        if not executor.in_process:
+            result = await executor.run(
+                _advance_detached, process_instance.bpmn_process_id, spec_hash, spec_source, state, data, fire_timers)
+        else:
+            if previous is None:
+                workflow = get_workflow_cache().take(process_instance.id, process_instance.version)
+            else:
+                workflow = previous.workflow
+            result = await executor.run(
+                self._advance_workflow, workflow, spec_source, state, data, spec_hash is None, fire_timers)
+        self._observe(process_instance.bpmn_process_id, result)
+        if result.error is None:
+            return result
+        # 中断的步骤不写入，实例保持在这一步之前的状态并记录错误
+        logger.warning(f'Process instance {process_instance.id} exceeded its execution budget: {result.error}')
+        if previous is None:
+            previous = EngineResult(None, process_instance.state, process_instance.current_task, 0,
+                                    next_task_spec_id=process_instance.current_task_spec_id)
+        return previous._replace(workflow=None, error=result.error)
+
+    async def _get_spec_source(self, process_instance: BpmnProcessInstance):
+        """What the engine executor needs to rebuild the instance's spec: the spec itself or its XML"""
+
+        process_id, spec_hash = process_instance.bpmn_process_id, process_instance.spec_hash
+        if spec_hash is None:
+            return None
+        if get_engine_executor().in_process:
+            return await self._get_spec(process_id, spec_hash)
+        return await self._get_spec_xml(process_id, spec_hash)
+
+    def _cache_workflow(self, process_instance: BpmnProcessInstance, workflow: BpmnWorkflow, size: int) -> None:
+        """Keep the live workflow for the next step once the written state is committed"""
+
+        workflow_cache = get_workflow_cache()
+        if workflow_cache.enabled:
+            instance_id, version = process_instance.id, process_instance.version
+            call_after_commit(
+                self.repo_manager.session,
+                lambda: workflow_cache.put(instance_id, version, workflow, size))
+
+    async def load_workflow(self, process_instance: BpmnProcessInstance) -> BpmnWorkflow:
+        """Deserialize the workflow of an instance, reusing the cached spec it references"""
+
+        wf_spec = None
+        if process_instance.spec_hash is not None:
+            wf_spec = await self._get_spec(process_instance.bpmn_process_id, process_instance.spec_hash)
+        return await get_engine_executor().run_local(self._deserialize, process_instance.state, wf_spec)
+
+    async def inspect_workflow(self, process_instance: BpmnProcessInstance, inspect: Callable[[BpmnWorkflow], T]) -> T:
+        """Run a read-only function on the workflow of an instance, borrowing the cached one on a hit
+
+        The instance may have been loaded without its state, which is then only read on a miss.
+        """
+
+        with get_workflow_cache().borrow(process_instance.id, process_instance.version) as workflow:
+            if workflow is not None:
+                return inspect(workflow)
+        if 'state' in sa_inspect(process_instance).unloaded:
+            # 也可能是归档的实例
+            await self.repo_manager.get_repo(type(process_instance)).load_heavy_columns(process_instance)
+        return inspect(await self.load_workflow(process_instance))
+
+    def _deserialize(self, state: bytes, wf_spec=None) -> BpmnWorkflow:
+        with phase('decode'):
+            state = decode_state(state)
+        with phase('deserialize'):
+            workflow = self.serializer.deserialize_workflow(state, workflow_spec=wf_spec)
+        # 序列化器总是创建默认的脚本引擎
+        workflow.script_engine = CachedScriptEngine()
+        return workflow
+
+    def _start_workflow(self, process_id: int, name: str, xml_definition: str, spec_hash: str,
+                        data: Optional[dict] = None) -> EngineResult:
+        with PhaseTimings() as timings:
+            with timings.phase('parse'):
+                wf_spec = get_spec_cache().get(process_id, xml_definition, name, digest=spec_hash)
+            workflow = BpmnWorkflow(wf_spec, script_engine=CachedScriptEngine())
+            try:
+                with BudgetMeter(execution_budget(wf_spec)), timings.phase('engine'):
+                    result = self._start_to_next_state(workflow, xml_definition, data)
+            except BudgetExceeded as e:
+                logger.warning(f'Process {process_id} exceeded its execution budget while starting: {e}')
+                # 被中断的任务已标记为完成，无法继续；保存尚未执行的工作流，下次推进时从头开始
+                workflow = BpmnWorkflow(wf_spec, script_engine=CachedScriptEngine())
+                workflow.data.update(data or {})
+                result = self._result(workflow, self._serialize(workflow), '等待输入', None)._replace(error=str(e))
+        return result._replace(timings=timings.totals)
+
+    def _start_to_next_state(self, workflow: BpmnWorkflow, xml_definition: str,
+                             data: Optional[dict] = None) -> EngineResult:
         # 在创建实例时，先尝试执行到第一个用户任务
         # 如果遇到脚本任务错误，尝试恢复并返回用户任务
-        next_task = '等待输入'
+        next_task, next_task_spec_id = '等待输入', None
         try:
-            state, next_task = self._run_to_next_state(workflow, data)
+            state, next_task, next_task_spec_id = self._run_to_next_state(workflow, data)
         except WorkflowTaskExecException as e:
             # 捕获脚本任务执行错误，尝试恢复
             logger.warning(f"Script task failed during instance creation: {e}")
@@ -54,31 +434,33 @@ class BpmnRunner(object):
                 ready_tasks = workflow.get_ready_user_tasks()
                 if len(ready_tasks) > 0:
                     task = ready_tasks[0]
-                    state = self.serializer.serialize_workflow(workflow, include_spec=True)
-                    next_task = task.get_description()
+                    state = self._serialize(workflow)
+                    next_task, next_task_spec_id = task.get_description(), task.task_spec.name
                     logger.info(f"Recovered: returning user task {next_task}")
                 else:
                     # 如果无法获取用户任务，尝试从 BPMN XML 中查找第一个用户任务
                     logger.warning("No ready user tasks, trying to find first user task from BPMN")
                     # 从 XML 中查找第一个用户任务
-                    user_tasks = root.findall('.//{http://www.omg.org/spec/BPMN/20100524/MODEL}userTask')
+                    user_tasks = self._find_user_tasks(xml_definition)
                     if user_tasks:
                         first_user_task = user_tasks[0]
                         next_task = first_user_task.get('name', '等待输入')
+                        next_task_spec_id = first_user_task.get('id')
                         logger.info(f"Found first user task from BPMN: {next_task}")
                     # 序列化当前状态（即使有错误）
-                    state = self.serializer.serialize_workflow(workflow, include_spec=True)
+                    state = self._serialize(workflow)
             except Exception as e2:
                 # 如果无法恢复，尝试从 BPMN XML 中查找第一个用户任务
                 logger.warning(f"Failed to recover from script error: {e2}, trying to find user task from BPMN")
                 try:
-                    user_tasks = root.findall('.//{http://www.omg.org/spec/BPMN/20100524/MODEL}userTask')
+                    user_tasks = self._find_user_tasks(xml_definition)
                     if user_tasks:
                         first_user_task = user_tasks[0]
                         next_task = first_user_task.get('name', '等待输入')
+                        next_task_spec_id = first_user_task.get('id')
                         logger.info(f"Found first user task from BPMN: {next_task}")
                     # 序列化当前状态
-                    state = self.serializer.serialize_workflow(workflow, include_spec=True)
+                    state = self._serialize(workflow)
                 except Exception as e3:
                     # 如果完全无法恢复，重新抛出原始异常
                     logger.error(f"Completely failed to recover from script error: {e3}")
@@ -86,21 +468,82 @@ class BpmnRunner(object):
         except Exception as e:
             # 其他异常直接抛出
             raise
-        
-        repo = self.repo_manager.get_repo(BpmnProcessInstance)
-        return await repo.create({'bpmn_process_id': process.id, 'state': state, 'current_task': next_task})
 
-    async def run(self, process_instance: BpmnProcessInstance, data: Optional[dict] = None) -> BpmnProcessInstance:
-        """Run workflow to the next ready state"""
+        return self._result(workflow, state, next_task, next_task_spec_id)
 
-        workflow = self.serializer.deserialize_workflow(process_instance.state)
-        if workflow.is_completed():
-            return process_instance
-        state, next_task = self._run_to_next_state(workflow, data)
-        repo = self.repo_manager.get_repo(BpmnProcessInstance)
-        return await repo.update(process_instance.id, {'state': state, 'current_task': next_task})
+    def _advance_workflow(self, workflow: Optional[BpmnWorkflow], wf_spec, state: bytes,
+                          data: Optional[dict] = None, include_spec: bool = False,
+                          fire_timers: bool = False) -> EngineResult:
+        with PhaseTimings() as timings:
+            if workflow is None:
+                workflow = self._deserialize(state, wf_spec)
+            if workflow.is_completed():
+                return EngineResult(workflow, None, None, 0, timings=timings.totals)
+            # 旧格式的实例继续内嵌 spec，因为无法确定其 spec 对应的是哪个版本的 XML
+            try:
+                with BudgetMeter(execution_budget(workflow.spec)), timings.phase('engine'):
+                    if fire_timers:
+                        state, next_task, next_task_spec_id = self._fire_timers(workflow, include_spec)
+                    else:
+                        state, next_task, next_task_spec_id = self._run_to_next_state(workflow, data, include_spec)
+            except BudgetExceeded as e:
+                # 工作流停在被中断的任务中间，不能再使用
+                return EngineResult(None, None, None, 0, error=str(e), timings=timings.totals)
+            result = self._result(workflow, state, next_task, next_task_spec_id)
+        return result._replace(timings=timings.totals)
+
+    def _result(self, workflow: BpmnWorkflow, state: str, next_task: str,
+                next_task_spec_id: Optional[str]) -> EngineResult:
+        with phase('encode'):
+            encoded = encode_state(state)
+        with phase('project'):
+            tasks, timers = project_tasks(workflow), waiting_timers(workflow)
+        return EngineResult(workflow, encoded, next_task, len(state), tasks, next_task_spec_id, timers)
+
+    async def _get_spec(self, process_id: int, spec_hash: str):
+        spec_cache = get_spec_cache()
+        wf_spec = spec_cache.lookup(process_id, spec_hash)
+        if wf_spec is not None:
+            return wf_spec
+        xml_definition = await self._get_spec_xml(process_id, spec_hash)
+        return spec_cache.get(process_id, xml_definition, digest=spec_hash)
+
+    async def get_spec_xml(self, process_instance: BpmnProcessInstance) -> str:
+        """XML of the definition version an instance runs on"""
+
+        if process_instance.spec_hash is not None:
+            return await self._get_spec_xml(process_instance.bpmn_process_id, process_instance.spec_hash)
+        # 旧格式的实例没有记录版本，只能使用流程当前的定义
+        process = await self.repo_manager.get_repo(BpmnProcess).get(process_instance.bpmn_process_id)
+        if process is None:
+            raise LookupError(f'Process with id {process_instance.bpmn_process_id} not found')
+        return process.xml_definition
+
+    async def _get_spec_xml(self, process_id: int, spec_hash: str) -> str:
+        repo = self.repo_manager.get_repo(BpmnProcessSpec)
+        stored = await repo.find_one({'bpmn_process_id': process_id, 'spec_hash': spec_hash})
+        if stored is None:
+            raise LookupError(f'Spec {spec_hash} of process {process_id} is not stored')
+        return stored.xml_definition
+
+    async def _store_spec(self, process: BpmnProcess, spec_hash: str) -> None:
+        """Make sure the definition version referenced by new instances is stored"""
+
+        repo = self.repo_manager.get_repo(BpmnProcessSpec)
+        if await repo.find_one({'bpmn_process_id': process.id, 'spec_hash': spec_hash}) is None:
+            # 定义修改后第一批并发创建的实例会同时走到这里，插入要能容忍已经存在的行
+            await repo.store({
+                'bpmn_process_id': process.id,
+                'spec_hash': spec_hash,
+                'xml_definition': process.xml_definition
+            })
 
-    def _run_to_next_state(self, workflow: BpmnWorkflow, data: Optional[dict] = None) -> Tuple[str, str]:
+    def _serialize(self, workflow: BpmnWorkflow, include_spec: bool = False) -> str:
+        with phase('serialize'):
+            return self.serializer.serialize_workflow(workflow, include_spec=include_spec)
+
+    def _run_to_next_state(self, workflow: BpmnWorkflow, data: Optional[dict] = None,
+                           include_spec: bool = False) -> Tuple[str, str, Optional[str]]:
         if data is None:
             data = {}
         
@@ -111,7 +554,7 @@ class BpmnRunner(object):
         
         try:
             # 执行引擎步骤，但捕获脚本任务错误
-            workflow.do_engine_steps()
+            do_engine_steps(workflow)
             ready_tasks = workflow.get_ready_user_tasks()
             
             # while there's a ready user task, attempt to complete it
@@ -128,9 +571,9 @@ class BpmnRunner(object):
                         if not all_fields_have_data:
                             # 缺少数据，停止工作流，等待用户输入
                             logger.info(f"Waiting for user input for task: {task.get_description()}")
-                            state = self.serializer.serialize_workflow(workflow, include_spec=True)
+                            state = self._serialize(workflow, include_spec)
                             task_name = task.get_description()
-                            return state, task_name
+                            return state, task_name, task.task_spec.name
                         
                         # 所有字段都有数据，完成任务
                         for field in task.task_spec.form.fields:
@@ -142,7 +585,7 @@ class BpmnRunner(object):
                         logger.info(
                             f'Completed Task: ({task.get_name()}) {task.get_description()}')
                     # run intermediate engine tasks
-                    workflow.do_engine_steps()
+                    do_engine_steps(workflow)
                     # update remaining user tasks
                     ready_tasks = workflow.get_ready_user_tasks()
         except StopWorkflow:
@@ -155,9 +598,9 @@ class BpmnRunner(object):
                 ready_tasks = workflow.get_ready_user_tasks()
                 if len(ready_tasks) > 0:
                     task = ready_tasks[0]
-                    state = self.serializer.serialize_workflow(workflow, include_spec=True)
+                    state = self._serialize(workflow, include_spec)
                     task_name = task.get_description()
-                    return state, task_name
+                    return state, task_name, task.task_spec.name
             except Exception as e2:
                 logger.error(f"Failed to get ready user tasks after script error: {e2}")
             # 如果无法获取用户任务，重新抛出异常
@@ -167,14 +610,56 @@ class BpmnRunner(object):
             raise
         
         # serialize the current state of the workflow
-        state = self.serializer.serialize_workflow(workflow, include_spec=True)
+        state = self._serialize(workflow, include_spec)
+        next_task = self._get_next_task(workflow)
+        task_name = next_task.get_description() if next_task else 'END'
+        return state, task_name, next_task.task_spec.name if next_task else None
+
+    def _fire_timers(self, workflow: BpmnWorkflow, include_spec: bool = False) -> Tuple[str, str, Optional[str]]:
+        # 到期的定时事件变为 READY，随后的引擎任务执行到下一个用户任务或等待点
+        workflow.refresh_waiting_tasks()
+        do_engine_steps(workflow)
+        state = self._serialize(workflow, include_spec)
         next_task = self._get_next_task(workflow)
         task_name = next_task.get_description() if next_task else 'END'
-        return state, task_name
+        return state, task_name, next_task.task_spec.name if next_task else None
+
+    def _find_user_tasks(self, xml_definition: str) -> list:
+        """User task elements of a definition, in document order"""
+
+        # 只在脚本出错的恢复路径上使用，正常创建实例时无需再解析 XML
+        import xml.etree.ElementTree as ET
+        root = ET.fromstring(xml_definition)
+        return root.findall(f'.//{{{BPMN_NS}}}userTask')
 
     def _get_next_task(self, workflow: BpmnWorkflow):
         """Get the next ready task"""
 
         if workflow.is_completed():
             return None
-        return workflow.get_ready_user_tasks()[0]
+        # 没有可处理的用户任务时，工作流可能停在定时器等事件上
+        tasks = workflow.get_ready_user_tasks() or [
+            task for task in workflow.get_tasks(Task.WAITING)
+            if getattr(task.task_spec, 'event_definition', None) is not None]
+        return tasks[0]
+
+
+# 进程池模式下在子进程中执行：只传递可 pickle 的参数和结果，工作流对象留在子进程
+def _start_detached(*args) -> EngineResult:
+    try:
+        return BpmnRunner(None)._start_workflow(*args)._replace(workflow=None)
+    except Exception as e:
+        # SpiffWorkflow 的异常引用了任务对象，无法 pickle 回主进程
+        raise EngineError(str(e)) from None
+
+
+def _advance_detached(process_id: int, spec_hash: Optional[str], xml_definition: Optional[str], state: bytes,
+                      data: Optional[dict], fire_timers: bool = False) -> EngineResult:
+    try:
+        wf_spec = None
+        if spec_hash is not None:
+            wf_spec = get_spec_cache().get(process_id, xml_definition, digest=spec_hash)
+        result = BpmnRunner(None)._advance_workflow(None, wf_spec, state, data, spec_hash is None, fire_timers)
+        return result._replace(workflow=None)
+    except Exception as e:
+        raise EngineError(str(e)) from None
@@ -0,0 +1,210 @@
+import ctypes
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.task import Task
+
+from config import settings
+
+CAMUNDA_NS = 'http://camunda.org/schema/1.0/bpmn'
+
+
+class BudgetExceeded(BaseException):
+    """An engine phase ran out of its execution budget
+
+    Derived from ``BaseException`` like ``KeyboardInterrupt``, so neither
+    SpiffWorkflow nor a ``try/except Exception`` inside a script swallows it.
+    """
+
+    def __str__(self) -> str:
+        # 看门狗抛出的是不带信息的异常类
+        return super().__str__() or 'Exceeded the execution budget'
+
+
+class ExecutionBudget(NamedTuple):
+    """Limits of one engine phase, 0 means unlimited"""
+
+    seconds: float = 0
+    steps: int = 0
+
+
+def _cap(value: float, limit: float) -> float:
+    if value > 0 and limit > 0:
+        return min(value, limit)
+    return value or limit
+
+
+def parse_budget(process_elem) -> ExecutionBudget:
+    """Budget declared on a ``<bpmn:process>`` as ``camunda:property`` entries
+
+    ``maxEngineSeconds`` and ``maxEngineSteps`` inside the process's own
+    ``extensionElements``; missing or invalid values mean no per-process limit.
+    """
+
+    values = {}
+    if process_elem is not None:
+        for prop in process_elem.iterfind(f'./{{*}}extensionElements/{{{CAMUNDA_NS}}}properties/{{{CAMUNDA_NS}}}property'):
+            values[prop.get('name')] = prop.get('value')
+    budget = ExecutionBudget()
+    try:
+        if values.get('maxEngineSeconds'):
+            budget = budget._replace(seconds=float(values['maxEngineSeconds']))
+        if values.get('maxEngineSteps'):
+            budget = budget._replace(steps=int(values['maxEngineSteps']))
+    except ValueError as e:
+        logger.warning(f'Ignoring invalid execution budget of process {process_elem.get("id")}: {e}')
+    return budget
+
+
+def execution_budget(wf_spec) -> ExecutionBudget:
+    """Budget of a spec: its own limits, capped by the global ones"""
+
+    # 旧格式实例的 spec 内嵌在 state 中，没有解析出的预算
+    own = getattr(wf_spec, 'execution_budget', None) or ExecutionBudget()
+    return ExecutionBudget(_cap(own.seconds, settings.engine_max_seconds),
+                           int(_cap(own.steps, settings.engine_max_steps)))
+
+
+_local = threading.local()
+
+
+class _Watchdog:
+    """One daemon thread interrupting engine phases that pass their deadline
+
+    The interrupt is an asynchronous ``BudgetExceeded`` raised in the thread
+    running the phase, so scripts run at full speed and even a loop that never
+    returns to the engine is stopped. Each phase is interrupted at most once;
+    meters unregister under the same lock before their phase ends and clear an
+    interrupt that was not delivered yet, so it cannot leak into other code.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._wakeup = threading.Condition(self.lock)
+        self._deadlines: List[Tuple[float, int, 'BudgetMeter']] = []
+        self._counter = itertools.count()
+        self._pid: Optional[int] = None
+
+    def watch(self, meter: 'BudgetMeter') -> None:
+        with self.lock:
+            # 进程池的子进程不会继承父进程的线程
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._deadlines = []
+                threading.Thread(target=self._run, name='engine-budget-watchdog', daemon=True).start()
+            heapq.heappush(self._deadlines, (meter.deadline, next(self._counter), meter))
+            # 结束的阶段留在堆里直到到期，只有更早的截止时间才需要唤醒
+            if self._deadlines[0][2] is meter:
+                self._wakeup.notify()
+
+    def _run(self) -> None:
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                while self._deadlines and (not self._deadlines[0][2].active or self._deadlines[0][0] <= now):
+                    _, _, meter = heapq.heappop(self._deadlines)
+                    if meter.active:
+                        # 脚本用 except BaseException 吞掉中断时，由下一个引擎步骤的检查兜底
+                        _raise_in_thread(meter.thread_id, BudgetExceeded)
+                        meter.interrupted = True
+                timeout = self._deadlines[0][0] - now if self._deadlines else None
+                self._wakeup.wait(timeout)
+
+
+def _raise_in_thread(thread_id: int, exc_type: Optional[type]) -> None:
+    # exc_type 为 None 时清除尚未抛出的异步异常
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exc_type) if exc_type is not None else None)
+
+
+_watchdog = _Watchdog()
+
+
+class BudgetMeter:
+    """Enforces a budget on the engine phase running in the current thread
+
+    Engine steps are counted by ``do_engine_steps``, which also checks the
+    deadline between steps; a single step running past the deadline is
+    interrupted by the watchdog.
+    """
+
+    def __init__(self, budget: ExecutionBudget) -> None:
+        self.budget = budget
+        self.steps = 0
+        # 最近开始执行的引擎任务，超出预算时就是被中断的那个
+        self.task: Optional[Task] = None
+        self.deadline = time.monotonic() + budget.seconds if budget.seconds > 0 else None
+        self.thread_id = threading.get_ident()
+        self.active = False
+        self.interrupted = False
+        self._outer: Optional[BudgetMeter] = None
+
+    def __enter__(self) -> 'BudgetMeter':
+        self._outer = getattr(_local, 'meter', None)
+        _local.meter = self
+        if self.deadline is not None:
+            self.active = True
+            _watchdog.watch(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            try:
+                self._disarm()
+            except BudgetExceeded:
+                # 中断在阶段结束之后、取得锁之前送达：阶段本身已经完成，不算超出预算。
+                # 每个阶段最多被中断一次，再次撤销监视时不会再收到
+                self._disarm()
+        finally:
+            _local.meter = self._outer
+            # 看门狗的堆中还引用着 meter，不要让它拖住工作流
+            task, self.task = self.task, None
+        if exc_type is BudgetExceeded and not exc.args:
+            raise BudgetExceeded(self._time_message(task)) from None
+
+    def _disarm(self) -> None:
+        """Stop watching this phase and drop an interrupt that was raised but not delivered yet"""
+
+        if self.deadline is None:
+            return
+        with _watchdog.lock:
+            self.active = False
+            if self.interrupted:
+                _raise_in_thread(self.thread_id, None)
+                self.interrupted = False
+
+    def step(self, task: Task) -> None:
+        self.task = task
+        self.steps += 1
+        if 0 < self.budget.steps < self.steps:
+            raise BudgetExceeded(f'Exceeded the budget of {self.budget.steps} engine steps at {task.task_spec.name}')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded(self._time_message(task))
+
+    def _time_message(self, task: Optional[Task]) -> str:
+        where = f' at {task.task_spec.name}' if task is not None else ''
+        return f'Exceeded the budget of {self.budget.seconds:g}s{where}'
+
+
+def current_meter() -> Optional[BudgetMeter]:
+    return getattr(_local, 'meter', None)
+
+
+def do_engine_steps(workflow: BpmnWorkflow) -> None:
+    """``BpmnWorkflow.do_engine_steps`` counting each step against the current budget"""
+
+    assert not workflow.read_only
+    meter = current_meter()
+    engine_steps = [task for task in workflow.get_tasks(Task.READY) if workflow._is_engine_task(task.task_spec)]
+    while engine_steps:
+        for task in engine_steps:
+            if meter is not None:
+                meter.step(task)
+            task.complete()
+        engine_steps = [task for task in workflow.get_tasks(Task.READY) if workflow._is_engine_task(task.task_spec)]
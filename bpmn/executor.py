@@ -0,0 +1,78 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from config import settings
+from profiling import current_profile, profiled_call
+
+ENGINE_EXECUTOR_MODES = ('inline', 'thread', 'process')
+
+
+class EngineExecutor:
+    """Runs the CPU-bound engine phases (parse, deserialize, engine steps, serialize) off the event loop
+
+    ``inline`` keeps the old behaviour of running them on the loop. ``thread``
+    uses a thread pool, which keeps live workflows shareable with the workflow
+    cache. ``process`` sidesteps the GIL but only exchanges picklable state,
+    so workflows are always rebuilt in the worker process.
+    """
+
+    def __init__(self, mode: str = settings.engine_executor, workers: int = settings.engine_workers) -> None:
+        if mode not in ENGINE_EXECUTOR_MODES:
+            raise ValueError(f"Unknown engine executor '{mode}', expected one of {ENGINE_EXECUTOR_MODES}")
+        self.mode = mode
+        self.workers = workers
+        self._pool: Optional[Executor] = None
+        self._local_pool: Optional[Executor] = None
+
+    @property
+    def in_process(self) -> bool:
+        """Whether results such as live workflow objects stay in this process"""
+
+        return self.mode != 'process'
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run an engine phase in the configured executor"""
+
+        if self.mode == 'inline':
+            return func(*args)
+        if self._pool is None:
+            pool_class = ThreadPoolExecutor if self.mode == 'thread' else ProcessPoolExecutor
+            self._pool = pool_class(max_workers=self.workers)
+        return await self._submit(self._pool, func, *args)
+
+    async def run_local(self, func: Callable, *args) -> Any:
+        """Like ``run``, but for work whose result must stay in this process"""
+
+        if self.mode == 'thread':
+            return await self.run(func, *args)
+        if self.mode == 'inline':
+            return func(*args)
+        if self._local_pool is None:
+            self._local_pool = ThreadPoolExecutor(max_workers=self.workers)
+        return await self._submit(self._local_pool, func, *args)
+
+    async def _submit(self, pool: Executor, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        profile = current_profile()
+        if profile is None:
+            return await loop.run_in_executor(pool, partial(func, *args))
+        # 被分析的请求：在工作线程或进程中同样分析，结果合并到请求的分析中
+        result, data = await loop.run_in_executor(pool, partial(profiled_call, profile.mode, profile.interval,
+                                                                func, *args))
+        profile.merge(data)
+        return result
+
+    def shutdown(self) -> None:
+        for pool in (self._pool, self._local_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self._pool = self._local_pool = None
+
+
+engine_executor = EngineExecutor()
+
+
+def get_engine_executor() -> EngineExecutor:
+    return engine_executor
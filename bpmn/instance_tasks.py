@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.task import Task
+
+# 同一个 task spec 可能有多个任务（并行分支的预测副本、循环），投影时取优先级最高的状态
+STATE_PRIORITY = ('READY', 'WAITING', 'FUTURE', 'LIKELY', 'MAYBE', 'COMPLETED', 'CANCELLED')
+UNFINISHED_STATES = frozenset(('READY', 'WAITING', 'FUTURE', 'LIKELY', 'MAYBE'))
+_RANK = {state: rank for rank, state in enumerate(STATE_PRIORITY)}
+
+
+class TaskRow(NamedTuple):
+    """Projected state of one task spec of a workflow, as stored in ``bpmn_process_instance_task``"""
+
+    task_spec_id: str
+    task_id: str
+    name: str
+    state: str
+    # 需要人工处理的任务（用户任务），对应 get_ready_user_tasks
+    manual: bool
+    # 在任务树中第一次出现的顺序
+    position: int
+    completed_at: Optional[datetime]
+    state_changed_at: datetime
+
+
+def task_name(task: Task) -> str:
+    name = task.get_description()
+    if not name or name == 'None':
+        name = task.task_spec.name
+    return name
+
+
+def project_tasks(workflow: BpmnWorkflow) -> List[TaskRow]:
+    """Collapse the task tree of a workflow into one row per task spec"""
+
+    rows: Dict[str, TaskRow] = {}
+    for position, task in enumerate(workflow.get_tasks()):
+        spec_id = task.task_spec.name
+        state = Task.state_names[task.state]
+        changed_at = datetime.utcfromtimestamp(task.last_state_change)
+        completed_at = changed_at if task.state == Task.COMPLETED else None
+        row = rows.get(spec_id)
+        if row is None:
+            rows[spec_id] = TaskRow(spec_id, str(task.id), task_name(task), state,
+                                    not workflow._is_engine_task(task.task_spec), position, completed_at, changed_at)
+            continue
+        if _RANK[state] < _RANK[row.state]:
+            row = row._replace(task_id=str(task.id), name=task_name(task), state=state, state_changed_at=changed_at)
+        if row.completed_at is None and completed_at is not None:
+            row = row._replace(completed_at=completed_at)
+        rows[spec_id] = row
+    return list(rows.values())
@@ -0,0 +1,186 @@
+import asyncio
+import weakref
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from loguru import logger
+
+from bpmn.bpmn_runner import BpmnRunner
+from config import settings
+from db import AsyncSessionLocal, call_after_commit
+from db.models import BpmnJob, BpmnProcess, BpmnProcessInstance
+from db.repos import RepoManager
+
+JOB_KINDS = ('create', 'run')
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class JobReclaimed(Exception):
+    """The job no longer belongs to the attempt that executed it"""
+
+
+class JobWorker:
+    """Runs create and run requests in the background
+
+    Jobs are rows of ``bpmn_job``; the in-process asyncio queue only carries
+    their ids, so queued jobs survive a restart and are picked up again by
+    ``start``. A job's result is written in the same transaction as the
+    instance it creates or advances, and only if the job is still in the
+    attempt that claimed it, so a job is never applied twice. Jobs left
+    running by a process that exited are requeued once they are older than
+    ``stale_after``.
+    """
+
+    def __init__(self, workers: int = settings.job_workers, stale_after: float = settings.job_stale_after) -> None:
+        self.workers = workers
+        self.stale_after = stale_after
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # 同一实例的 run 任务按入队顺序依次执行
+        self._instance_locks: 'weakref.WeakValueDictionary[int, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Requeue unfinished jobs and start the worker tasks"""
+
+        if self.running or self.workers <= 0:
+            return
+        self._queue = asyncio.Queue()
+        async with AsyncSessionLocal.begin() as session:
+            repo = RepoManager(session=session).get_repo(BpmnJob)
+            # 其它进程可能正在执行 running 状态的任务，只重新执行超时的
+            await repo.requeue_stale(datetime.utcnow() - timedelta(seconds=self.stale_after))
+            pending = await repo.queued()
+        for job in pending:
+            self._queue.put_nowait((job.id, job.bpmn_process_instance_id))
+        if pending:
+            logger.info(f'Resuming {len(pending)} queued jobs')
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._requeue_stale_loop()))
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks; interrupted jobs are resumed by the next ``start``"""
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def join(self) -> None:
+        """Wait until every job queued so far has been executed"""
+
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def submit(self, repo_manager: RepoManager, kind: str, process_id: int,
+                     instance_id: Optional[int] = None, data: Optional[dict] = None) -> BpmnJob:
+        """Store a job in the request's transaction, it is queued once that commits"""
+
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}', expected one of {JOB_KINDS}")
+        job = await repo_manager.get_repo(BpmnJob).create({
+            'kind': kind,
+            'bpmn_process_id': process_id,
+            'bpmn_process_instance_id': instance_id,
+            'data': data
+        })
+        job_id = job.id
+        call_after_commit(repo_manager.session, lambda: self.enqueue(job_id, instance_id))
+        return job
+
+    def enqueue(self, job_id: int, instance_id: Optional[int] = None) -> None:
+        # worker 未启动时任务留在表中，下次 start 时恢复
+        if self._queue is not None:
+            self._queue.put_nowait((job_id, instance_id))
+
+    async def _requeue_stale_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.stale_after)
+            try:
+                async with AsyncSessionLocal.begin() as session:
+                    stale = await RepoManager(session=session).get_repo(BpmnJob).requeue_stale(
+                        datetime.utcnow() - timedelta(seconds=self.stale_after))
+                for job_id, instance_id in stale:
+                    self.enqueue(job_id, instance_id)
+                if stale:
+                    logger.warning(f'Requeued {len(stale)} stale running jobs')
+            except Exception:
+                logger.exception('Requeueing stale jobs failed')
+
+    async def _work(self) -> None:
+        while True:
+            job_id, instance_id = await self._queue.get()
+            try:
+                if instance_id is None:
+                    await self._execute(job_id)
+                else:
+                    # 取出任务后立即加锁（中间没有 await），同一实例的任务按出队顺序执行
+                    lock = self._instance_locks.get(instance_id)
+                    if lock is None:
+                        lock = self._instance_locks[instance_id] = asyncio.Lock()
+                    async with lock:
+                        await self._execute(job_id)
+            except Exception:
+                logger.exception(f'Job {job_id} could not be executed')
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job_id: int) -> None:
+        async with AsyncSessionLocal.begin() as session:
+            repo = RepoManager(session=session).get_repo(BpmnJob)
+            job = await repo.get(job_id)
+            if job is None:
+                return
+            attempt = job.attempts + 1
+            if not await repo.transition(job_id, 'queued', {
+                    'status': 'running', 'started_at': datetime.utcnow(), 'attempts': attempt}):
+                # 已被执行或被其它 worker 领取
+                return
+            kind, process_id, instance_id, data = job.kind, job.bpmn_process_id, job.bpmn_process_instance_id, job.data
+
+        try:
+            await self._apply(job_id, attempt, kind, process_id, instance_id, data)
+        except JobReclaimed as e:
+            logger.warning(str(e))
+        except Exception as e:
+            logger.warning(f'Job {job_id} failed: {e}')
+            async with AsyncSessionLocal.begin() as session:
+                await RepoManager(session=session).get_repo(BpmnJob).transition(job_id, 'running', {
+                    'status': 'failed', 'error': str(e) or type(e).__name__, 'finished_at': datetime.utcnow()},
+                    attempts=attempt)
+
+    async def _apply(self, job_id: int, attempt: int, kind: str, process_id: int, instance_id: Optional[int],
+                     data: Optional[dict]) -> None:
+        async with AsyncSessionLocal.begin() as session:
+            repo_manager = RepoManager(session=session)
+            bpmn_runner = BpmnRunner(repo_manager)
+            if kind == 'create':
+                process = await repo_manager.get_repo(BpmnProcess).get(process_id)
+                if process is None:
+                    raise LookupError(f'Process with id {process_id} not found')
+                process_instance = await bpmn_runner.create_process_instance(process, data)
+            else:
+                process_instance = await repo_manager.get_repo(BpmnProcessInstance).get(instance_id)
+                if process_instance is None:
+                    raise LookupError(f'Process instance with id {instance_id} not found')
+                process_instance = await bpmn_runner.run(process_instance, data)
+            # 超出执行预算时实例记录了错误，任务也记为失败
+            if not await repo_manager.get_repo(BpmnJob).transition(job_id, 'running', {
+                'status': 'failed' if process_instance.error else 'done',
+                'bpmn_process_instance_id': process_instance.id,
+                'error': process_instance.error,
+                'finished_at': datetime.utcnow()
+            }, attempts=attempt):
+                # 任务已被重新入队并由其它 worker 领取，回滚本次执行的结果
+                raise JobReclaimed(f'Job {job_id} was reclaimed while attempt {attempt} ran, its result is discarded')
+
+
+job_worker = JobWorker()
+
+
+def get_job_worker() -> JobWorker:
+    return job_worker
@@ -0,0 +1,126 @@
+import sys
+import traceback
+from collections import OrderedDict
+from threading import Lock
+from types import CodeType
+from typing import Dict, Tuple
+
+from SpiffWorkflow.bpmn.BpmnScriptEngine import BpmnScriptEngine
+from SpiffWorkflow.bpmn.PythonScriptEngine import Box
+from SpiffWorkflow.exceptions import WorkflowTaskExecException
+
+from config import settings
+
+
+class ScriptCache:
+    """LRU cache of compiled scripts and expressions, keyed by source
+
+    Sources are the same for every instance of a spec version (and usually
+    across versions too), so each script task and gateway condition is compiled
+    once per process instead of once per execution.
+    """
+
+    def __init__(self, maxsize: int = settings.script_cache_size) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._codes: 'OrderedDict[Tuple[str, str], CodeType]' = OrderedDict()
+        self._lock = Lock()
+
+    def compile(self, source: str, mode: str) -> CodeType:
+        key = (mode, source)
+        with self._lock:
+            code = self._codes.get(key)
+            if code is not None:
+                self._codes.move_to_end(key)
+                self.hits += 1
+                return code
+            self.misses += 1
+        # 和 exec / eval 直接执行字符串时一样使用 <string>，出错时才能定位到脚本行号
+        code = compile(source, '<string>', mode)
+        if self.maxsize > 0:
+            with self._lock:
+                self._codes[key] = code
+                while len(self._codes) > self.maxsize:
+                    self._codes.popitem(last=False)
+        return code
+
+    def contains(self, source: str, mode: str) -> bool:
+        """Whether a source is cached, without counting a hit or a miss or touching the LRU order"""
+
+        with self._lock:
+            return (mode, source) in self._codes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._codes.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._codes), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+script_cache = ScriptCache()
+
+
+def get_script_cache() -> ScriptCache:
+    return script_cache
+
+
+class CachedScriptEngine(BpmnScriptEngine):
+    """``BpmnScriptEngine`` executing precompiled code from the shared ``ScriptCache``
+
+    The engine updates its globals with task data on every call, so each
+    workflow still gets its own instance; only the code objects are shared.
+    """
+
+    def __init__(self, cache: ScriptCache = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.cache = cache or get_script_cache()
+
+    def validateExpression(self, text):
+        if text is None:
+            return
+        # 只检查能否按表达式编译，命中和未命中由随后的 _eval 统计，每次求值只计一次
+        if self.cache.contains(text, 'eval'):
+            return text, True
+        try:
+            compile(text, '<string>', 'eval')
+            return text, True
+        except SyntaxError:
+            # 其余情况（语句、DMN 的比较片段）交给父类解析
+            return super().validateExpression(text)
+
+    def _eval(self, expression, external_methods={}, **kwargs):
+        lcls = {}
+        lcls.update(kwargs)
+        globals = self.globals
+        for x in lcls.keys():
+            if isinstance(lcls[x], dict):
+                lcls[x] = Box(lcls[x])
+        globals.update(lcls)
+        globals.update(external_methods)
+        return eval(self.cache.compile(expression, 'eval'), globals, lcls)
+
+    def execute(self, task, script, data, external_methods=None):
+        if external_methods is None:
+            external_methods = {}
+        globals = self.globals
+
+        self.convertToBox(data)
+        globals.update(data)
+        globals.update(external_methods)
+        try:
+            exec(self.cache.compile(script, 'exec'), globals, data)
+        except Exception as err:
+            # 与 PythonScriptEngine.execute 相同的错误信息
+            detail = err.args[0] if len(err.args) > 0 else err.__class__.__name__
+            line_number = 0
+            error_line = ''
+            tb = sys.exc_info()[2]
+            for frame_summary in traceback.extract_tb(tb):
+                if frame_summary.filename == '<string>':
+                    line_number = frame_summary.lineno
+                    error_line = script.splitlines()[line_number - 1]
+            raise WorkflowTaskExecException(task, detail, err, line_number, error_line)
+        self.convertFromBox(data)
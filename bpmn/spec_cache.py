@@ -0,0 +1,111 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from lxml import etree
+from SpiffWorkflow.camunda.parser.CamundaParser import CamundaParser
+from SpiffWorkflow.specs import WorkflowSpec
+
+from bpmn.budget import parse_budget
+from config import settings
+
+BPMN_NS = 'http://www.omg.org/spec/BPMN/20100524/MODEL'
+
+
+def xml_hash(xml_definition: str) -> str:
+    """Content hash of a process definition"""
+
+    return hashlib.sha256(xml_definition.encode('utf-8')).hexdigest()
+
+
+def parse_spec(xml_definition: str, default_name: Optional[str] = None) -> WorkflowSpec:
+    """Parse a bpmn definition from memory and return the spec of its process"""
+
+    root = etree.fromstring(xml_definition.encode('utf-8'))
+    parser = CamundaParser()
+    parser.add_bpmn_xml(etree.ElementTree(root))
+    # 从 XML 中提取 process id（不是 name）
+    process_elem = root.find(f'.//{{{BPMN_NS}}}process')
+    process_id = process_elem.get('id') if process_elem is not None else default_name
+    spec = parser.get_spec(process_id)
+    spec.execution_budget = parse_budget(process_elem)
+    return spec
+
+
+class SpecCache:
+    """Process-wide LRU cache of parsed workflow specs
+
+    Entries are keyed by ``(BpmnProcess.id, xml hash)`` so an edited definition
+    never resolves to a stale spec, even before it is explicitly invalidated.
+    """
+
+    def __init__(self, maxsize: int = settings.spec_cache_size) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._specs: 'OrderedDict[Tuple[int, str], WorkflowSpec]' = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, process_id: int, xml_definition: str, default_name: Optional[str] = None,
+            digest: Optional[str] = None) -> WorkflowSpec:
+        """Return the spec for a definition, parsing it on a miss"""
+
+        key = (process_id, digest or xml_hash(xml_definition))
+        spec = self.lookup(*key)
+        if spec is not None:
+            return spec
+
+        # 解析放在锁外，避免阻塞其它流程的命中
+        spec = parse_spec(xml_definition, default_name)
+        with self._lock:
+            self._specs[key] = spec
+            self._specs.move_to_end(key)
+            while len(self._specs) > self.maxsize:
+                self._specs.popitem(last=False)
+                self.evictions += 1
+        return spec
+
+    def lookup(self, process_id: int, digest: str) -> Optional[WorkflowSpec]:
+        """Return the cached spec for a definition hash, or None on a miss"""
+
+        key = (process_id, digest)
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is None:
+                self.misses += 1
+                return None
+            self._specs.move_to_end(key)
+            self.hits += 1
+            return spec
+
+    def invalidate(self, process_id: int) -> int:
+        """Drop every cached spec of a process, returns the number of dropped entries"""
+
+        with self._lock:
+            keys = [key for key in self._specs if key[0] == process_id]
+            for key in keys:
+                del self._specs[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._specs.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._specs),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+spec_cache = SpecCache()
+
+
+def get_spec_cache() -> SpecCache:
+    return spec_cache
@@ -0,0 +1,82 @@
+import lzma
+import zlib
+from typing import Dict, Optional, Union
+
+from config import settings
+
+# 编码后的状态以 MAGIC + codec id 开头；旧数据是未压缩的 JSON，总是以 '{' 开头
+MAGIC = b'DKS'
+HEADER_SIZE = len(MAGIC) + 1
+
+
+class StateCodec:
+    """Compression codec for serialized workflow state"""
+
+    id: int = 0
+    name: str = 'raw'
+
+    def __init__(self, level: int = settings.state_codec_level) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec(StateCodec):
+    id = 1
+    name = 'zlib'
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class LzmaCodec(StateCodec):
+    id = 2
+    name = 'lzma'
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+
+CODECS: Dict[str, type] = {codec.name: codec for codec in (StateCodec, ZlibCodec, LzmaCodec)}
+_CODECS_BY_ID: Dict[int, StateCodec] = {codec.id: codec() for codec in CODECS.values()}
+
+
+def get_state_codec(name: Optional[str] = None) -> StateCodec:
+    name = name or settings.state_codec
+    if name not in CODECS:
+        raise ValueError(f"Unknown state codec '{name}', expected one of {sorted(CODECS)}")
+    return CODECS[name]()
+
+
+def encode_state(state: str, codec: Optional[StateCodec] = None) -> bytes:
+    """Encode a serialized workflow for storage in BpmnProcessInstance.state"""
+
+    codec = codec or _default_codec
+    return MAGIC + bytes((codec.id,)) + codec.compress(state.encode('utf-8'))
+
+
+def decode_state(blob: Union[bytes, str]) -> str:
+    """Decode a stored state, accepting both framed and legacy uncompressed rows"""
+
+    if isinstance(blob, str):
+        return blob
+    if not blob.startswith(MAGIC):
+        return bytes(blob).decode('utf-8')
+    codec_id = blob[len(MAGIC)]
+    codec = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f'Unknown state codec id {codec_id}')
+    return codec.decompress(blob[HEADER_SIZE:]).decode('utf-8')
+
+
+_default_codec = get_state_codec()
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from loguru import logger
+
+from bpmn.bpmn_runner import BpmnRunner, ConcurrentUpdateError
+from config import settings
+from db import AsyncSessionLocal
+from db.models import BpmnProcessInstance, BpmnTimer
+from db.repos import RepoManager
+
+
+class TimerScheduler:
+    """Fires the timer events instances are waiting on
+
+    ``BpmnRunner`` keeps ``bpmn_timer`` in step with every state it writes. The
+    scheduler only reads the earliest due rows through the ``due_at`` index,
+    sleeps until the next one is due, and is woken up early when a commit adds
+    an earlier timer, so its cost does not grow with the number of pending timers.
+    """
+
+    def __init__(self, batch_size: int = settings.timer_batch_size,
+                 poll_interval: float = settings.timer_poll_interval,
+                 retry_delay: float = settings.timer_retry_delay) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.fired = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # 当前等待到的时间，更早的新定时器才需要唤醒
+        self._next_wake: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self.running or not settings.timer_scheduler_enabled:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = self._wakeup = self._next_wake = None
+
+    def notify(self, due_at: datetime) -> None:
+        """A timer due at ``due_at`` was committed"""
+
+        if self._wakeup is not None and (self._next_wake is None or due_at < self._next_wake):
+            self._wakeup.set()
+
+    async def fire_due(self, now: Optional[datetime] = None) -> int:
+        """Advance one batch of instances with due timers, returns how many were processed"""
+
+        now = now or datetime.utcnow()
+        async with AsyncSessionLocal.begin() as session:
+            repo_manager = RepoManager(session=session)
+            timer_repo = repo_manager.get_repo(BpmnTimer)
+            instance_ids = await timer_repo.due(now, self.batch_size)
+            if not instance_ids:
+                return 0
+            bpmn_runner = BpmnRunner(repo_manager)
+            # 一批实例在同一个事务中写入
+            for instance in await repo_manager.get_repo(BpmnProcessInstance).get_many(instance_ids):
+                try:
+                    if (await bpmn_runner.fire_timers(instance)).error:
+                        self.failed += 1
+                    else:
+                        self.fired += 1
+                except ConcurrentUpdateError:
+                    # 实例刚被其它请求推进过，它的定时器也已经随之更新
+                    logger.info(f'Process instance {instance.id} changed while firing its timers')
+                except Exception as e:
+                    logger.warning(f'Failed to fire timers of process instance {instance.id}: {e}')
+                    self.failed += 1
+            # 仍然到期的定时器（执行失败，或引擎认为还没到时间）推迟重试，避免反复空转
+            await timer_repo.postpone(instance_ids, now, now + timedelta(seconds=self.retry_delay))
+        return len(instance_ids)
+
+    async def _next_due_at(self) -> Optional[datetime]:
+        async with AsyncSessionLocal() as session:
+            return await RepoManager(session=session).get_repo(BpmnTimer).next_due_at()
+
+    async def _loop(self) -> None:
+        while True:
+            # 处理期间提交的定时器都会唤醒下一轮
+            self._wakeup.clear()
+            self._next_wake = None
+            try:
+                if await self.fire_due():
+                    continue
+                now = datetime.utcnow()
+                # 其它进程写入的定时器不会通知本进程，最多等待 poll_interval
+                self._next_wake = now + timedelta(seconds=self.poll_interval)
+                due_at = await self._next_due_at()
+                if due_at is not None and due_at < self._next_wake:
+                    self._next_wake = due_at
+            except Exception:
+                logger.exception('Timer scheduler failed')
+                self._next_wake = datetime.utcnow() + timedelta(seconds=self.retry_delay)
+            delay = (self._next_wake - datetime.utcnow()).total_seconds()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 0) + 0.001)
+            except asyncio.TimeoutError:
+                pass
+
+
+timer_scheduler = TimerScheduler()
+
+
+def get_timer_scheduler() -> TimerScheduler:
+    return timer_scheduler
@@ -0,0 +1,70 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, NamedTuple, Optional
+
+from SpiffWorkflow.bpmn.specs.event_definitions import CycleTimerEventDefinition, TimerEventDefinition
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+from SpiffWorkflow.task import Task
+
+# SpiffWorkflow 在任务的 internal_data 中以本地时间记录计时开始的时间
+SPIFF_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class TimerRow(NamedTuple):
+    """A timer event an instance is waiting on, as stored in ``bpmn_timer``"""
+
+    task_spec_id: str
+    # UTC，和其它时间列一致
+    due_at: datetime
+
+
+def _local_to_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def timer_due_at(task: Task) -> Optional[datetime]:
+    """When a waiting timer event fires, mirroring ``TimerEventDefinition.has_fired``
+
+    Returns None for tasks that are not timers, or whose expression cannot be
+    evaluated or will never fire again.
+    """
+
+    definition = getattr(task.task_spec, 'event_definition', None)
+    if not isinstance(definition, TimerEventDefinition):
+        return None
+    try:
+        value = task.workflow.script_engine.evaluate(task, definition.dateTime)
+        if isinstance(definition, CycleTimerEventDefinition):
+            repeat, value = value
+            if task.internal_data.get('repeat_count', 0) >= repeat:
+                return None
+    except Exception:
+        return None
+
+    if isinstance(value, timedelta):
+        start_time = task.internal_data.get('start_time')
+        if start_time is None:
+            # 计时还没开始（第一次检查时才记录开始时间），尽快刷新一次
+            return datetime.utcnow()
+        return _local_to_utc(datetime.strptime(start_time, SPIFF_TIME_FORMAT) + value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return _local_to_utc(value)
+    if isinstance(value, date):
+        # has_fired 比较的是 date.today() > value，即第二天零点
+        return _local_to_utc(datetime.combine(value + timedelta(days=1), time()))
+    return None
+
+
+def waiting_timers(workflow: BpmnWorkflow) -> List[TimerRow]:
+    """Due times of the timer events a workflow is waiting on, one per task spec"""
+
+    timers = {}
+    for task in workflow.get_tasks(Task.WAITING):
+        due_at = timer_due_at(task)
+        if due_at is None:
+            continue
+        spec_id = task.task_spec.name
+        if spec_id not in timers or due_at < timers[spec_id].due_at:
+            timers[spec_id] = TimerRow(spec_id, due_at)
+    return list(timers.values())
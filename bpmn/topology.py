@@ -0,0 +1,125 @@
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from bpmn.instance_tasks import UNFINISHED_STATES, TaskRow
+from bpmn.spec_cache import BPMN_NS
+from config import settings
+
+TASK_TYPES = ('userTask', 'scriptTask', 'serviceTask', 'task')
+
+
+class TopologyGraph(NamedTuple):
+    """Static part of a task topology, shared by every instance of a definition version"""
+
+    # 有名称的任务节点 {'name', 'id', 'type'}，按类型和文档顺序排列
+    tasks: List[dict]
+    start_events: List[dict]
+    end_events: List[dict]
+    edges: List[dict]
+
+
+def build_topology_graph(xml_definition: str) -> TopologyGraph:
+    """Parse the nodes and sequence flows of a bpmn definition"""
+
+    root = ET.fromstring(xml_definition)
+    tasks = []
+    for task_type in TASK_TYPES:
+        for task in root.iter(f'{{{BPMN_NS}}}{task_type}'):
+            if task.get('name', ''):
+                tasks.append({'name': task.get('name'), 'id': task.get('id', ''), 'type': task_type})
+    start_events = [{'id': event.get('id', ''), 'name': event.get('name', '开始')}
+                    for event in root.iter(f'{{{BPMN_NS}}}startEvent')]
+    end_events = [{'id': event.get('id', ''), 'name': event.get('name', '结束')}
+                  for event in root.iter(f'{{{BPMN_NS}}}endEvent')]
+    edges = []
+    for flow in root.iter(f'{{{BPMN_NS}}}sequenceFlow'):
+        source, target = flow.get('sourceRef', ''), flow.get('targetRef', '')
+        if source and target:
+            edges.append({'id': flow.get('id', ''), 'source': source, 'target': target, 'name': flow.get('name', '')})
+    return TopologyGraph(tasks, start_events, end_events, edges)
+
+
+def instance_topology(graph: TopologyGraph, tasks: Sequence[TaskRow]) -> dict:
+    """Overlay the projected task states of one instance on the static graph
+
+    ``tasks`` are ``TaskRow``-like objects ordered by position, either stored
+    ``BpmnProcessInstanceTask`` rows or ``project_tasks`` of a live workflow.
+    """
+
+    # 节点状态按 BPMN 元素 id（即 task_spec_id）判断，同名任务不会互相影响
+    task_ids = {task['id'] for task in graph.tasks}
+    completed_ids = {task.task_spec_id for task in tasks if task.completed_at is not None}
+    completed_tasks = [{'name': task.name, 'id': task.task_id, 'state': 'completed'} for task in tasks
+                       if task.task_spec_id in task_ids and task.completed_at is not None]
+
+    is_completed = not any(task.state in UNFINISHED_STATES for task in tasks)
+    ready_tasks = [task for task in tasks if task.state == 'READY' and task.manual]
+    if not ready_tasks and not is_completed:
+        ready_tasks = [task for task in tasks if task.state == 'READY']
+    current_ids = {task.task_spec_id for task in ready_tasks}
+
+    def state_of(node_id: str) -> str:
+        if node_id in current_ids:
+            return 'current'
+        return 'completed' if node_id in completed_ids else 'future'
+
+    nodes = [{**event, 'type': 'startEvent', 'state': 'completed' if event['id'] in completed_ids else 'current'}
+             for event in graph.start_events]
+    nodes += [{**task, 'state': state_of(task['id'])} for task in graph.tasks]
+    nodes += [{**event, 'type': 'endEvent', 'state': 'current' if is_completed else 'future'}
+              for event in graph.end_events]
+    return {
+        'is_completed': is_completed,
+        'completed_tasks': completed_tasks,
+        'current_tasks': [{'name': task.name, 'id': task.task_id, 'state': 'current'} for task in ready_tasks],
+        'future_tasks': [{'name': task['name'], 'id': task['id'], 'state': 'future'} for task in graph.tasks
+                         if task['id'] not in completed_ids and task['id'] not in current_ids],
+        'nodes': nodes,
+        'edges': graph.edges,
+    }
+
+
+class TopologyCache:
+    """LRU cache of static topology graphs keyed by definition hash"""
+
+    def __init__(self, maxsize: int = settings.topology_cache_size) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._graphs: 'OrderedDict[str, TopologyGraph]' = OrderedDict()
+        self._lock = Lock()
+
+    def lookup(self, digest: str) -> Optional[TopologyGraph]:
+        with self._lock:
+            graph = self._graphs.get(digest)
+            if graph is None:
+                self.misses += 1
+                return None
+            self._graphs.move_to_end(digest)
+            self.hits += 1
+            return graph
+
+    def put(self, digest: str, graph: TopologyGraph) -> TopologyGraph:
+        with self._lock:
+            self._graphs[digest] = graph
+            self._graphs.move_to_end(digest)
+            while len(self._graphs) > self.maxsize:
+                self._graphs.popitem(last=False)
+        return graph
+
+    def clear(self) -> None:
+        with self._lock:
+            self._graphs.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._graphs), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+topology_cache = TopologyCache()
+
+
+def get_topology_cache() -> TopologyCache:
+    return topology_cache
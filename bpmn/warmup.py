@@ -0,0 +1,160 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+from SpiffWorkflow.specs import WorkflowSpec
+
+from bpmn.executor import get_engine_executor
+from bpmn.script_engine import get_script_cache
+from bpmn.spec_cache import get_spec_cache, xml_hash
+from config import settings
+from db import AsyncSessionLocal
+from db.models import BpmnProcess
+from db.repos import RepoManager
+
+# 每次从数据库读取的流程定义数
+PAGE_SIZE = 100
+
+
+def precompile_scripts(spec: WorkflowSpec) -> int:
+    """Compile the scripts and gateway conditions of a spec into the script cache, returns how many"""
+
+    cache = get_script_cache()
+    compiled = 0
+    for task_spec in spec.task_specs.values():
+        script = getattr(task_spec, 'script', None)
+        if script:
+            cache.compile(script, 'exec')
+            compiled += 1
+        for condition, _ in getattr(task_spec, 'cond_task_specs', None) or ():
+            expression = condition.args[0] if getattr(condition, 'args', None) else None
+            if not isinstance(expression, str):
+                continue
+            try:
+                cache.compile(expression, 'eval')
+                compiled += 1
+            except SyntaxError:
+                # 不能按表达式编译的条件由脚本引擎的父类处理，执行时才解析
+                pass
+    return compiled
+
+
+def warm_process(process_id: int, xml_definition: str, name: Optional[str], digest: str) -> float:
+    """Parse a definition into the spec cache and precompile its scripts, returns the seconds it took"""
+
+    started = time.perf_counter()
+    spec = get_spec_cache().get(process_id, xml_definition, name, digest=digest)
+    precompile_scripts(spec)
+    return time.perf_counter() - started
+
+
+class ProcessWarmer:
+    """Preloads the stored process definitions after a restart
+
+    All stored definitions are parsed, validated and have their scripts
+    compiled before the first request needs them, so the parse cost and
+    SpiffWorkflow's lazy imports are not paid on the request path. They are
+    loaded oldest first, so when there are more than the spec cache holds the
+    most recently updated ones are the ones left in it. ``ready`` turns true
+    once every definition was loaded, including when some of them failed to
+    parse; a failed run (e.g. the database is unavailable) is reported in
+    ``error`` and retried after ``retry_delay`` seconds.
+    """
+
+    def __init__(self, parallel: bool = settings.warmup_parallel,
+                 retry_delay: float = settings.warmup_retry_delay) -> None:
+        self.parallel = parallel
+        self.retry_delay = retry_delay
+        self.ready = not settings.warmup_enabled
+        self.warmed: Dict[int, float] = {}
+        self.failed: Dict[int, str] = {}
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self._task is not None or not settings.warmup_enabled:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while not await self.warm_up():
+            await asyncio.sleep(self.retry_delay)
+
+    async def warm_up(self) -> bool:
+        """Warm up all stored definitions, returns False when the run failed as a whole"""
+
+        started = time.perf_counter()
+        self.warmed.clear()
+        self.failed.clear()
+        try:
+            executor = get_engine_executor()
+
+            async def warm(process_id: int, xml_definition: str, name: str) -> None:
+                try:
+                    # 解析结果要留在本进程的 spec 缓存中，不能交给进程池
+                    seconds = await executor.run_local(
+                        warm_process, process_id, xml_definition, name, xml_hash(xml_definition))
+                except Exception as e:
+                    self.failed[process_id] = str(e)
+                    logger.warning(f'Failed to warm up process {process_id} ({name}): {e}')
+                    return
+                self.warmed[process_id] = seconds
+                logger.info(f'Warmed up process {process_id} ({name}) in {seconds * 1000:.1f} ms')
+
+            cursor = None
+            while True:
+                # 按 updated_at 升序分页读取，spec 缓存放不下时最后留下的是最近更新的定义
+                async with AsyncSessionLocal() as session:
+                    processes, cursor = await RepoManager(session=session).get_repo(BpmnProcess).page(
+                        order_by='updated_at', after=cursor, limit=PAGE_SIZE)
+                    definitions = [(process.id, process.xml_definition, process.name) for process in processes]
+                if self.parallel:
+                    await asyncio.gather(*[warm(*definition) for definition in definitions])
+                else:
+                    for definition in definitions:
+                        await warm(*definition)
+                if cursor is None:
+                    break
+            if not executor.in_process:
+                # fork 启动的工作进程会继承已经预热的缓存，预热后再启动进程池
+                await executor.run(time.perf_counter)
+        except Exception as e:
+            # SQLAlchemy 的异常信息后面附带完整的 SQL，/ready 中只给出第一行
+            self.error = str(e).split('\n', 1)[0] or type(e).__name__
+            self.seconds = time.perf_counter() - started
+            logger.exception(f'Process warm-up failed, retrying in {self.retry_delay:g}s')
+            return False
+        self.error = None
+        self.seconds = time.perf_counter() - started
+        self.ready = True
+        logger.info(f'Warmed up {len(self.warmed)} processes in {self.seconds:.2f}s'
+                    + (f', {len(self.failed)} failed' if self.failed else ''))
+        return True
+
+    def status(self) -> dict:
+        return {
+            'ready': self.ready,
+            'warmed': len(self.warmed),
+            'failed': sorted(self.failed),
+            'error': self.error,
+            'seconds': None if self.seconds is None else round(self.seconds, 3),
+        }
+
+
+process_warmer = ProcessWarmer()
+
+
+def get_process_warmer() -> ProcessWarmer:
+    return process_warmer
@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, NamedTuple, Optional
+
+from SpiffWorkflow.bpmn.workflow import BpmnWorkflow
+
+from config import settings
+
+
+class _Entry(NamedTuple):
+    version: int
+    workflow: BpmnWorkflow
+    size: int
+    expires_at: float
+
+
+class WorkflowCache:
+    """Bounded LRU + TTL cache of deserialized workflows of active instances
+
+    Entries are keyed by instance id and only returned for the exact state
+    version they were built from, so a row advanced by another worker is never
+    served from a stale entry. ``take`` hands the workflow over exclusively:
+    the caller mutates it and puts it back once the new version is committed.
+    Sizes are the serialized state length, used as an estimate of the memory
+    held by each workflow.
+    """
+
+    def __init__(self, maxsize: int = settings.workflow_cache_size, ttl: float = settings.workflow_cache_ttl,
+                 max_bytes: int = settings.workflow_cache_max_bytes) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def take(self, instance_id: int, version: int) -> Optional[BpmnWorkflow]:
+        """Remove and return the cached workflow of an instance if it is still current"""
+
+        entry = self._pop(instance_id, version)
+        return entry.workflow if entry is not None else None
+
+    @contextmanager
+    def borrow(self, instance_id: int, version: int) -> Iterator[Optional[BpmnWorkflow]]:
+        """Lend the cached workflow for read-only use, it is put back unchanged afterwards"""
+
+        entry = self._pop(instance_id, version)
+        try:
+            yield entry.workflow if entry is not None else None
+        finally:
+            if entry is not None:
+                with self._lock:
+                    # 借出期间可能已经写入了更新的版本；放回末尾时按新的过期时间，保持顺序与过期时间一致
+                    if instance_id not in self._entries:
+                        self._entries[instance_id] = entry = entry._replace(expires_at=time.monotonic() + self.ttl)
+                        self._bytes += entry.size
+                        self._evict()
+
+    def _pop(self, instance_id: int, version: int) -> Optional[_Entry]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.pop(instance_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+            if entry is None or entry.version != version or entry.expires_at < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, instance_id: int, version: int, workflow: BpmnWorkflow, size: int) -> None:
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(instance_id, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[instance_id] = _Entry(version, workflow, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            self._evict()
+
+    def invalidate(self, instance_id: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(instance_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict(self) -> None:
+        # 条目追加到末尾时（put 或 borrow 放回）都重新计算过期时间，TTL 固定，所以最旧的条目也最先过期
+        now = time.monotonic()
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if (entry.expires_at >= now and len(self._entries) <= self.maxsize
+                    and self._bytes <= self.max_bytes):
+                break
+            self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+workflow_cache = WorkflowCache()
+
+
+def get_workflow_cache() -> WorkflowCache:
+    return workflow_cache
@@ -0,0 +1,92 @@
+from typing import List
+
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    """Application settings, overridable through ``DUCKY_*`` environment variables"""
+
+    # 已解析的 WorkflowSpec 缓存的最大条目数
+    spec_cache_size: int = 128
+    # 启动后预先解析所有流程定义，完成后 /ready 才返回 200
+    warmup_enabled: bool = True
+    # 是否在执行器的线程中并行解析
+    warmup_parallel: bool = False
+    # 预热整体失败（例如数据库不可用）后重试的延迟（秒）
+    warmup_retry_delay: float = 30
+    # BpmnProcessInstance.state 的压缩方式：raw / zlib / lzma
+    state_codec: str = 'zlib'
+    state_codec_level: int = 6
+    # 活跃实例的已反序列化工作流缓存，条目数为 0 时关闭
+    workflow_cache_size: int = 0
+    workflow_cache_ttl: float = 300
+    workflow_cache_max_bytes: int = 64 * 1024 * 1024
+    # 任务拓扑图静态部分（节点和连线）的缓存条目数
+    topology_cache_size: int = 128
+    # 预编译的脚本和条件表达式的缓存条目数，为 0 时不缓存
+    script_cache_size: int = 1024
+    # 数据库连接地址，为空时使用 data/db.sqlite
+    database_url: str = ''
+    # 打印所有 SQL 语句，只在调试时打开
+    database_echo: bool = False
+    # 连接池大小，为 0 时每个会话新建连接（NullPool）
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    # SQLite 连接参数：performance（WAL、synchronous=NORMAL、mmap 等）/ default（不设置 pragma）
+    sqlite_profile: str = 'performance'
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # 负数表示 KiB，和 PRAGMA cache_size 一致
+    sqlite_cache_size: int = -64 * 1024
+    sqlite_busy_timeout: int = 5000
+    # 实例被并发修改时自动重试的次数，为 0 时直接返回 409
+    instance_update_retries: int = 0
+    # 引擎阶段的执行方式：inline（事件循环内）/ thread / process
+    engine_executor: str = 'inline'
+    engine_workers: int = 4
+    # 单次引擎阶段（创建或推进一个实例）的执行预算：墙钟秒数和引擎步数，为 0 时不限制
+    # 流程可以通过 camunda:property maxEngineSeconds / maxEngineSteps 设置更小的值
+    engine_max_seconds: float = 30
+    engine_max_steps: int = 10000
+    # 后台任务的并发数，为 0 时不启动 worker，任务只写入 bpmn_job 表
+    job_workers: int = 4
+    # running 状态超过该秒数的任务视为执行它的进程已经退出，重新入队；需大于任务实际可能的执行时间（含执行预算）
+    job_stale_after: float = 600
+    # create / run 接口默认是否在后台执行（返回 202），可通过 background 参数覆盖
+    background_execution: bool = False
+    # 定时事件调度器：每批处理的实例数、最长轮询间隔（秒）、失败后重试的延迟（秒）
+    timer_scheduler_enabled: bool = True
+    timer_batch_size: int = 100
+    timer_poll_interval: float = 60
+    timer_retry_delay: float = 60
+    # 批量接口单次请求的最大条目数
+    batch_max_items: int = 1000
+    # 列表接口的默认与最大分页大小
+    page_size_default: int = 100
+    page_size_max: int = 1000
+    # NDJSON 导出时每次从游标读取的行数，导入时每个事务插入的行数
+    transfer_chunk_size: int = 1000
+    # /metrics 接口和各阶段耗时的记录，关闭后记录也不再执行
+    metrics_enabled: bool = True
+    # 按请求开启的性能分析：带 X-Profile（或 _profile 参数）和其中一个令牌的请求被分析，为空时关闭
+    # 环境变量为 JSON 列表，例如 DUCKY_PROFILE_TOKENS='["secret"]'
+    profile_tokens: List[str] = []
+    # 分析结果的保存目录，sample 模式的采样间隔（秒）
+    profile_dir: str = 'data/profiles'
+    profile_sample_interval: float = 0.001
+    # 已完成实例的归档：结束超过 archive_after_days 天后移到归档表，state 用 archive_codec 重新压缩
+    # 默认关闭；归档的实例不再出现在默认的实例列表中，按 id 读取时回退到归档表，列表需要 archived=true
+    # 任务投影和定时器随实例删除，后台任务记录（/jobs）保留，结果和错误仍可查询
+    archive_enabled: bool = False
+    archive_after_days: float = 30
+    archive_batch_size: int = 500
+    # 两轮归档之间的间隔（秒）
+    archive_interval: float = 3600
+    archive_codec: str = 'zlib'
+    archive_codec_level: int = 9
+
+    class Config:
+        env_prefix = 'DUCKY_'
+        env_file = '.env'
+
+
+settings = Settings()
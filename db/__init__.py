@@ -1,18 +1,110 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 import os
 
+from config import settings
+
+T = TypeVar('T')
+
+SQLITE_PROFILES = ('default', 'performance')
+
 # 确保数据目录存在
 data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 os.makedirs(data_dir, exist_ok=True)
 
-DATABASE_URL = f'sqlite+aiosqlite:///{os.path.join(data_dir, "db.sqlite")}'
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
+DATABASE_URL = settings.database_url or f'sqlite+aiosqlite:///{os.path.join(data_dir, "db.sqlite")}'
+
+
+def sqlite_pragmas(profile: str) -> list:
+    """PRAGMA statements applied to every new SQLite connection of a profile"""
+
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown sqlite profile {profile!r}, expected one of {SQLITE_PROFILES}')
+    if profile == 'default':
+        return []
+    # WAL 下读写互不阻塞，synchronous=NORMAL 只在检查点时 fsync，进程崩溃不会丢数据
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA mmap_size={settings.sqlite_mmap_size}',
+        f'PRAGMA cache_size={settings.sqlite_cache_size}',
+        f'PRAGMA busy_timeout={settings.sqlite_busy_timeout}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def create_engine(url: str = DATABASE_URL, *, echo: Optional[bool] = None, pool_size: Optional[int] = None,
+                  sqlite_profile: Optional[str] = None) -> AsyncEngine:
+    """Create the async engine from settings, keyword arguments override them"""
+
+    echo = settings.database_echo if echo is None else echo
+    pool_size = settings.database_pool_size if pool_size is None else pool_size
+    options = {'future': True, 'echo': echo}
+    url_obj = make_url(url)
+    is_sqlite = url_obj.get_backend_name() == 'sqlite'
+    if not (is_sqlite and url_obj.database in (None, '', ':memory:')):
+        # aiosqlite 的文件数据库默认不使用连接池，每个会话都要新建连接并重新设置 pragma
+        if pool_size > 0:
+            options.update(poolclass=AsyncAdaptedQueuePool, pool_size=pool_size,
+                           max_overflow=settings.database_max_overflow)
+        else:
+            options.update(poolclass=NullPool)
+    engine = create_async_engine(url, **options)
+
+    if is_sqlite:
+        pragmas = sqlite_pragmas(settings.sqlite_profile if sqlite_profile is None else sqlite_profile)
+        if pragmas:
+            @event.listens_for(engine.sync_engine, 'connect')
+            def _set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+    return engine
+
+
+engine = create_engine()
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base(engine)
 
 
+def run_script(main: Awaitable[T]) -> T:
+    """``asyncio.run`` for command line scripts, closing pooled connections before the loop exits"""
+
+    async def run() -> T:
+        try:
+            return await main
+        finally:
+            # 连接池中的 aiosqlite 连接各占一个线程，不关闭时进程无法退出
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
 async def get_session() -> AsyncSession:
     async with AsyncSessionLocal.begin() as session:
         yield session
+
+
+def call_after_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """Run a callback once the session's current transaction has committed"""
+
+    session.sync_session.info.setdefault('after_commit', []).append(callback)
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_after_commit(session: Session) -> None:
+    for callback in session.info.pop('after_commit', []):
+        callback()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_commit(session: Session) -> None:
+    session.info.pop('after_commit', None)
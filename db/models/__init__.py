@@ -1,4 +1,7 @@
-from sqlalchemy import Column, ForeignKey, String, Integer, Text, DateTime, func
+from datetime import datetime
+
+from sqlalchemy import (JSON, Boolean, Column, ForeignKey, Index, String, Integer, Text, DateTime, LargeBinary,
+                        UniqueConstraint, func, text)
 from sqlalchemy.orm import relationship
 
 from db import Base
@@ -6,8 +9,9 @@ from db.repos import has_repo
 
 
 class TimestampMixin:
-    created_at = Column(DateTime, nullable=False, default=func.now())
-    updated_at = Column(DateTime, nullable=False, default=func.now())
+    # 在 Python 端取 UTC 时间，存储格式与绑定参数一致，键集分页的比较才可靠
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 @has_repo()
@@ -19,21 +23,163 @@ class BpmnProcess(Base, TimestampMixin):
     name = Column(String, nullable=False)
     xml_definition = Column(Text, nullable=False)
     instances = relationship('BpmnProcessInstance', back_populates='process')
+    specs = relationship('BpmnProcessSpec', back_populates='process')
 
     def __repr__(self):
         return f'<BpmnProcess id={self.id} name={self.name}>'
 
 
+@has_repo()
+class BpmnProcessSpec(Base):
+    """Model for a stored version of a bpmn process definition, shared by its instances"""
+
+    __tablename__ = 'bpmn_process_spec'
+    __table_args__ = (UniqueConstraint('bpmn_process_id', 'spec_hash'),)
+    id = Column(Integer, primary_key=True)
+    bpmn_process_id = Column(ForeignKey('bpmn_process.id'), nullable=False)
+    spec_hash = Column(String(64), nullable=False)
+    xml_definition = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    process = relationship('BpmnProcess', back_populates='specs')
+
+    def __repr__(self):
+        return f'<BpmnProcessSpec id={self.id} process={self.bpmn_process_id} hash={self.spec_hash[:12]}>'
+
+
 @has_repo()
 class BpmnProcessInstance(Base, TimestampMixin):
     """Model for an instance of bpmn process"""
 
     __tablename__ = 'bpmn_process_instance'
+    # 列表接口的键集分页：按流程过滤后按 id 翻页，或按创建时间翻页
+    __table_args__ = (
+        Index('ix_bpmn_process_instance_process_id', 'bpmn_process_id', 'id'),
+        Index('ix_bpmn_process_instance_created_at', 'created_at', 'id'),
+        # 待办查询：某个流程中停在某个任务上的实例，按等待时间排序
+        Index('ix_bpmn_process_instance_inbox', 'bpmn_process_id', 'current_task_spec_id', 'updated_at', 'id'),
+        # 归档任务按结束时间查找已完成的实例，部分索引只包含这些行
+        Index('ix_bpmn_process_instance_completed', 'updated_at', 'id',
+              sqlite_where=text("current_task = 'END'"), postgresql_where=text("current_task = 'END'")),
+        # 归档后 id 留在归档表中，AUTOINCREMENT 保证 SQLite 不会把最大的 id 再分配给新实例
+        {'sqlite_autoincrement': True},
+    )
     id = Column(Integer, primary_key=True)
     bpmn_process_id = Column(ForeignKey('bpmn_process.id'), nullable=False)
-    state = Column(Text, nullable=False)
+    # 经 bpmn.state_codec 编码（带格式头，可能压缩）的序列化工作流
+    state = Column(LargeBinary, nullable=False)
+    # 为空表示旧格式：state 中内嵌了完整的流程 spec
+    spec_hash = Column(String(64), nullable=True)
+    # 每次写入 state 时递增，用于识别缓存中的工作流是否过期
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     current_task = Column(String(255), nullable=False)
+    # 当前等待的任务的 BPMN 元素 id，current_task 只是任务的描述
+    current_task_spec_id = Column(String(255), nullable=True)
+    # 最近一次推进超出执行预算的原因，成功推进后清空
+    error = Column(Text, nullable=True)
     process = relationship('BpmnProcess', back_populates='instances')
+    tasks = relationship('BpmnProcessInstanceTask', back_populates='instance', order_by='BpmnProcessInstanceTask.position')
 
     def __repr__(self):
         return f'<BpmnProcessInstance id={self.id} process={self.process.name}>'
+
+
+@has_repo()
+class BpmnProcessInstanceArchive(Base):
+    """Model for a completed instance moved out of bpmn_process_instance by the archiver"""
+
+    __tablename__ = 'bpmn_process_instance_archive'
+    __table_args__ = (
+        Index('ix_bpmn_process_instance_archive_process_id', 'bpmn_process_id', 'id'),
+        Index('ix_bpmn_process_instance_archive_created_at', 'created_at', 'id'),
+    )
+    # 与原实例的 id 相同，读取接口按 id 回退到这张表
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    bpmn_process_id = Column(ForeignKey('bpmn_process.id'), nullable=False)
+    # 用归档的 codec 重新编码的 state
+    state = Column(LargeBinary, nullable=False)
+    spec_hash = Column(String(64), nullable=True)
+    version = Column(Integer, nullable=False)
+    current_task = Column(String(255), nullable=False)
+    current_task_spec_id = Column(String(255), nullable=True)
+    error = Column(Text, nullable=True)
+    # 原实例的时间，不随归档改变
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BpmnProcessInstanceArchive id={self.id} process={self.bpmn_process_id}>'
+
+
+@has_repo()
+class BpmnProcessInstanceTask(Base, TimestampMixin):
+    """Model for the projected state of one task spec of an instance, rewritten with the instance state"""
+
+    __tablename__ = 'bpmn_process_instance_task'
+    __table_args__ = (
+        UniqueConstraint('bpmn_process_instance_id', 'task_spec_id'),
+        # 按任务和状态查询实例，例如某个用户任务上等待处理的实例
+        Index('ix_bpmn_process_instance_task_spec_state', 'task_spec_id', 'state'),
+    )
+    id = Column(Integer, primary_key=True)
+    bpmn_process_instance_id = Column(ForeignKey('bpmn_process_instance.id'), nullable=False)
+    # BPMN 元素 id
+    task_spec_id = Column(String(255), nullable=False)
+    # 决定 state 的那个任务的 uuid
+    task_id = Column(String(36), nullable=False)
+    name = Column(String(255), nullable=False)
+    # SpiffWorkflow 的任务状态名：READY / WAITING / FUTURE / LIKELY / MAYBE / COMPLETED / CANCELLED
+    state = Column(String(16), nullable=False)
+    manual = Column(Boolean, nullable=False, default=False)
+    position = Column(Integer, nullable=False)
+    completed_at = Column(DateTime, nullable=True)
+    state_changed_at = Column(DateTime, nullable=False)
+    instance = relationship('BpmnProcessInstance', back_populates='tasks')
+
+    def __repr__(self):
+        return f'<BpmnProcessInstanceTask instance={self.bpmn_process_instance_id} spec={self.task_spec_id} state={self.state}>'
+
+
+@has_repo()
+class BpmnTimer(Base, TimestampMixin):
+    """Model for a timer event an instance is waiting on, rewritten with the instance state"""
+
+    __tablename__ = 'bpmn_timer'
+    __table_args__ = (
+        UniqueConstraint('bpmn_process_instance_id', 'task_spec_id'),
+        # 调度器只读取最早到期的几条
+        Index('ix_bpmn_timer_due_at', 'due_at', 'id'),
+    )
+    id = Column(Integer, primary_key=True)
+    bpmn_process_instance_id = Column(ForeignKey('bpmn_process_instance.id'), nullable=False)
+    # 定时事件的 BPMN 元素 id
+    task_spec_id = Column(String(255), nullable=False)
+    due_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<BpmnTimer instance={self.bpmn_process_instance_id} spec={self.task_spec_id} due={self.due_at}>'
+
+
+@has_repo()
+class BpmnJob(Base, TimestampMixin):
+    """Model for a create or run request executed in the background by the job worker"""
+
+    __tablename__ = 'bpmn_job'
+    # 启动时按 id 顺序恢复未完成的任务
+    __table_args__ = (Index('ix_bpmn_job_status', 'status', 'id'),)
+    id = Column(Integer, primary_key=True)
+    # create / run
+    kind = Column(String(16), nullable=False)
+    # queued / running / done / failed
+    status = Column(String(16), nullable=False, default='queued')
+    bpmn_process_id = Column(ForeignKey('bpmn_process.id'), nullable=False)
+    # create 任务在执行完成后才有实例；实例归档后任务记录仍然保留，所以不设外键
+    bpmn_process_instance_id = Column(Integer, nullable=True)
+    data = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<BpmnJob id={self.id} kind={self.kind} status={self.status}>'
@@ -1,26 +1,144 @@
 from __future__ import annotations
-from typing import Any, Callable, Dict, List, Optional
+import base64
+import functools
+import inspect
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from sqlalchemy import select, update, delete
+from sqlalchemy import and_, or_, select, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
 from fastapi import Depends
 
 from db import Base, get_session
+from metrics import DB_QUERY_SECONDS
+
+
+PAGE_ORDERS = ('id', 'created_at', 'updated_at')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order_by: str, model: Base) -> str:
+    """Opaque cursor pointing just past ``model`` in the given order"""
+
+    key = [model.id] if order_by == 'id' else [getattr(model, order_by).isoformat(), model.id]
+    return base64.urlsafe_b64encode(json.dumps([order_by, *key]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(order_by: str, cursor: str) -> Tuple:
+    try:
+        order, *key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if order != order_by:
+            raise InvalidCursor(f"Cursor was issued for order '{order}', not '{order_by}'")
+        if order_by == 'id':
+            (id,) = key
+            return (int(id),)
+        created_at, id = key
+        return datetime.fromisoformat(created_at), int(id)
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor('Malformed cursor') from None
+
+
+def timed(func: Callable) -> Callable:
+    """Record the duration of a repository operation, labeled by repo class and method"""
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, type(self).__name__, func.__name__)
+    return wrapper
+
+
+def _time_operations(cls: type) -> None:
+    for name, attr in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.iscoroutinefunction(attr):
+            setattr(cls, name, timed(attr))
 
 
 class Repo:
     """Data Access Layer"""
 
+    # 摘要查询中不加载的大字段，只在详情接口中读取
+    heavy_columns: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # 子类的公开协程方法都计入 ducky_db_query_seconds
+        _time_operations(cls)
+
     def __init__(self, *, model: Base, session: AsyncSession) -> None:
         self.Model = model
         self.session = session
 
+    def summary_options(self) -> list:
+        """Loader options deferring the heavy columns; touching one afterwards raises instead of lazy loading"""
+
+        return [defer(getattr(self.Model, name), raiseload=True) for name in self.heavy_columns]
+
     async def all(self) -> List[Base]:
         return (await self.session.execute(select(self.Model))).scalars().all()
 
-    async def get(self, id: int) -> Base:
+    async def page(self, *, where: Sequence = (), order_by: str = 'id', after: Optional[str] = None,
+                   limit: int = 100, descending: bool = False,
+                   summary: bool = False) -> Tuple[List[Base], Optional[str]]:
+        """Keyset pagination, returns one page and the cursor of the next one (None on the last page)
+
+        With ``summary`` the heavy columns are left out of the SELECT.
+        """
+
+        if order_by not in PAGE_ORDERS:
+            raise ValueError(f"Unknown order '{order_by}', expected one of {PAGE_ORDERS}")
+        id_col = self.Model.id
+        columns = [id_col] if order_by == 'id' else [getattr(self.Model, order_by), id_col]
+        stmt = select(self.Model).where(*where)
+        if summary:
+            stmt = stmt.options(*self.summary_options())
+        if after is not None:
+            key = decode_cursor(order_by, after)
+            # (时间列, id) 上的行值比较，时间相同时由 id 打破并列
+            if order_by == 'id':
+                stmt = stmt.where(id_col < key[0] if descending else id_col > key[0])
+            else:
+                col = columns[0]
+                past = col < key[0] if descending else col > key[0]
+                tie = id_col < key[1] if descending else id_col > key[1]
+                stmt = stmt.where(or_(past, and_(col == key[0], tie)))
+        stmt = stmt.order_by(*(c.desc() if descending else c for c in columns)).limit(limit + 1)
+        rows = (await self.session.execute(stmt)).scalars().all()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(order_by, rows[-1])
+
+    async def count(self, where: Sequence = ()) -> int:
+        stmt = select(func.count()).select_from(self.Model).where(*where)
+        return (await self.session.execute(stmt)).scalar_one()
+
+    async def get(self, id: int, summary: bool = False) -> Base:
+        if summary:
+            return await self.session.get(self.Model, id, options=self.summary_options())
         return await self.session.get(self.Model, id)
 
+    async def load_heavy_columns(self, model: Base) -> None:
+        """Load the heavy columns of a row fetched with ``summary``"""
+
+        await self.session.refresh(model, attribute_names=list(self.heavy_columns))
+
+    async def get_many(self, ids: Iterable[int]) -> List[Base]:
+        return (await self.session.execute(select(self.Model).where(self.Model.id.in_(list(ids))))).scalars().all()
+
     async def find_one(self, params: Dict[str, Any]):
         return (await self.session.execute(select(self.Model).filter_by(**params))).scalar_one_or_none()
 
@@ -31,6 +149,14 @@ class Repo:
         await self.session.refresh(model)  # 刷新模型以获取所有字段
         return model
 
+    async def bulk_create(self, params_list: List[Dict[str, Any]]) -> List[Base]:
+        """Insert many rows in a single flush, without refreshing each of them"""
+
+        models = [self.Model(**params) for params in params_list]
+        self.session.add_all(models)
+        await self.session.flush()
+        return models
+
     async def update(self, id: int, params: Dict[str, Any]) -> Base:
         await self.session.execute(update(self.Model).where(self.Model.id == id).values(**params))
         return await self.get(id)
@@ -39,12 +165,216 @@ class Repo:
         return (await self.session.execute(delete(self.Model).where(self.Model.id == id))).rowcount
 
 
+_time_operations(Repo)
+
+
 class BpmnProcessRepo(Repo):
-    pass
+    heavy_columns = ('xml_definition',)
 
+    def filters(self, *, name: Optional[str] = None) -> list:
+        where = []
+        if name is not None:
+            where.append(self.Model.name.contains(name))
+        return where
 
-class BpmnProcessInstanceRepo(Repo):
-    pass
+
+class BpmnProcessSpecRepo(Repo):
+    async def store(self, params: Dict[str, Any]) -> None:
+        """Insert a definition version unless it is already stored, also when another request inserts it concurrently"""
+
+        dialect = self.session.bind.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = insert(self.Model).values(**params).on_conflict_do_nothing(
+                index_elements=['bpmn_process_id', 'spec_hash'])
+            await self.session.execute(stmt)
+            return
+        try:
+            async with self.session.begin_nested():
+                self.session.add(self.Model(**params))
+        except IntegrityError:
+            # 其它请求已经保存了同一个版本
+            pass
+
+
+class InstanceFilters:
+    """Listing filters shared by the hot and the archived instances"""
+
+    def filters(self, *, process_id: Optional[int] = None, current_task: Optional[str] = None,
+                current_task_spec_id: Optional[str] = None, completed: Optional[bool] = None,
+                created_after: Optional[datetime] = None, created_before: Optional[datetime] = None) -> list:
+        """Build the where clauses of an instance listing"""
+
+        where = []
+        if process_id is not None:
+            where.append(self.Model.bpmn_process_id == process_id)
+        if current_task is not None:
+            where.append(self.Model.current_task == current_task)
+        if current_task_spec_id is not None:
+            where.append(self.Model.current_task_spec_id == current_task_spec_id)
+        if completed is not None:
+            # 流程结束后 current_task 固定为 END
+            where.append(self.Model.current_task == 'END' if completed else self.Model.current_task != 'END')
+        if created_after is not None:
+            where.append(self.Model.created_at >= created_after)
+        if created_before is not None:
+            where.append(self.Model.created_at < created_before)
+        return where
+
+
+class BpmnProcessInstanceRepo(InstanceFilters, Repo):
+    heavy_columns = ('state',)
+
+    async def reload(self, id: int) -> Optional[Base]:
+        """Get an instance, overwriting whatever the session has cached for it"""
+
+        stmt = select(self.Model).where(self.Model.id == id).execution_options(populate_existing=True)
+        return (await self.session.execute(stmt)).scalar_one_or_none()
+
+    async def compare_and_swap(self, id: int, version: int, params: Dict[str, Any]) -> Optional[Base]:
+        """Update an instance only if it is still at ``version``, returns None on conflict"""
+
+        stmt = (update(self.Model)
+                .where(self.Model.id == id, self.Model.version == version)
+                .values(**params, version=version + 1))
+        if (await self.session.execute(stmt)).rowcount == 0:
+            return None
+        return await self.get(id)
+
+    async def archivable(self, before: datetime, limit: int) -> List[Base]:
+        """The oldest instances that completed before ``before``, with their state
+
+        Instances with a queued or running job are left in place until the job finished.
+        """
+
+        jobs = self.Model.metadata.tables['bpmn_job']
+        pending_job = (select(jobs.c.id)
+                       .where(jobs.c.bpmn_process_instance_id == self.Model.id,
+                              jobs.c.status.in_(('queued', 'running')))
+                       .exists())
+        stmt = (select(self.Model)
+                .where(self.Model.current_task == 'END', self.Model.updated_at < before, ~pending_job)
+                .order_by(self.Model.updated_at, self.Model.id)
+                .limit(limit))
+        return (await self.session.execute(stmt)).scalars().all()
+
+    async def delete_many(self, ids: List[int]) -> int:
+        return (await self.session.execute(delete(self.Model).where(self.Model.id.in_(ids)))).rowcount
+
+
+class BpmnProcessInstanceArchiveRepo(InstanceFilters, Repo):
+    heavy_columns = ('state',)
+
+
+class BpmnProcessInstanceTaskRepo(Repo):
+
+    async def delete_for_instances(self, instance_ids: List[int]) -> int:
+        stmt = delete(self.Model).where(self.Model.bpmn_process_instance_id.in_(instance_ids))
+        return (await self.session.execute(stmt)).rowcount
+
+    async def for_instance(self, instance_id: int) -> List[Base]:
+        stmt = (select(self.Model)
+                .where(self.Model.bpmn_process_instance_id == instance_id)
+                .order_by(self.Model.position))
+        return (await self.session.execute(stmt)).scalars().all()
+
+    async def replace(self, instance_id: int, rows: List[Dict[str, Any]]) -> None:
+        """Make the stored tasks of an instance match ``rows``, touching only the ones that changed"""
+
+        existing = {task.task_spec_id: task for task in await self.for_instance(instance_id)}
+        now = datetime.utcnow()
+        for params in rows:
+            task = existing.pop(params['task_spec_id'], None)
+            if task is None:
+                self.session.add(self.Model(bpmn_process_instance_id=instance_id, **params))
+                continue
+            changed = {key: value for key, value in params.items() if getattr(task, key) != value}
+            for key, value in changed.items():
+                setattr(task, key, value)
+            if changed:
+                task.updated_at = now
+        for task in existing.values():
+            await self.session.delete(task)
+        await self.session.flush()
+
+
+class BpmnTimerRepo(Repo):
+
+    async def delete_for_instances(self, instance_ids: List[int]) -> int:
+        stmt = delete(self.Model).where(self.Model.bpmn_process_instance_id.in_(instance_ids))
+        return (await self.session.execute(stmt)).rowcount
+
+    async def for_instance(self, instance_id: int) -> List[Base]:
+        stmt = select(self.Model).where(self.Model.bpmn_process_instance_id == instance_id)
+        return (await self.session.execute(stmt)).scalars().all()
+
+    async def replace(self, instance_id: int, rows: List[Dict[str, Any]]) -> None:
+        """Make the stored timers of an instance match ``rows``"""
+
+        await self.session.execute(delete(self.Model).where(self.Model.bpmn_process_instance_id == instance_id))
+        if rows:
+            await self.bulk_create([{'bpmn_process_instance_id': instance_id, **params} for params in rows])
+
+    async def due(self, now: datetime, limit: int) -> List[int]:
+        """Ids of the instances with the earliest timers due at ``now``"""
+
+        stmt = (select(self.Model.bpmn_process_instance_id)
+                .where(self.Model.due_at <= now)
+                .order_by(self.Model.due_at, self.Model.id)
+                .limit(limit))
+        return list(dict.fromkeys((await self.session.execute(stmt)).scalars().all()))
+
+    async def next_due_at(self) -> Optional[datetime]:
+        stmt = select(self.Model.due_at).order_by(self.Model.due_at, self.Model.id).limit(1)
+        return (await self.session.execute(stmt)).scalar_one_or_none()
+
+    async def postpone(self, instance_ids: List[int], now: datetime, due_at: datetime) -> int:
+        """Move the timers of the given instances that are still due at ``now`` to ``due_at``"""
+
+        stmt = (update(self.Model)
+                .where(self.Model.bpmn_process_instance_id.in_(instance_ids), self.Model.due_at <= now)
+                .values(due_at=due_at))
+        return (await self.session.execute(stmt)).rowcount
+
+
+class BpmnJobRepo(Repo):
+
+    def filters(self, *, status: Optional[str] = None, instance_id: Optional[int] = None) -> list:
+        where = []
+        if status is not None:
+            where.append(self.Model.status == status)
+        if instance_id is not None:
+            where.append(self.Model.bpmn_process_instance_id == instance_id)
+        return where
+
+    async def queued(self) -> List[Base]:
+        stmt = select(self.Model).where(self.Model.status == 'queued').order_by(self.Model.id)
+        return (await self.session.execute(stmt)).scalars().all()
+
+    async def transition(self, id: int, from_status: str, params: Dict[str, Any],
+                         attempts: Optional[int] = None) -> bool:
+        """Update a job only if it still has ``from_status``, so that only one worker claims it
+
+        With ``attempts`` the job must also still be in that attempt: a job that
+        was requeued and claimed again no longer belongs to the earlier attempt.
+        """
+
+        where = [self.Model.id == id, self.Model.status == from_status]
+        if attempts is not None:
+            where.append(self.Model.attempts == attempts)
+        stmt = update(self.Model).where(*where).values(**params)
+        return (await self.session.execute(stmt)).rowcount == 1
+
+    async def requeue_stale(self, before: datetime) -> List[Tuple[int, Optional[int]]]:
+        """Put jobs running since before ``before`` back in the queue, returns their ids and instance ids"""
+
+        stale = and_(self.Model.status == 'running', self.Model.started_at < before)
+        rows = (await self.session.execute(
+            select(self.Model.id, self.Model.bpmn_process_instance_id).where(stale).order_by(self.Model.id))).all()
+        if rows:
+            await self.session.execute(
+                update(self.Model).where(self.Model.id.in_([row[0] for row in rows]), stale).values(status='queued'))
+        return [tuple(row) for row in rows]
 
 
 def has_repo(repo_class: Optional[str] = None) -> Callable[[Base], Base]:
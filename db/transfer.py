@@ -0,0 +1,160 @@
+import base64
+import json
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import DateTime, LargeBinary, Table, insert, select, text
+from sqlalchemy.exc import DBAPIError
+
+from config import settings
+from db import AsyncSessionLocal
+from db.models import (BpmnProcess, BpmnProcessInstance, BpmnProcessInstanceArchive, BpmnProcessInstanceTask,
+                       BpmnProcessSpec, BpmnTimer)
+
+# 按外键依赖的顺序导出，导入时按文件中的顺序写入
+PROCESS_TABLES: Tuple[Table, ...] = (BpmnProcess.__table__, BpmnProcessSpec.__table__)
+INSTANCE_TABLES: Tuple[Table, ...] = (BpmnProcessInstance.__table__, BpmnProcessInstanceTask.__table__,
+                                      BpmnTimer.__table__, BpmnProcessInstanceArchive.__table__)
+TABLES: Dict[str, Table] = {table.name: table for table in PROCESS_TABLES + INSTANCE_TABLES}
+
+
+class TransferError(ValueError):
+    """An import stream could not be read or written"""
+
+
+async def _reserve_instance_ids(session, max_id: int) -> None:
+    """Make SQLite hand out instance ids above ``max_id``, e.g. the id of an imported archived instance"""
+
+    if session.bind.dialect.name != 'sqlite':
+        return
+    name = BpmnProcessInstance.__tablename__
+    await session.execute(text('INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 '
+                               'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'), {'name': name})
+    await session.execute(text('UPDATE sqlite_sequence SET seq = max(seq, :max_id) WHERE name = :name'),
+                          {'name': name, 'max_id': max_id})
+
+
+def encode_row(table: Table, row: Sequence) -> str:
+    """One NDJSON line: the row's columns plus its table name under ``type``"""
+
+    record = {'type': table.name}
+    for column, value in zip(table.columns, row):
+        if isinstance(value, bytes):
+            value = base64.b64encode(value).decode('ascii')
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        record[column.name] = value
+    return json.dumps(record, ensure_ascii=False)
+
+
+def decode_record(record: dict) -> Tuple[Table, dict]:
+    """Table and insert parameters of a line written by ``encode_row``; unknown keys are ignored"""
+
+    table = TABLES.get(record.get('type'))
+    if table is None:
+        raise TransferError(f"Unknown record type {record.get('type')!r}, expected one of {sorted(TABLES)}")
+    row = {}
+    for column in table.columns:
+        if column.name not in record:
+            continue
+        value = record[column.name]
+        if value is not None:
+            if isinstance(column.type, LargeBinary):
+                value = base64.b64decode(value)
+            elif isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+        row[column.name] = value
+    return table, row
+
+
+def _export_select(table: Table, process_id: Optional[int]):
+    stmt = select(table).order_by(*table.primary_key.columns)
+    if process_id is None:
+        return stmt
+    if table is BpmnProcess.__table__:
+        return stmt.where(table.c.id == process_id)
+    if 'bpmn_process_id' in table.c:
+        return stmt.where(table.c.bpmn_process_id == process_id)
+    instance_ids = select(BpmnProcessInstance.id).where(BpmnProcessInstance.bpmn_process_id == process_id)
+    return stmt.where(table.c.bpmn_process_instance_id.in_(instance_ids))
+
+
+async def export_ndjson(tables: Sequence[Table] = PROCESS_TABLES + INSTANCE_TABLES,
+                        process_id: Optional[int] = None,
+                        chunk_size: int = settings.transfer_chunk_size) -> AsyncIterator[str]:
+    """Stream tables as NDJSON, one string of up to ``chunk_size`` lines at a time
+
+    Rows are fetched through a server-side cursor as plain tuples (no ORM
+    identity map), so memory does not grow with the number of rows. All tables
+    are read in one read transaction and form a consistent snapshot.
+    """
+
+    async with AsyncSessionLocal() as session:
+        if session.bind.dialect.name == 'sqlite':
+            # pysqlite 只在写语句前自动 BEGIN，否则每条 SELECT 各自看到当时已提交的数据
+            await (await session.connection()).exec_driver_sql('BEGIN')
+        else:
+            await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        for table in tables:
+            result = await session.stream(_export_select(table, process_id).execution_options(yield_per=chunk_size))
+            async for rows in result.partitions(chunk_size):
+                yield ''.join(encode_row(table, row) + '\n' for row in rows)
+
+
+async def iter_lines(chunks: AsyncIterable[Union[bytes, str]]) -> AsyncIterator[bytes]:
+    """Split a stream of arbitrary chunks (e.g. a request body) into lines"""
+
+    pending = b''
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+async def import_ndjson(lines: AsyncIterable[Union[bytes, str]],
+                        chunk_size: int = settings.transfer_chunk_size) -> Dict[str, int]:
+    """Insert the records of an NDJSON stream, returns the number of rows per table
+
+    Consecutive records of a table are inserted together, ``chunk_size`` rows
+    per transaction, so a large import neither holds everything in memory nor
+    grows one huge transaction. Ids are kept, which keeps references between
+    records intact; on an error the chunks before it stay committed.
+    """
+
+    counts: Dict[str, int] = {}
+    table: Optional[Table] = None
+    rows: List[dict] = []
+    line_number = 0
+
+    async def flush() -> None:
+        try:
+            async with AsyncSessionLocal.begin() as session:
+                await session.execute(insert(table), rows)
+                if table is BpmnProcessInstanceArchive.__table__:
+                    await _reserve_instance_ids(session, max(row['id'] for row in rows))
+        except DBAPIError as e:
+            raise TransferError(f'Rows of {table.name} before line {line_number} could not be inserted: {e.orig} '
+                                f'(already imported: {counts})') from None
+        counts[table.name] = counts.get(table.name, 0) + len(rows)
+        rows.clear()
+
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record_table, row = decode_record(json.loads(line))
+        except (ValueError, TypeError) as e:
+            raise TransferError(f'Line {line_number}: {e} (already imported: {counts})') from None
+        if rows and (record_table is not table or len(rows) >= chunk_size):
+            await flush()
+        table = record_table
+        rows.append(row)
+    if rows:
+        await flush()
+    return counts
@@ -1,6 +1,4 @@
-import asyncio
-
-from db import engine
+from db import engine, run_script
 from db.models import Base
 
 
@@ -10,4 +8,4 @@ async def drop_tables():
 
 
 if __name__ == "__main__":
-    asyncio.run(drop_tables())
\ No newline at end of file
+    run_script(drop_tables())
\ No newline at end of file
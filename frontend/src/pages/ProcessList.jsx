@@ -50,17 +50,35 @@ function ProcessList() {
     setModalVisible(true)
   }
 
-  const handleEdit = (record) => {
-    setEditingProcess(record)
+  // 列表只返回摘要，编辑和查看时再获取包含 XML 的详情
+  const loadProcess = async (record) => {
+    try {
+      return await processApi.getById(record.id)
+    } catch (error) {
+      message.error('加载流程定义失败: ' + error.message)
+      return null
+    }
+  }
+
+  const handleEdit = async (record) => {
+    const process = await loadProcess(record)
+    if (!process) {
+      return
+    }
+    setEditingProcess(process)
     form.setFieldsValue({
-      name: record.name,
-      xml_definition: record.xml_definition
+      name: process.name,
+      xml_definition: process.xml_definition
     })
     setModalVisible(true)
   }
 
-  const handleView = (record) => {
-    setEditingProcess(record)
+  const handleView = async (record) => {
+    const process = await loadProcess(record)
+    if (!process) {
+      return
+    }
+    setEditingProcess(process)
     setViewModalVisible(true)
   }
 
@@ -23,6 +23,7 @@ const { TextArea } = Input
 function WorkflowDemo() {
   const [processes, setProcesses] = useState([])
   const [selectedProcessId, setSelectedProcessId] = useState(null)
+  const [selectedProcess, setSelectedProcess] = useState(null)
   const [currentInstance, setCurrentInstance] = useState(null)
   const [formData, setFormData] = useState({})
   const [formFields, setFormFields] = useState([])
@@ -35,11 +36,15 @@ function WorkflowDemo() {
     loadProcesses()
   }, [])
 
+  useEffect(() => {
+    loadSelectedProcess()
+  }, [selectedProcessId])
+
   useEffect(() => {
     if (currentInstance) {
       parseFormFields()
     }
-  }, [currentInstance, selectedProcessId, processes])
+  }, [currentInstance, selectedProcess])
 
   useEffect(() => {
     if (currentInstance) {
@@ -56,13 +61,26 @@ function WorkflowDemo() {
     }
   }
 
+  // 列表接口不返回 XML，选中流程后单独获取详情
+  const loadSelectedProcess = async () => {
+    setSelectedProcess(null)
+    if (!selectedProcessId) {
+      return
+    }
+    try {
+      setSelectedProcess(await processApi.getById(selectedProcessId))
+    } catch (error) {
+      message.error('加载流程定义失败: ' + error.message)
+    }
+  }
+
   const parseFormFields = () => {
     if (!currentInstance || !selectedProcessId) {
       setFormFields([])
       return
     }
 
-    const process = processes.find(p => p.id === selectedProcessId)
+    const process = selectedProcess
     if (!process || !process.xml_definition) {
       setFormFields([])
       return
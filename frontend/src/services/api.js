@@ -32,8 +32,8 @@ api.interceptors.response.use(
 
 // 流程定义 API
 export const processApi = {
-  // 获取所有流程定义
-  getAll: () => api.get('/bpmn_processes'),
+  // 分页获取流程定义，params 支持 limit / cursor / name 等
+  getAll: (params) => api.get('/bpmn_processes', { params }),
   
   // 获取单个流程定义
   getById: (id) => api.get(`/bpmn_processes/${id}`),
@@ -50,8 +50,8 @@ export const processApi = {
 
 // 流程实例 API
 export const instanceApi = {
-  // 获取所有流程实例
-  getAll: () => api.get('/bpmn_process_instances'),
+  // 分页获取流程实例，params 支持 limit / cursor / process_id / completed 等
+  getAll: (params) => api.get('/bpmn_process_instances', { params }),
   
   // 获取单个流程实例
   getById: (id) => api.get(`/bpmn_process_instances/${id}`)
@@ -0,0 +1,228 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import settings
+
+# 引擎阶段多在毫秒级，比 Prometheus 默认的桶多几个更小的
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(8))
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """A metric family with a fixed set of label names"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Sequence) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {labels}')
+        return tuple(str(label) for label in labels)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += [line for key, value in items for line in self._samples(key, value)]
+        return lines
+
+    def _samples(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        if not settings.metrics_enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, *labels) -> None:
+        """Publish a total that is counted elsewhere, e.g. the hits of a cache"""
+
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        if not settings.metrics_enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # 每个桶只记自己的次数，渲染时再累加，记录时是 O(1)
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+        # 抓取时才执行的回调，用于发布在别处统计的数值，平时没有开销
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def on_collect(self, collector: Callable[[], None]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+
+def get_metrics_registry() -> Registry:
+    return registry
+
+
+ENGINE_PHASE_SECONDS = registry.register(Histogram(
+    'ducky_engine_phase_seconds', 'Time spent in each phase of creating or advancing an instance',
+    ('phase', 'process_id')))
+INSTANCE_STATE_BYTES = registry.register(Histogram(
+    'ducky_instance_state_bytes', 'Size of the serialized workflow state written for an instance',
+    ('process_id',), buckets=SIZE_BUCKETS))
+INSTANCE_STORED_STATE_BYTES = registry.register(Histogram(
+    'ducky_instance_stored_state_bytes', 'Size of the encoded (compressed) state stored for an instance',
+    ('process_id',), buckets=SIZE_BUCKETS))
+INSTANCES_CREATED = registry.register(Counter(
+    'ducky_instances_created_total', 'Process instances created', ('process_id',)))
+INSTANCES_ADVANCED = registry.register(Counter(
+    'ducky_instances_advanced_total', 'Engine steps written for process instances', ('process_id',)))
+INSTANCES_COMPLETED = registry.register(Counter(
+    'ducky_instances_completed_total', 'Process instances that reached their end', ('process_id',)))
+BUDGET_EXCEEDED = registry.register(Counter(
+    'ducky_engine_budget_exceeded_total', 'Engine phases interrupted by their execution budget', ('process_id',)))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    'ducky_db_query_seconds', 'Time spent in repository operations, including the ORM flush',
+    ('repo', 'operation')))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    'ducky_http_request_seconds', 'HTTP request latency by route template', ('method', 'route', 'status')))
+CACHE_HITS = registry.register(Counter('ducky_cache_hits_total', 'Cache hits', ('cache',)))
+CACHE_MISSES = registry.register(Counter('ducky_cache_misses_total', 'Cache misses', ('cache',)))
+CACHE_ENTRIES = registry.register(Gauge('ducky_cache_entries', 'Entries currently held by a cache', ('cache',)))
+
+
+_local = threading.local()
+
+
+class PhaseTimings:
+    """Exclusive time per phase of one engine run in the current thread
+
+    Phases nest: time spent in an inner phase (e.g. ``serialize`` inside
+    ``engine``) is only counted for the inner one. The totals are plain floats,
+    so they can travel back from a worker process with the engine result.
+    """
+
+    def __init__(self) -> None:
+        self.totals: Dict[str, float] = {}
+        # 正在计时的阶段：[名称, 开始时间, 内层阶段用掉的时间]
+        self._stack: List[list] = []
+        self._outer: Optional[PhaseTimings] = None
+
+    def __enter__(self) -> 'PhaseTimings':
+        self._outer = getattr(_local, 'timings', None)
+        _local.timings = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _local.timings = self._outer
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        frame = [name, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a phase of the engine run in progress in this thread, if any"""
+
+    timings: Optional[PhaseTimings] = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+    with timings.phase(name):
+        yield
+
+
+def observe_phases(process_id: int, timings: Optional[Dict[str, float]]) -> None:
+    for name, seconds in (timings or {}).items():
+        ENGINE_PHASE_SECONDS.observe(seconds, name, process_id)
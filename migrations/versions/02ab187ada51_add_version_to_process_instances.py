@@ -0,0 +1,26 @@
+"""add version to process instances
+
+Revision ID: 02ab187ada51
+Revises: 2c466686088c
+Create Date: 2026-10-18 03:56:01.602479
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '02ab187ada51'
+down_revision = '2c466686088c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.drop_column('version')
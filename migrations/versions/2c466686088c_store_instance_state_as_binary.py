@@ -0,0 +1,31 @@
+"""store instance state as binary
+
+Revision ID: 2c466686088c
+Revises: 92159a681dab
+Create Date: 2026-10-18 03:54:16.278324
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c466686088c'
+down_revision = '92159a681dab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.alter_column('state', type_=sa.LargeBinary(), existing_nullable=False)
+    # 旧数据按原样转成未压缩的字节，由 decode_state 识别；
+    # 之后可用 scripts/encode_instance_states.py 分批压缩
+    op.execute("UPDATE bpmn_process_instance SET state = CAST(state AS BLOB) WHERE typeof(state) = 'text'")
+
+
+def downgrade():
+    # 降级前需先用 scripts/encode_instance_states.py --plain 去掉格式头
+    op.execute("UPDATE bpmn_process_instance SET state = CAST(state AS TEXT) WHERE typeof(state) = 'blob'")
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.alter_column('state', type_=sa.Text(), existing_nullable=False)
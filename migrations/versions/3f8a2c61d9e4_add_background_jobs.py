@@ -0,0 +1,43 @@
+"""add background jobs
+
+Revision ID: 3f8a2c61d9e4
+Revises: e5c93a7d0b18
+Create Date: 2026-10-18 08:03:41.926115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a2c61d9e4'
+down_revision = 'e5c93a7d0b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bpmn_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('bpmn_process_id', sa.Integer(), nullable=False),
+        sa.Column('bpmn_process_instance_id', sa.Integer(), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['bpmn_process_id'], ['bpmn_process.id']),
+        sa.ForeignKeyConstraint(['bpmn_process_instance_id'], ['bpmn_process_instance.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bpmn_job_status', 'bpmn_job', ['status', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_bpmn_job_status', table_name='bpmn_job')
+    op.drop_table('bpmn_job')
@@ -0,0 +1,31 @@
+"""index instance listings
+
+Revision ID: 7d3e5b1c9a40
+Revises: 02ab187ada51
+Create Date: 2026-10-18 05:12:44.318902
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e5b1c9a40'
+down_revision = '02ab187ada51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        # 旧行由 CURRENT_TIMESTAMP 写入，没有微秒部分，统一成 SQLAlchemy 绑定参数的格式
+        for table in ('bpmn_process', 'bpmn_process_instance'):
+            for column in ('created_at', 'updated_at'):
+                op.execute(f"UPDATE {table} SET {column} = strftime('%Y-%m-%d %H:%M:%f', {column}) || '000' "
+                           f"WHERE length({column}) = 19")
+    op.create_index('ix_bpmn_process_instance_process_id', 'bpmn_process_instance', ['bpmn_process_id', 'id'])
+    op.create_index('ix_bpmn_process_instance_created_at', 'bpmn_process_instance', ['created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_bpmn_process_instance_created_at', table_name='bpmn_process_instance')
+    op.drop_index('ix_bpmn_process_instance_process_id', table_name='bpmn_process_instance')
@@ -0,0 +1,39 @@
+"""store process specs once per definition
+
+Revision ID: 92159a681dab
+Revises: 
+Create Date: 2026-10-18 03:53:21.204669
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '92159a681dab'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bpmn_process_spec',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bpmn_process_id', sa.Integer(), nullable=False),
+        sa.Column('spec_hash', sa.String(length=64), nullable=False),
+        sa.Column('xml_definition', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['bpmn_process_id'], ['bpmn_process.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('bpmn_process_id', 'spec_hash'),
+    )
+    # 已有实例保持内嵌 spec 的旧格式，spec_hash 为空
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.add_column(sa.Column('spec_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.drop_column('spec_hash')
+    op.drop_table('bpmn_process_spec')
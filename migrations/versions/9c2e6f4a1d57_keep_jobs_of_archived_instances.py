@@ -0,0 +1,60 @@
+"""keep jobs of archived instances
+
+Revision ID: 9c2e6f4a1d57
+Revises: f4b7e2a9c318
+Create Date: 2026-10-18 21:14:06.530417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e6f4a1d57'
+down_revision = 'f4b7e2a9c318'
+branch_labels = None
+depends_on = None
+
+
+def _job_table(instance_fk: bool) -> sa.Table:
+    # SQLite 的外键没有名字，无法单独删除，按完整的表定义重建
+    return sa.Table(
+        'bpmn_job', sa.MetaData(),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('bpmn_process_id', sa.Integer(), nullable=False),
+        sa.Column('bpmn_process_instance_id', sa.Integer(), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['bpmn_process_id'], ['bpmn_process.id']),
+        *([sa.ForeignKeyConstraint(['bpmn_process_instance_id'], ['bpmn_process_instance.id'])]
+          if instance_fk else []),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_bpmn_job_status', 'status', 'id'),
+    )
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('bpmn_job', recreate='always', copy_from=_job_table(False)):
+            pass
+    else:
+        op.drop_constraint('bpmn_job_bpmn_process_instance_id_fkey', 'bpmn_job', type_='foreignkey')
+
+
+def downgrade():
+    # 之前的版本在归档时删除已结束的任务记录，恢复外键前同样删除指向归档实例的任务
+    op.execute("DELETE FROM bpmn_job WHERE bpmn_process_instance_id IS NOT NULL AND bpmn_process_instance_id "
+               "NOT IN (SELECT id FROM bpmn_process_instance)")
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('bpmn_job', recreate='always', copy_from=_job_table(True)):
+            pass
+    else:
+        op.create_foreign_key('bpmn_job_bpmn_process_instance_id_fkey', 'bpmn_job', 'bpmn_process_instance',
+                              ['bpmn_process_instance_id'], ['id'])
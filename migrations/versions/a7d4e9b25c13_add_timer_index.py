@@ -0,0 +1,37 @@
+"""add timer index
+
+Revision ID: a7d4e9b25c13
+Revises: 3f8a2c61d9e4
+Create Date: 2026-10-18 09:12:07.415863
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e9b25c13'
+down_revision = '3f8a2c61d9e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bpmn_timer',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bpmn_process_instance_id', sa.Integer(), nullable=False),
+        sa.Column('task_spec_id', sa.String(length=255), nullable=False),
+        sa.Column('due_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['bpmn_process_instance_id'], ['bpmn_process_instance.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('bpmn_process_instance_id', 'task_spec_id')
+    )
+    op.create_index('ix_bpmn_timer_due_at', 'bpmn_timer', ['due_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_bpmn_timer_due_at', table_name='bpmn_timer')
+    op.drop_table('bpmn_timer')
@@ -0,0 +1,43 @@
+"""add instance task projection
+
+Revision ID: b41f0e6d2c87
+Revises: 7d3e5b1c9a40
+Create Date: 2026-10-18 06:02:17.540231
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41f0e6d2c87'
+down_revision = '7d3e5b1c9a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bpmn_process_instance_task',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bpmn_process_instance_id', sa.Integer(), nullable=False),
+        sa.Column('task_spec_id', sa.String(length=255), nullable=False),
+        sa.Column('task_id', sa.String(length=36), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('manual', sa.Boolean(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('state_changed_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['bpmn_process_instance_id'], ['bpmn_process_instance.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('bpmn_process_instance_id', 'task_spec_id')
+    )
+    op.create_index('ix_bpmn_process_instance_task_spec_state', 'bpmn_process_instance_task', ['task_spec_id', 'state'])
+
+
+def downgrade():
+    op.drop_index('ix_bpmn_process_instance_task_spec_state', table_name='bpmn_process_instance_task')
+    op.drop_table('bpmn_process_instance_task')
@@ -0,0 +1,26 @@
+"""add instance error
+
+Revision ID: c2b8f61e4d97
+Revises: a7d4e9b25c13
+Create Date: 2026-10-18 10:41:26.532904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2b8f61e4d97'
+down_revision = 'a7d4e9b25c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.add_column(sa.Column('error', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.drop_column('error')
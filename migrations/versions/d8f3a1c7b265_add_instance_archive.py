@@ -0,0 +1,45 @@
+"""add instance archive
+
+Revision ID: d8f3a1c7b265
+Revises: c2b8f61e4d97
+Create Date: 2026-10-18 14:12:08.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f3a1c7b265'
+down_revision = 'c2b8f61e4d97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bpmn_process_instance_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('bpmn_process_id', sa.Integer(), nullable=False),
+        sa.Column('state', sa.LargeBinary(), nullable=False),
+        sa.Column('spec_hash', sa.String(length=64), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('current_task', sa.String(length=255), nullable=False),
+        sa.Column('current_task_spec_id', sa.String(length=255), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['bpmn_process_id'], ['bpmn_process.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bpmn_process_instance_archive_process_id', 'bpmn_process_instance_archive',
+                    ['bpmn_process_id', 'id'])
+    op.create_index('ix_bpmn_process_instance_completed', 'bpmn_process_instance', ['updated_at', 'id'],
+                    sqlite_where=sa.text("current_task = 'END'"), postgresql_where=sa.text("current_task = 'END'"))
+
+
+def downgrade():
+    op.drop_index('ix_bpmn_process_instance_completed', table_name='bpmn_process_instance')
+    op.drop_index('ix_bpmn_process_instance_archive_process_id', table_name='bpmn_process_instance_archive')
+    op.drop_table('bpmn_process_instance_archive')
@@ -0,0 +1,37 @@
+"""add instance inbox
+
+Revision ID: e5c93a7d0b18
+Revises: b41f0e6d2c87
+Create Date: 2026-10-18 07:14:52.308417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c93a7d0b18'
+down_revision = 'b41f0e6d2c87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.add_column(sa.Column('current_task_spec_id', sa.String(length=255), nullable=True))
+    op.create_index('ix_bpmn_process_instance_inbox', 'bpmn_process_instance',
+                    ['bpmn_process_id', 'current_task_spec_id', 'updated_at', 'id'])
+    # 已有投影的实例取第一个就绪的人工任务；没有投影的由 scripts/backfill_instance_tasks.py 补上
+    op.execute(
+        "UPDATE bpmn_process_instance SET current_task_spec_id = ("
+        " SELECT t.task_spec_id FROM bpmn_process_instance_task t"
+        " WHERE t.bpmn_process_instance_id = bpmn_process_instance.id AND t.state = 'READY' AND t.manual"
+        " ORDER BY t.position LIMIT 1"
+        ") WHERE current_task != 'END'"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_bpmn_process_instance_inbox', table_name='bpmn_process_instance')
+    with op.batch_alter_table('bpmn_process_instance') as batch_op:
+        batch_op.drop_column('current_task_spec_id')
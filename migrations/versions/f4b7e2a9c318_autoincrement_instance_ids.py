@@ -0,0 +1,49 @@
+"""autoincrement instance ids
+
+Revision ID: f4b7e2a9c318
+Revises: d8f3a1c7b265
+Create Date: 2026-10-18 16:05:42.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b7e2a9c318'
+down_revision = 'd8f3a1c7b265'
+branch_labels = None
+depends_on = None
+
+COMPLETED_WHERE = sa.text("current_task = 'END'")
+
+
+def _recreate_instance_table(autoincrement: bool) -> None:
+    # 重建表时部分索引的条件不会被反射出来，先删除，重建后再创建
+    op.drop_index('ix_bpmn_process_instance_completed', table_name='bpmn_process_instance')
+    with op.batch_alter_table('bpmn_process_instance', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    op.create_index('ix_bpmn_process_instance_completed', 'bpmn_process_instance', ['updated_at', 'id'],
+                    sqlite_where=COMPLETED_WHERE, postgresql_where=COMPLETED_WHERE)
+
+
+def upgrade():
+    op.create_index('ix_bpmn_process_instance_archive_created_at', 'bpmn_process_instance_archive',
+                    ['created_at', 'id'])
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _recreate_instance_table(True)
+    # 新的 id 要大于所有已有的 id，包括已经归档的实例
+    op.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'bpmn_process_instance', 0 "
+               "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'bpmn_process_instance')")
+    op.execute("UPDATE sqlite_sequence SET seq = max(seq, "
+               "(SELECT coalesce(max(id), 0) FROM bpmn_process_instance), "
+               "(SELECT coalesce(max(id), 0) FROM bpmn_process_instance_archive)) "
+               "WHERE name = 'bpmn_process_instance'")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        _recreate_instance_table(False)
+    op.drop_index('ix_bpmn_process_instance_archive_created_at', table_name='bpmn_process_instance_archive')
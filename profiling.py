@@ -0,0 +1,236 @@
+import cProfile
+import hmac
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from loguru import logger
+from starlette.responses import JSONResponse
+
+from config import settings
+
+PROFILE_MODES = ('cprofile', 'sample')
+PROFILE_HEADER = 'x-profile'
+PROFILE_TOKEN_HEADER = 'x-profile-token'
+PROFILE_QUERY = '_profile'
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    # 文件名保留最后两级目录，足以区分各包中的 __init__.py
+    path = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    return f'{code.co_name} ({path}:{code.co_firstlineno})'
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Sampler:
+    """Samples the stacks of a set of threads at a fixed wall-clock interval"""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.threads = set()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profile-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.counts[_collapse(frame)] += 1
+
+
+class _LoadedStats:
+    """Raw ``pstats`` data in the shape ``pstats.Stats.add`` accepts"""
+
+    def __init__(self, stats: dict) -> None:
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+def profiled_call(mode: str, interval: float, func: Callable, *args) -> Tuple[Any, Dict]:
+    """Run ``func`` in the current thread under a profiler, returns its result and the raw profile
+
+    Used for engine phases running in a worker thread or process; the raw
+    profile is plain data, so it can be sent back and merged into the request's.
+    """
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args)
+        return result, pstats.Stats(profiler).stats
+    sampler = _Sampler(interval)
+    sampler.threads.add(threading.get_ident())
+    sampler.start()
+    try:
+        result = func(*args)
+    finally:
+        sampler.stop()
+    return result, dict(sampler.counts)
+
+
+class RequestProfile:
+    """Profile of a single request
+
+    ``cprofile`` traces every call of the event loop thread while the request
+    runs, which includes other requests served concurrently; ``sample`` records
+    the wall-clock stacks of the loop thread as collapsed stacks. Engine phases
+    run by the executor in a worker thread or process are profiled there and
+    merged in.
+    """
+
+    def __init__(self, mode: str, interval: float = settings.profile_sample_interval) -> None:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.interval = interval
+        self.stats = pstats.Stats()
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_Sampler] = None
+
+    def start(self) -> None:
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = _Sampler(self.interval)
+            self._sampler.threads.add(threading.get_ident())
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.stats.add(self._profiler)
+            self._profiler = None
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.merge(self._sampler.counts)
+            self._sampler = None
+
+    def merge(self, data: Dict) -> None:
+        """Add the raw profile returned by ``profiled_call``"""
+
+        with self._lock:
+            if self.mode == 'cprofile':
+                self.stats.add(_LoadedStats(data))
+            else:
+                self.counts.update(data)
+
+    def dump(self, path: str) -> None:
+        """Write a pstats file (``cprofile``) or collapsed stacks (``sample``)"""
+
+        if self.mode == 'cprofile':
+            self.stats.dump_stats(path)
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+# 同一进程同时只分析一个请求：两个 cProfile 无法同时挂在事件循环线程上
+_active = threading.Lock()
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """Profile of the request being served in this context, if it was asked for"""
+
+    return _current.get()
+
+
+def _token_allowed(token: str) -> bool:
+    return any(hmac.compare_digest(token.encode(), allowed.encode()) for allowed in settings.profile_tokens)
+
+
+def _artifact_name(scope, mode: str) -> str:
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', scope['path']).strip('-') or 'root'
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    return f"{stamp}-{scope['method'].lower()}-{slug[:80]}.{'prof' if mode == 'cprofile' else 'collapsed'}"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling a request that asks for it with an admin token
+
+    The mode comes from the ``X-Profile`` header or the ``_profile`` query
+    parameter, the token from ``X-Profile-Token``. The artifact is written to
+    ``settings.profile_dir`` and its file name returned in the ``X-Profile``
+    response header. Without configured tokens the middleware only passes
+    requests through.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not settings.profile_tokens:
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']
+                   if key in (PROFILE_HEADER.encode(), PROFILE_TOKEN_HEADER.encode())}
+        mode = headers.get(PROFILE_HEADER)
+        if mode is None and PROFILE_QUERY.encode() in scope.get('query_string', b''):
+            mode = parse_qs(scope['query_string'].decode('latin-1')).get(PROFILE_QUERY, [None])[0]
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not _token_allowed(headers.get(PROFILE_TOKEN_HEADER, '')):
+            await JSONResponse({'detail': 'Profiling requires a valid X-Profile-Token'}, 403)(scope, receive, send)
+            return
+        if mode not in PROFILE_MODES:
+            await JSONResponse({'detail': f'Unknown profile mode, expected one of {PROFILE_MODES}'}, 400)(
+                scope, receive, send)
+            return
+        if not _active.acquire(blocking=False):
+            await JSONResponse({'detail': 'Another request is being profiled'}, 409)(scope, receive, send)
+            return
+
+        name = _artifact_name(scope, mode)
+
+        async def send_wrapper(message) -> None:
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [(PROFILE_HEADER.encode(), name.encode())]
+            await send(message)
+
+        profile = RequestProfile(mode)
+        token = _current.set(profile)
+        started = time.perf_counter()
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop()
+            _current.reset(token)
+            _active.release()
+            os.makedirs(settings.profile_dir, exist_ok=True)
+            profile.dump(os.path.join(settings.profile_dir, name))
+            logger.info(f"Profiled {scope['method']} {scope['path']} in {time.perf_counter() - started:.3f}s: {name}")
+
@@ -1,7 +1,13 @@
 from routers.bpmn_process_router import router as bpmn_process_router
 from routers.bpmn_process_instance_router import router as bpmn_process_instance_router
+from routers.job_router import router as job_router
+from routers.metrics_router import router as metrics_router
+from routers.transfer_router import router as transfer_router
 
 __all__ = [
     'bpmn_process_router',
-    'bpmn_process_instance_router'
+    'bpmn_process_instance_router',
+    'job_router',
+    'metrics_router',
+    'transfer_router'
 ]
@@ -1,20 +1,29 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Body
+from fastapi import APIRouter, Depends, Body, HTTPException, Response
 from loguru import logger
 
-from db.models import BpmnProcess
+from bpmn import BpmnRunner, SpecCache, get_bpmn_runner, get_spec_cache
+from config import settings
+from db.models import BpmnProcess, BpmnProcessInstance
 from db.repos import RepoManager, get_repo_manager
-from schemas import BpmnProcessSchema
+from routers.pagination import AgePageParams, PageParams, paginate
+from schemas import (BatchItemResultSchema, BatchResultSchema, BpmnProcessInstanceSummarySchema, BpmnProcessSchema,
+                     BpmnProcessSummarySchema)
 
 router = APIRouter(prefix='/bpmn_processes', tags=['BpmnProcess'])
 
 
-@router.get('', response_model=List[BpmnProcessSchema])
-async def get_all(repo_manager: RepoManager = Depends(get_repo_manager)):
-    logger.info("Fetching all processes...")
+@router.get('', response_model=List[BpmnProcessSummarySchema])
+async def get_all(
+        response: Response,
+        name: Optional[str] = None,
+        page: PageParams = Depends(),
+        repo_manager: RepoManager = Depends(get_repo_manager)
+):
+    logger.info("Fetching processes...")
     repo = repo_manager.get_repo(BpmnProcess)
-    return await repo.all()
+    return await paginate(repo, page, response, repo.filters(name=name))
 
 
 @router.get('/{id}', response_model=BpmnProcessSchema)
@@ -31,14 +40,65 @@ async def create(bpmn_process_schema: BpmnProcessSchema = Body(...), repo_manage
 
 
 @router.put('/{id}', response_model=BpmnProcessSchema)
-async def update(id: int, bpmn_process_schema: BpmnProcessSchema = Body(...), repo_manager: RepoManager = Depends(get_repo_manager)):
+async def update(
+        id: int,
+        bpmn_process_schema: BpmnProcessSchema = Body(...),
+        repo_manager: RepoManager = Depends(get_repo_manager),
+        spec_cache: SpecCache = Depends(get_spec_cache)
+):
     logger.info('Updating process...')
     repo = repo_manager.get_repo(BpmnProcess)
-    return await repo.update(id, dict(bpmn_process_schema))
+    process = await repo.update(id, dict(bpmn_process_schema))
+    spec_cache.invalidate(id)
+    return process
 
 
 @router.delete('/{id}')
-async def delete(id:int, repo_manager: RepoManager = Depends(get_repo_manager)):
+async def delete(id:int, repo_manager: RepoManager = Depends(get_repo_manager), spec_cache: SpecCache = Depends(get_spec_cache)):
     logger.info('Deleting process...')
     repo = repo_manager.get_repo(BpmnProcess)
-    return await repo.delete(id)
+    deleted = await repo.delete(id)
+    spec_cache.invalidate(id)
+    return deleted
+
+
+@router.get('/{id}/inbox/{task_spec_id}', response_model=List[BpmnProcessInstanceSummarySchema])
+async def get_inbox(
+        id: int,
+        task_spec_id: str,
+        response: Response,
+        page: AgePageParams = Depends(),
+        repo_manager: RepoManager = Depends(get_repo_manager)
+):
+    """Instances of a process waiting at the given task, the longest waiting first"""
+    repo = repo_manager.get_repo(BpmnProcessInstance)
+    # 走 (bpmn_process_id, current_task_spec_id, updated_at, id) 索引
+    where = repo.filters(process_id=id, current_task_spec_id=task_spec_id)
+    return await paginate(repo, page, response, where)
+
+
+@router.post('/{id}/instances:batch', response_model=BatchResultSchema)
+async def create_instances(
+        id: int,
+        payloads: List[Optional[dict]] = Body(...),
+        parallel: bool = False,
+        bpmn_runner: BpmnRunner = Depends(get_bpmn_runner),
+        repo_manager: RepoManager = Depends(get_repo_manager)
+):
+    """Start one instance per initial data payload"""
+    if len(payloads) > settings.batch_max_items:
+        raise HTTPException(413, f'At most {settings.batch_max_items} instances can be created at once')
+    process = await repo_manager.get_repo(BpmnProcess).get(id)
+    if process is None:
+        raise HTTPException(404, f'Process with id {id} not found')
+    logger.info(f'Creating {len(payloads)} instances of process {id}...')
+
+    items = []
+    for index, outcome in enumerate(await bpmn_runner.create_process_instances(process, payloads, parallel)):
+        if isinstance(outcome, Exception):
+            items.append(BatchItemResultSchema(index=index, error=str(outcome)))
+        else:
+            items.append(BatchItemResultSchema(index=index, id=outcome.id, current_task=outcome.current_task,
+                                               error=outcome.error))
+    failed = sum(item.error is not None for item in items)
+    return BatchResultSchema(succeeded=len(items) - failed, failed=failed, items=items)
@@ -0,0 +1,31 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from bpmn.job_worker import JOB_STATUSES
+from db.models import BpmnJob
+from db.repos import RepoManager, get_repo_manager
+from routers.pagination import PageParams, paginate
+from schemas import JobSchema
+
+router = APIRouter(prefix='/jobs', tags=['Job'])
+
+
+@router.get('', response_model=List[JobSchema])
+async def get_all(
+        response: Response,
+        status: Optional[str] = Query(None, regex=f"^({'|'.join(JOB_STATUSES)})$"),
+        instance_id: Optional[int] = None,
+        page: PageParams = Depends(),
+        repo_manager: RepoManager = Depends(get_repo_manager)
+):
+    repo = repo_manager.get_repo(BpmnJob)
+    return await paginate(repo, page, response, repo.filters(status=status, instance_id=instance_id))
+
+
+@router.get('/{id}', response_model=JobSchema)
+async def get_one(id: int, repo_manager: RepoManager = Depends(get_repo_manager)):
+    job = await repo_manager.get_repo(BpmnJob).get(id)
+    if job is None:
+        raise HTTPException(404, f'Job with id {id} not found')
+    return job
@@ -0,0 +1,85 @@
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from bpmn.script_engine import get_script_cache
+from bpmn.spec_cache import get_spec_cache
+from bpmn.topology import get_topology_cache
+from bpmn.workflow_cache import get_workflow_cache
+from config import settings
+from metrics import CACHE_ENTRIES, CACHE_HITS, CACHE_MISSES, HTTP_REQUEST_SECONDS, get_metrics_registry
+
+router = APIRouter(tags=['Metrics'])
+
+# Prometheus 文本格式 0.0.4
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+CACHES: Dict[str, Callable] = {
+    'spec': get_spec_cache,
+    'script': get_script_cache,
+    'workflow': get_workflow_cache,
+    'topology': get_topology_cache,
+}
+
+
+def collect_cache_stats() -> None:
+    for name, get_cache in CACHES.items():
+        stats = get_cache().stats()
+        CACHE_HITS.set(stats['hits'], name)
+        CACHE_MISSES.set(stats['misses'], name)
+        CACHE_ENTRIES.set(stats['size'], name)
+
+
+get_metrics_registry().on_collect(collect_cache_stats)
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """Metrics of this process in the Prometheus text format"""
+    if not settings.metrics_enabled:
+        raise HTTPException(404, 'Metrics are disabled')
+    return PlainTextResponse(get_metrics_registry().render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request, labeled by the route template rather than the raw path"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        # 路由匹配后 scope 中有 endpoint，由它找到路由模板，例如 /bpmn_process_instances/{id}
+        self._routes: Dict[Callable, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope['app'].routes:
+                if getattr(candidate, 'endpoint', None) is endpoint:
+                    route = self._routes[endpoint] = candidate.path
+                    break
+            else:
+                route = getattr(endpoint, '__name__', 'unknown')
+        return route
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+        status: Optional[int] = None
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope['method'], self._route(scope),
+                                         status or 500)
@@ -0,0 +1,47 @@
+from typing import List, Sequence
+
+from fastapi import HTTPException, Query, Response
+
+from config import settings
+from db.repos import PAGE_ORDERS, InvalidCursor, Repo
+
+
+class PageParams:
+    """Query parameters shared by the paginated list endpoints"""
+
+    default_order = 'id'
+
+    def __init__(
+            self,
+            limit: int = Query(settings.page_size_default, ge=1, le=settings.page_size_max),
+            cursor: str = Query(None, description='X-Next-Cursor of the previous page'),
+            order_by: str = Query(None, regex=f"^({'|'.join(PAGE_ORDERS)})$"),
+            desc: bool = False,
+            with_total: bool = Query(False, description='Return the number of matching rows in X-Total-Count')
+    ) -> None:
+        self.limit = limit
+        self.cursor = cursor
+        self.order_by = order_by or self.default_order
+        self.desc = desc
+        self.with_total = with_total
+
+
+class AgePageParams(PageParams):
+    """Page parameters of queues, oldest first by default"""
+
+    default_order = 'updated_at'
+
+
+async def paginate(repo: Repo, page: PageParams, response: Response, where: Sequence = ()) -> List:
+    """Fetch one page of summaries and report the next cursor and the total count in response headers"""
+
+    try:
+        rows, next_cursor = await repo.page(where=where, order_by=page.order_by, after=page.cursor,
+                                            limit=page.limit, descending=page.desc, summary=True)
+    except InvalidCursor as e:
+        raise HTTPException(400, str(e))
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if page.with_total:
+        response.headers['X-Total-Count'] = str(await repo.count(where))
+    return rows
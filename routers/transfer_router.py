@@ -0,0 +1,31 @@
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from db.transfer import INSTANCE_TABLES, PROCESS_TABLES, TransferError, export_ndjson, import_ndjson, iter_lines
+
+router = APIRouter(tags=['Transfer'])
+
+NDJSON = 'application/x-ndjson'
+
+
+@router.get('/export', response_class=StreamingResponse, responses={200: {'content': {NDJSON: {}}}})
+async def export(process_id: Optional[int] = None, instances: bool = True):
+    """Stream processes, their stored versions and (unless ``instances=false``) instances as NDJSON"""
+    logger.info(f'Exporting {"process " + str(process_id) if process_id is not None else "all processes"}...')
+    tables = PROCESS_TABLES + INSTANCE_TABLES if instances else PROCESS_TABLES
+    # 导出在独立的会话中进行，响应发送期间一直持有游标
+    return StreamingResponse(export_ndjson(tables, process_id), media_type=NDJSON,
+                             headers={'Content-Disposition': 'attachment; filename="ducky-export.ndjson"'})
+
+
+@router.post('/import', response_model=Dict[str, int])
+async def import_(request: Request):
+    """Insert the records of an NDJSON export, read from the request body as it arrives"""
+    logger.info('Importing...')
+    try:
+        return await import_ndjson(iter_lines(request.stream()))
+    except TransferError as e:
+        raise HTTPException(400, str(e))
@@ -1,4 +1,5 @@
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -11,10 +12,64 @@ class BpmnProcessSchema(BaseModel):
         orm_mode = True
 
 
+class BpmnProcessSummarySchema(BaseModel):
+    """List view of a process, without the xml definition"""
+    id: int
+    name: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
 class BpmnProcessInstanceSchema(BaseModel):
     id: int
     bpmn_process_id: int
     current_task: str
+    error: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class BpmnProcessInstanceSummarySchema(BpmnProcessInstanceSchema):
+    """List view of an instance"""
+    current_task_spec_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class BatchRunItemSchema(BaseModel):
+    instance_id: int
+    data: Optional[dict] = None
+
+
+class BatchItemResultSchema(BaseModel):
+    index: int
+    id: Optional[int] = None
+    current_task: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchResultSchema(BaseModel):
+    succeeded: int
+    failed: int
+    items: List[BatchItemResultSchema]
+
+
+class JobSchema(BaseModel):
+    """Background create or run request"""
+    id: int
+    kind: str
+    status: str
+    bpmn_process_id: int
+    bpmn_process_instance_id: Optional[int] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+回填流程实例的任务投影
+分批反序列化还没有 bpmn_process_instance_task 记录的实例（--rebuild 时处理全部实例），
+把每个 task spec 的状态写入投影表，同时补上实例的 current_task_spec_id
+"""
+import argparse
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import exists, select, update
+
+from bpmn import BpmnRunner
+from bpmn.instance_tasks import project_tasks
+from db import AsyncSessionLocal, run_script
+from db.models import BpmnProcessInstance, BpmnProcessInstanceTask
+from db.repos import RepoManager
+
+
+async def backfill_instance_tasks(batch_size: int, rebuild: bool):
+    """按 id 分批为实例生成任务投影"""
+    rows = failed = tasks = 0
+    elapsed = 0.0
+    last_id = 0
+
+    while True:
+        async with AsyncSessionLocal.begin() as session:
+            repo_manager = RepoManager(session=session)
+            bpmn_runner = BpmnRunner(repo_manager)
+            task_repo = repo_manager.get_repo(BpmnProcessInstanceTask)
+            stmt = (select(BpmnProcessInstance)
+                    .where(BpmnProcessInstance.id > last_id)
+                    .order_by(BpmnProcessInstance.id)
+                    .limit(batch_size))
+            if not rebuild:
+                stmt = stmt.where(~exists().where(
+                    BpmnProcessInstanceTask.bpmn_process_instance_id == BpmnProcessInstance.id))
+            batch = (await session.execute(stmt)).scalars().all()
+            if not batch:
+                break
+
+            for instance in batch:
+                start = time.perf_counter()
+                try:
+                    projected = await bpmn_runner.inspect_workflow(instance, project_tasks)
+                except Exception as e:
+                    print(f"实例 {instance.id} 反序列化失败: {e}")
+                    failed += 1
+                    continue
+                await task_repo.replace(instance.id, [task._asdict() for task in projected])
+                ready = [task.task_spec_id for task in projected if task.state == 'READY' and task.manual]
+                # 显式写回 updated_at，避免回填重置待办的等待时间
+                await session.execute(
+                    update(BpmnProcessInstance)
+                    .where(BpmnProcessInstance.id == instance.id)
+                    .values(current_task_spec_id=ready[0] if ready and instance.current_task != 'END' else None,
+                            updated_at=instance.updated_at))
+                elapsed += time.perf_counter() - start
+                rows += 1
+                tasks += len(projected)
+            last_id = batch[-1].id
+        print(f"已处理 {rows} 个实例（id <= {last_id}）")
+
+    if rows == 0 and failed == 0:
+        print("没有需要处理的实例")
+        return
+    print("\n完成！")
+    print(f"  实例数: {rows}，失败: {failed}")
+    print(f"  平均每个实例的任务数: {tasks / max(rows, 1):.1f}")
+    print(f"  平均耗时: {elapsed / max(rows, 1) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--batch-size', type=int, default=500)
+    arg_parser.add_argument('--rebuild', action='store_true', help='重新生成所有实例的投影，包括已有记录的实例')
+    args = arg_parser.parse_args()
+    run_script(backfill_instance_tasks(args.batch_size, args.rebuild))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+重新编码流程实例状态
+分批读取 bpmn_process_instance.state，用指定的 codec 重新编码后写回，
+并统计每个实例的平均字节数和编解码耗时
+"""
+import argparse
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, update
+
+from config import settings
+from db import AsyncSessionLocal, run_script
+from db.models import BpmnProcessInstance
+from bpmn.state_codec import CODECS, decode_state, encode_state, get_state_codec
+
+
+async def encode_instance_states(codec_name: str, level: int, batch_size: int, plain: bool):
+    """按 id 分批重新编码所有实例状态"""
+    codec = get_state_codec(codec_name)
+    codec.level = level
+    rows = bytes_before = bytes_after = 0
+    decode_time = encode_time = 0.0
+    last_id = 0
+
+    while True:
+        async with AsyncSessionLocal.begin() as session:
+            batch = (await session.execute(
+                select(BpmnProcessInstance.id, BpmnProcessInstance.state)
+                .where(BpmnProcessInstance.id > last_id)
+                .order_by(BpmnProcessInstance.id)
+                .limit(batch_size)
+            )).all()
+            if not batch:
+                break
+
+            for id, blob in batch:
+                start = time.perf_counter()
+                state = decode_state(blob)
+                decode_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                new_blob = state.encode('utf-8') if plain else encode_state(state, codec)
+                encode_time += time.perf_counter() - start
+
+                await session.execute(
+                    update(BpmnProcessInstance).where(BpmnProcessInstance.id == id).values(state=new_blob))
+                rows += 1
+                bytes_before += len(blob)
+                bytes_after += len(new_blob)
+            last_id = batch[-1][0]
+        print(f"已处理 {rows} 个实例（id <= {last_id}）")
+
+    if rows == 0:
+        print("没有需要处理的实例")
+        return
+    print(f"\n完成！codec={'plain' if plain else codec.name} level={level}")
+    print(f"  实例数: {rows}")
+    print(f"  平均字节数: {bytes_before / rows:.0f} -> {bytes_after / rows:.0f} "
+          f"({bytes_after / max(bytes_before, 1):.1%})")
+    print(f"  平均解码耗时: {decode_time / rows * 1000:.3f} ms")
+    print(f"  平均编码耗时: {encode_time / rows * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--codec', choices=sorted(CODECS), default=settings.state_codec)
+    arg_parser.add_argument('--level', type=int, default=settings.state_codec_level)
+    arg_parser.add_argument('--batch-size', type=int, default=500)
+    arg_parser.add_argument('--plain', action='store_true', help='写回不带格式头的未压缩 JSON（用于降级）')
+    args = arg_parser.parse_args()
+    run_script(encode_instance_states(args.codec, args.level, args.batch_size, args.plain))
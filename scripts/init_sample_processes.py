@@ -3,14 +3,13 @@
 初始化示例流程脚本
 将预置的 BPMN 流程添加到数据库中
 """
-import asyncio
 import sys
 import os
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from db import AsyncSessionLocal
+from db import AsyncSessionLocal, run_script
 from db.models import BpmnProcess
 from db.repos import RepoManager
 
@@ -317,5 +316,5 @@ async def init_sample_processes():
 
 
 if __name__ == '__main__':
-    asyncio.run(init_sample_processes())
+    run_script(init_sample_processes())
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+导出 / 导入流程数据
+export 以 NDJSON 格式流式导出流程定义、已存储的定义版本、流程实例及其任务投影和定时器、归档的实例，
+import 把导出的文件分批插入到另一个数据库（保留 id，目标库中不能已有相同 id 的记录），
+两者的内存占用都与行数无关
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from db import run_script
+from db.transfer import INSTANCE_TABLES, PROCESS_TABLES, TransferError, export_ndjson, import_ndjson
+
+
+async def export_data(path: str, process_id: int, instances: bool, chunk_size: int):
+    """写入 path，为 - 时写到标准输出"""
+    tables = PROCESS_TABLES + INSTANCE_TABLES if instances else PROCESS_TABLES
+    out = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8')
+    lines = 0
+    start = time.perf_counter()
+    try:
+        async for chunk in export_ndjson(tables, process_id, chunk_size):
+            out.write(chunk)
+            lines += chunk.count('\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"导出 {lines} 条记录，耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+async def read_lines(path: str):
+    """逐行读取文件，读取放在线程中，不阻塞事件循环上的插入"""
+    source = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    try:
+        while True:
+            lines = await asyncio.to_thread(source.readlines, 1 << 20)
+            if not lines:
+                break
+            for line in lines:
+                yield line
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+
+
+async def import_data(path: str, chunk_size: int):
+    start = time.perf_counter()
+    try:
+        counts = await import_ndjson(read_lines(path), chunk_size)
+    except TransferError as e:
+        print(f"导入失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    for table, count in counts.items():
+        print(f"  {table}: {count}")
+    print(f"导入 {sum(counts.values())} 条记录，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--chunk-size', type=int, default=settings.transfer_chunk_size,
+                            help='每次从游标读取 / 每个事务插入的行数')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='导出为 NDJSON')
+    export_parser.add_argument('output', nargs='?', default='-', help='输出文件，默认标准输出')
+    export_parser.add_argument('--process-id', type=int, help='只导出这个流程及其实例')
+    export_parser.add_argument('--no-instances', action='store_true', help='只导出流程定义')
+    import_parser = commands.add_parser('import', help='导入 NDJSON')
+    import_parser.add_argument('input', nargs='?', default='-', help='输入文件，默认标准输入')
+    args = arg_parser.parse_args()
+
+    if args.command == 'export':
+        run_script(export_data(args.output, args.process_id, not args.no_instances, args.chunk_size))
+    else:
+        run_script(import_data(args.input, args.chunk_size))